@@ -5,10 +5,27 @@
 ## **************************************************************** ##
 
 import os, sys
+import argparse, json
 from math import *
 from array import array
 
 import ROOT as R
+import numpy
+import L1ColumnReader
+import L1ColumnStore
+import L1FriendChain
+import L1Manifest
+import L1Branches
+import L1Skim
+import L1UprootReader
+import L1Accumulators
+import L1Parallel
+import L1Staging
+import L1TreeCache
+import L1VectorViews
+import L1Memo
+import L1EventIndex
+import L1GenMuons
 R.gROOT.SetBatch(False)  ## Don't print histograms to screen while processing
 
 style1 = R.TStyle("style1", "For Histograms")
@@ -20,11 +37,26 @@ R.gROOT.SetStyle("style1")
 PRT_EVT  = 10000	 	## Print every Nth event
 MAX_EVT  = 40000	## Number of events to process
 VERBOSE  = False	## Verbose print-out
+READER   = 'branch'	## 'branch' : SetBranchAddress + GetEntry per event, 'columnar' : chunked NumPy arrays, 'uproot' : NumPy arrays read without ROOT, 'skim' : local skim cache (ROOT is still needed: histograms, TLorentzVector, output)
+CHUNK_SIZE = 10000	## Events per chunk in columnar and skim mode
+SKIM_DIR = 'skims/'	## Skim cache, one skim per input file, made on first use
+SKIM_CODEC = 'zlib'	## Skim compression, 'none', 'zlib', 'lz4' or 'zstd', optionally ':level' (see L1SkimBenchmark.py)
+COLUMN_STORE = ''	## Memory-mapped decoded columns for columnar mode, made on first use; '' decodes every run
+CACHE_MB = 64		## TTreeCache per tree [MB], with async read-ahead; 0 keeps ROOT's default
+CHECKPOINT_EVT = 50000	## Events between checkpoints with --checkpoint
+STAGE_DIR = ''	## Local scratch directory for copies of the input files, made on first use; '' reads them in place
+STAGE_GB = 100		## Size cap of STAGE_DIR [GB], least recently used copies removed first
+STAGE_AHEAD = 2	## Input files copied in the background ahead of the one being processed
+STAGE_WORKERS = 2	## Concurrent background copies
+MANIFEST_DIR = 'manifests/'	## Saved scans of the input directories (files, entries), made on first use
+STAGES   = ['event', 'gen_acceptance', 'ghost_cleaning', 'matching', 'resolution', 'seed_evaluation']	## Only the leaves these read are enabled
 
 scale = [1., 1., 2544*11246., 1., 2544.*11246]
 
+LLP_PDG_ID = 6000113	## PDG id of the long-lived particle, gen muons are its decay muons
 Lxy_threshold = 400.
 vz_threshold  = 400.
+ACCEPTANCE = 'exact'	## Gen muon MuType, 'exact' : L1GenMuons.Acceptance, 'grid' : AcceptanceGrid lookup (same MuType, for chunked readers)
 addgenpt = 5.
 scenario = 1
 signal_file = 2
@@ -74,10 +106,7 @@ def getGenEtaPhiDetector(Gen_br, i) :
 
 	GenEta = asinh(zStar/rStar)
 
-	if (xStar > 0) : GenPhi = atan(yStar/xStar)
-	if (xStar == 0) : GenPhi = pi/2. if yStar > 0 else -pi/2.
-        elif (yStar >= 0 and xStar < 0) : GenPhi = pi + atan(yStar/xStar)
-        elif (yStar <= 0 and xStar < 0) : GenPhi = atan(yStar/xStar) - pi
+	GenPhi = atan2(yStar, xStar)	## every quadrant, xStar == 0 included (as L1GenMuons)
 	return GenEta, GenPhi
 
 def IsinacceptDetector(Gen_br, i) :
@@ -118,9 +147,7 @@ def getGenEtaPhiBarrel(Gen_br, i):
 	
 	GenEta = asinh(zStar/512.)
 	
-	if (xStar > 0) : GenPhi = atan(yStar/xStar)
-      	elif (yStar >= 0 and xStar < 0) : GenPhi = pi + atan(yStar/xStar)
-      	elif (yStar <= 0 and xStar < 0) : GenPhi = atan(yStar/xStar) - pi 	
+	GenPhi = atan2(yStar, xStar)	## every quadrant, xStar == 0 included (as L1GenMuons)
 	
 	return GenEta, GenPhi
 
@@ -166,9 +193,7 @@ def getGenEtaPhiEndcap(Gen_br, i):
 
 	GenEta	= asinh(z_ME2/rStar)*(eta/abs(eta))
 
-	if (xStar >= 0) : GenPhi = atan(yStar/xStar)
-      	elif (yStar >= 0 and xStar < 0) : GenPhi = pi + atan(yStar/xStar)
-      	elif (yStar <= 0 and xStar < 0) : GenPhi = atan(yStar/xStar) - pi 	
+	GenPhi = atan2(yStar, xStar)	## every quadrant, xStar == 0 included (as L1GenMuons)
 
 	return GenEta, GenPhi
 
@@ -197,7 +222,9 @@ def getDxy(vx, vy, phi):
 ##################################################################################################################
 
 
-def main():
+def main(opts=None):
+
+    if opts is None: opts = parse_options([])
 
     print '\nInside DisplacedMuons\n'
     evtclass = ["signal_1500", "signal_","NuGun","DisplacedMuGun", "private_NuGun"]
@@ -209,6 +236,7 @@ def main():
 
     workdir = '/afs/cern.ch/user/s/sonawane/L1T/L1studies/L1_scripts_Alberto/L1RunIII/macros/'
     in_file_names = []
+    in_file_entries = []	## entries per file, from the manifests
 
     sn = ""
 
@@ -221,10 +249,9 @@ def main():
 	for s in ['DisplacedMuGun_Pt2to10_11_2_X_1623847533/', 'DisplacedMuGun_Pt10to30_11_2_X_1623847663/', 'DisplacedMuGun_Pt30to100_11_2_X_1623847721/']:
 #	for s in ['MuGun_Pt2to10_Nu_11_2_X_1623157277/']:
 		ntupledir = inputdir[evtclassid]+s
-		for i in range(23) :
-        		path = ntupledir+str(i)+".root"
-        		if not os.path.exists(path): continue
-			in_file_names.append(path)
+		paths, entries = L1Manifest.input_files(ntupledir, 23, L1FriendChain.L1_TREES, MANIFEST_DIR, opts.rescan)
+		in_file_names += paths
+		in_file_entries += entries
 			
     elif evtclassid == 1:
 		filestr = ['HTo2LongLivedTo4mu_MH-125_MFF-12_CTau-900mm_11_2_X_1625152032/', 'HTo2LongLivedTo4mu_MH-125_MFF-25_CTau-1500mm_11_2_X_1625152298/', 'HTo2LongLivedTo4mu_MH-125_MFF-50_CTau-3000mm_11_2_X_1623847924/']
@@ -234,54 +261,86 @@ def main():
 			s = filestr[l]
 			sn = samplename[l]
 			ntupledir = inputdir[evtclassid]+s
-			for i in range(14) :
-				path = ntupledir+str(i)+".root"
-				if not os.path.exists(path): continue
-				in_file_names.append(path)
+			paths, entries = L1Manifest.input_files(ntupledir, 14, L1FriendChain.L1_TREES, MANIFEST_DIR, opts.rescan)
+			in_file_names += paths
+			in_file_entries += entries
     else:
-	for i in range(14):
-		path = inputdir[evtclassid]+str(i)+".root"
-		if not os.path.exists(path): continue
-		in_file_names.append(path)
+	paths, entries = L1Manifest.input_files(inputdir[evtclassid], 14, L1FriendChain.L1_TREES, MANIFEST_DIR, opts.rescan)
+	in_file_names += paths
+	in_file_entries += entries
 	    
+    ## Input list given on the command line (e.g. by the parallel mode for each worker)
+    if opts.files_from:
+        in_file_names = [l.strip() for l in open(opts.files_from) if l.strip()]
+        in_file_entries = None
+
+    ## Incremental mode: files already in the state, unchanged since, are not read again
+    if opts.incremental:
+        stamps = L1Accumulators.file_stamps(in_file_names)
+        done = L1Accumulators.read_cursor(opts.incremental)['files'] if os.path.exists(opts.incremental) else []
+        new, changed, missing = L1Accumulators.split_new(stamps, done)
+        if changed:
+            raise RuntimeError('Files changed since %s was saved, remove it to start over: %s' % (opts.incremental, ', '.join(s[0] for s in changed)))
+        if missing:
+            raise RuntimeError('Files in %s are no longer inputs, remove it to start over: %s' % (opts.incremental, ', '.join(s[0] for s in missing)))
+        print '\n%d files already in %s, %d new' % (len(stamps) - len(new), opts.incremental, len(new))
+        if in_file_entries is not None:
+            in_file_entries = [n for n, s in zip(in_file_entries, stamps) if s in new]
+        in_file_names = [s[0] for s in new]
+
+    ## Debug mode: only the events asked for, found through the (run, lumi, event) index of the inputs
+    picked = None
+    if opts.events:
+        index = L1EventIndex.index_for(in_file_names, MANIFEST_DIR)
+        in_file_names, in_file_entries, picked = L1EventIndex.select(index, opts.events)
+        print '\n%d events in %d files' % (len(picked), len(in_file_names))
+
     if not os.path.exists(workdir+'plots'): os.makedirs(workdir+'plots')
 
     MU_QLTY_SNGL = [12, 13, 14, 15]
     MU_QLTY_DBLE = [8, 9, 10, 11, 12, 13, 14, 15]
+    gen_acceptance = {'exact' : L1GenMuons.Acceptance, 'grid' : L1GenMuons.AcceptanceGrid}[ACCEPTANCE](Lxy_threshold, vz_threshold)
+    gen_muons = L1GenMuons.GenMuonReader(LLP_PDG_ID, gen_acceptance)
+    L1Skim.LLP_PDG_ID = LLP_PDG_ID	## skims keep the same gen muons
 
 	#	For testing
 	#    in_file_names=['/afs/cern.ch/user/s/sonawane/L1T/L1studies/L1_scripts_Alberto/L1RunIII/test/L1Ntuple.root']
 
     out_file_str = 'DisplacedMuons_'+evtclass[evtclassid]+sn+"_sc"+str(scenario)+base[base_sc]
-    out_file_str += ('_%dk' % (MAX_EVT / 1000))
-    out_file = R.TFile(workdir+'plots/'+out_file_str+'.root','recreate')
-
-    chains = {}
-    chains['Evt'] = []  ## Event info
-    chains['Unp'] = []  ## Unpacked legacy BMTF
-    chains['Emu'] = []  ## Emulated Kalman BMTF
-    chains['EmuK'] = []  ## Emulated Kalman BMTF
-    chains['EmuE'] = []  ## Emulated Kalman BMTF
-    chains['uGT'] = []  ## Global Trigger
-    chains['Gen'] = []  ## Generator information
-
-    chains['Evt'].append( R.TChain('l1EventTree/L1EventTree') )
-    chains['Unp'].append( R.TChain('l1UpgradeTfMuonTree/L1UpgradeTfMuonTree') )
-    chains['Emu'].append( R.TChain('l1UpgradeTfMuonEmuTree/L1UpgradeTfMuonTree') )
-    chains['EmuK'].append( R.TChain('l1UpgradeTfMuonEmuTree/L1UpgradeTfMuonTree') )
-    chains['EmuE'].append( R.TChain('l1UpgradeTfMuonEmuTree/L1UpgradeTfMuonTree') )
-    chains['uGT'].append( R.TChain('l1UpgradeEmuTree/L1UpgradeTree') )
-    chains['Gen'].append( R.TChain('l1GeneratorTree/L1GenTree') )
+    out_file_str += '_incremental' if opts.incremental else ('_%dk' % (MAX_EVT / 1000))	## incremental runs read all events
+    if opts.events: out_file_str += '_events'
+    if opts.shard and not opts.partial: opts.partial = workdir+'plots/'+out_file_str+'_shard%d_of_%d.root' % opts.shard
+
+    ## Output reuse: an output finished by a run over the same inputs, configuration
+    ## and code is returned as it is (partial, merged, incremental and --events results excluded)
+    out_path = workdir+'plots/'+out_file_str+'.root'
+    memo = None
+    if not (opts.partial or opts.merge or opts.incremental or opts.events):
+        config = L1Memo.config_of(globals())
+        config['evtclassid'] = evtclassid
+        memo = L1Memo.fingerprint(in_file_names, config, L1Memo.code_version(__file__))
+        if not opts.force and L1Memo.is_current(out_path, memo):
+            print '\nInputs, configuration and code unchanged, reusing plots/'+out_file_str+'.root (--force to rerun)'
+            saved = L1Accumulators.Counters(L1Memo.summary(out_path))
+            print_summary(saved, saved.pop('iEvt'))
+            return out_path
+        L1Memo.forget(out_path)
+
+    if opts.partial: out_file = R.TFile(opts.partial, 'recreate')
+    else:            out_file = R.TFile(out_path,'recreate')
+
+    ## One chain, each file opened once: Event info, emulated Kalman BMTF and EMTF
+    ## (same TF muon tree), Global Trigger and Generator trees joined as friends
+    chains = []
+    chains.append( L1FriendChain.FriendChain(in_file_names, L1FriendChain.L1_TREES, in_file_entries) )
+    chains[0].SetActiveLeaves( L1Branches.active_leaves(STAGES) )
+    if CACHE_MB: chains[0].SetCache( CACHE_MB*1024*1024 )
+    if opts.imt: L1TreeCache.enable_implicit_mt(opts.imt)
+    stager = L1Staging.Stager(STAGE_DIR, STAGE_GB*1024**3, STAGE_AHEAD, STAGE_WORKERS) if STAGE_DIR else None
+    if stager: chains[0].SetStaging( stager )
 
     for i in range(len(in_file_names)):
         print 'Adding file %s' % in_file_names[i]
-        chains['Evt'][0].Add( in_file_names[i] )
-        chains['Unp'][0].Add( in_file_names[i] )
-        chains['Emu'][0].Add( in_file_names[i] )
-        chains['EmuK'][0].Add( in_file_names[i] )
-        chains['EmuE'][0].Add( in_file_names[i] )
-        chains['uGT'][0].Add( in_file_names[i] )
-        chains['Gen'][0].Add( in_file_names[i] )
 
 
     ###################
@@ -450,103 +509,165 @@ def main():
 
 #Event counters
 
-    GenMuevt_count 		= 0
+    cnt = L1Accumulators.Counters()
+
+    cnt.GenMuevt_count 		= 0
     
-    GenMuCount 			= 0
-    GenMuinAcc			= 0
+    cnt.GenMuCount 			= 0
+    cnt.GenMuinAcc			= 0
 
-    EmuMuevt_count	 	= 0
-    EmuMus_count		= 0
-    EmuMus_unique_count 	= 0
+    cnt.EmuMuevt_count	 	= 0
+    cnt.EmuMus_count		= 0
+    cnt.EmuMus_unique_count 	= 0
 
-    matched_gen_mu_count	= 0
-    matched_gen_mu_evt		= 0
+    cnt.matched_gen_mu_count	= 0
+    cnt.matched_gen_mu_evt		= 0
 
-    n_matched_dimus		= 0
+    cnt.n_matched_dimus		= 0
 
-    mismatch_evt		= 0
+    cnt.mismatch_evt		= 0
 
     iEvt 			= 0 
 
 #    Efficiencies
-    Baseline_Run_2_num		= 0
-    Baseline_Run_2_den		= 0
-    Den2 			= 0
-    Den3			= 0
+    cnt.Baseline_Run_2_num		= 0
+    cnt.Baseline_Run_2_den		= 0
+    cnt.Den2 			= 0
+    cnt.Den3			= 0
 
-    Extended_Run_2_num		= 0
-    Extended_Run_2A_num		= 0
-    Extended_Run_2B_num		= 0
+    cnt.Extended_Run_2_num		= 0
+    cnt.Extended_Run_2A_num		= 0
+    cnt.Extended_Run_2B_num		= 0
 
-    UPT_IP1_num			= 0
+    cnt.UPT_IP1_num			= 0
 
-    Baseline_Run_2_UPT_BMTF_num	= 0
-    Baseline_Run_2_UPT_num  	= 0
-    Baseline_Run_2_UPT_dxy1_num	= 0
+    cnt.Baseline_Run_2_UPT_BMTF_num	= 0
+    cnt.Baseline_Run_2_UPT_num  	= 0
+    cnt.Baseline_Run_2_UPT_dxy1_num	= 0
 
-    Extended_Run_2_UPT_dxy1_num = 0
-    Extended_Run_2_UPT_num 	= 0
+    cnt.Extended_Run_2_UPT_dxy1_num = 0
+    cnt.Extended_Run_2_UPT_num 	= 0
 
-    debug_count_00_den			= 0
-    debug_count_00_num			= 0
-    debug_count_10_num			= 0
+    cnt.debug_count_00_den			= 0
+    cnt.debug_count_00_num			= 0
+    cnt.debug_count_10_num			= 0
 
     ##### Dimuon counters #####
    
-    GenDimu_Evt = 0
+    cnt.GenDimu_Evt = 0
+
+    ## Parallel and merge mode: partial results, from workers run here over groups of files
+    ## or from earlier --shard jobs, are added into the booked histograms; the loop is skipped
+    if opts.workers > 1 or opts.merge:
+        if opts.merge:
+            partials = opts.merge
+        else:
+            groups = L1Parallel.plan(in_file_names, chains[0].file_entries(), MAX_EVT, opts.workers)
+            partials = L1Parallel.run_workers(sys.argv[0], groups, ['--imt', str(opts.imt)] if opts.imt else [])
+        cnt.add(L1Accumulators.merge_partials(partials, out_file, opts.force))
+        if not opts.merge: L1Parallel.cleanup(partials)
+        iEvt = cnt.pop('iEvt')
+        if stager: stager.close()
+        chains = []
+
+    ## Checkpoints hold the accumulators and the cursor of the next event to process;
+    ## --resume reloads them, so the loop carries on as if never interrupted
+    run = {'files' : in_file_names, 'max_evt' : MAX_EVT, 'shard' : opts.shard}
+    resume = None
+    if opts.resume and os.path.exists(opts.checkpoint):
+        counters, resume = L1Accumulators.read_checkpoint(opts.checkpoint, out_file)
+        if resume['run'] != json.loads(json.dumps(run)):
+            raise RuntimeError('Checkpoint %s is from a run over other inputs or events' % opts.checkpoint)
+        cnt.update(counters)
+        iEvt = resume['iEvt']
+        print '\nResuming from %s at event %d (entry %d of chain %d)' % (opts.checkpoint, iEvt, resume['jEvt'], resume['iCh'])
+    if opts.incremental and done:
+        cnt.update(L1Accumulators.read_checkpoint(opts.incremental, out_file)[0])
+        iEvt = cnt.pop('iEvt')
 
     print '\nEntering loop over chains'
-    for iCh in range(len(chains['Emu'])):
+    for iCh in range(len(chains)):
 
-        if iEvt >= MAX_EVT: break
+        if iEvt >= MAX_EVT and not opts.incremental: break	## incremental runs read the new files in full
+        if resume and iCh < resume['iCh']: continue
 
         ## Faster tecnhique, inspired by https://github.com/thomreis/l1tMuonTools/blob/master/L1Analysis.py
-        Evt_br = R.L1Analysis.L1AnalysisEventDataFormat()
-        Unp_br = R.L1Analysis.L1AnalysisL1UpgradeTfMuonDataFormat()
-        EmuK_br = R.L1Analysis.L1AnalysisL1UpgradeTfMuonDataFormat()
-        EmuE_br = R.L1Analysis.L1AnalysisL1UpgradeTfMuonDataFormat()
-        uGT_br = R.L1Analysis.L1AnalysisL1UpgradeDataFormat()
-        Gen_br = R.L1Analysis.L1AnalysisGeneratorDataFormat()
-#        Kmt_br = R.L1Analysis.L1AnalysisBMTFOutputDataFormat()
-
-        chains['Evt'][iCh].SetBranchAddress('Event',               R.AddressOf(Evt_br))
-        chains['Unp'][iCh].SetBranchAddress('L1UpgradeBmtfMuon',   R.AddressOf(Unp_br))
-        chains['EmuK'][iCh].SetBranchAddress('L1UpgradeKBmtfMuon', R.AddressOf(EmuK_br))
-        chains['EmuE'][iCh].SetBranchAddress('L1UpgradeEmtfMuon',  R.AddressOf(EmuE_br))
-        chains['uGT'][iCh].SetBranchAddress('L1Upgrade',  	   R.AddressOf(uGT_br))
-        chains['Gen'][iCh].SetBranchAddress('Generator',           R.AddressOf(Gen_br))
+        ## (branch mode only, the other readers need no L1Analysis dictionaries)
+        if READER == 'branch':
+            Evt_br = R.L1Analysis.L1AnalysisEventDataFormat()
+            EmuK_br = R.L1Analysis.L1AnalysisL1UpgradeTfMuonDataFormat()
+            EmuE_br = R.L1Analysis.L1AnalysisL1UpgradeTfMuonDataFormat()
+            uGT_br = R.L1Analysis.L1AnalysisL1UpgradeDataFormat()
+            Gen_br = R.L1Analysis.L1AnalysisGeneratorDataFormat()
+#            Kmt_br = R.L1Analysis.L1AnalysisBMTFOutputDataFormat()
+
+            chains[iCh].SetBranchAddress('Event',               R.AddressOf(Evt_br))
+            chains[iCh].SetBranchAddress('L1UpgradeKBmtfMuon',  R.AddressOf(EmuK_br))
+            chains[iCh].SetBranchAddress('L1UpgradeEmtfMuon',   R.AddressOf(EmuE_br))
+            chains[iCh].SetBranchAddress('L1Upgrade',           R.AddressOf(uGT_br))
+            chains[iCh].SetBranchAddress('Generator',           R.AddressOf(Gen_br))
+
+        ## Columnar, uproot and skim mode: the views stand in for the DataFormat objects and are refilled chunk-wise
+        if READER == 'columnar' and COLUMN_STORE:
+            stores = L1ColumnStore.store_files(chains[iCh].file_names, COLUMN_STORE, ['Evt', 'EmuK', 'EmuE', 'uGT', 'Gen'], CHUNK_SIZE)
+            reader = L1ColumnStore.StoreReader(stores, ['Evt', 'EmuK', 'EmuE', 'uGT', 'Gen'], CHUNK_SIZE)
+        elif READER == 'columnar':
+            reader = L1ColumnReader.ColumnReader(chains[iCh], ['Evt', 'EmuK', 'EmuE', 'uGT', 'Gen'], CHUNK_SIZE)
+        elif READER == 'uproot':
+            reader = L1UprootReader.UprootReader(chains[iCh].file_names, ['Evt', 'EmuK', 'EmuE', 'uGT', 'Gen'], CHUNK_SIZE,
+                                                 entries=in_file_entries, active=chains[iCh].active)
+        elif READER == 'skim':
+            skims = L1Skim.skim_files(chains[iCh].file_names, SKIM_DIR, ['Evt', 'EmuK', 'EmuE', 'uGT', 'Gen'], CHUNK_SIZE, SKIM_CODEC)
+            reader = L1Skim.SkimReader(skims, ['Evt', 'EmuK', 'EmuE', 'uGT', 'Gen'], CHUNK_SIZE)
+        if READER != 'branch':
+            Evt_br  = reader.view('Evt')
+            EmuK_br = reader.view('EmuK')
+            EmuE_br = reader.view('EmuE')
+            uGT_br  = reader.view('uGT')
+            Gen_br  = reader.view('Gen')
+
+        ## NumPy arrays of the vector members of the current event: zero-copy views over the std::vectors, or the chunk slices
+        if READER == 'branch':
+            EmuK_np, uGT_np, Gen_np = L1VectorViews.VectorViews(EmuK_br), L1VectorViews.VectorViews(uGT_br), L1VectorViews.VectorViews(Gen_br)
+            vector_views = [EmuK_np, uGT_np, Gen_np]
+        else:
+            EmuK_np, uGT_np, Gen_np = EmuK_br, uGT_br, Gen_br
 #        chains['Emu'][iCh].SetBranchAddress('L1UpgradeBmtfOutput', R.AddressOf(Kmt_br))
 
 	
 
         print '\nEntering loop over events for chain %d' % iCh
-        for jEvt in range(chains['Emu'][iCh].GetEntries()):
+        entries = chains[iCh].GetEntries() if READER == 'branch' else reader.GetEntries()
+        first_evt, last_evt = 0, entries
+        if opts.shard: first_evt, last_evt = L1Parallel.shard_range(min(entries, MAX_EVT), *opts.shard)
+        if resume and iCh == resume['iCh']: first_evt = resume['jEvt']
+        for jEvt in (range(first_evt, last_evt) if picked is None else picked):
+
+            if iEvt >= MAX_EVT and not opts.incremental: break
 
-            if iEvt >= MAX_EVT: break
+            if opts.checkpoint and jEvt > first_evt and iEvt % CHECKPOINT_EVT == 0:
+                L1Accumulators.write_checkpoint(opts.checkpoint, out_file, cnt, {'iCh' : iCh, 'jEvt' : jEvt, 'iEvt' : iEvt, 'run' : run})
 
 	    iEvt +=1
 
             if iEvt % PRT_EVT is 0: print '\nEvent # %d (%dth in chain)' % (iEvt, jEvt+1)
 
-            chains['Evt'][iCh].GetEntry(jEvt)
-            chains['Unp'][iCh].GetEntry(jEvt)
-            chains['EmuK'][iCh].GetEntry(jEvt)
-            chains['EmuE'][iCh].GetEntry(jEvt)
-            chains['uGT'][iCh].GetEntry(jEvt)
-            chains['Gen'][iCh].GetEntry(jEvt)
+            if READER != 'branch':
+                reader.GetEntry(jEvt)
+            else:
+                chains[iCh].GetEntry(jEvt)
+                for views in vector_views: views.reset()
 
             # ## Use these lines if you don't explicitly define the DataFormat and then do SetBranchAddress above
             # Evt_br = chains['Evt'][iCh].Event
             # Unp_br = chains['Unp'][iCh].L1UpgradeBmtfMuon
             # Emu_br = chains['Emu'][iCh].L1UpgradeBmtfMuon
 
-            if iEvt % PRT_EVT is 0: print '  * Run %d, LS %d, event %d' % (int(Evt_br.run), int(Evt_br.lumi), int(Evt_br.event))
+            if iEvt % PRT_EVT is 0 or picked: print '  * Run %d, LS %d, event %d' % (int(Evt_br.run), int(Evt_br.lumi), int(Evt_br.event))
 
-            nUnpMu = int(Unp_br.nTfMuons)
             nEmuKMu = int(EmuK_br.nTfMuons)
             nEmuEMu = int(EmuE_br.nTfMuons)
             nuGTMu = int(uGT_br.nMuons)
-	    nGenPart = int(Gen_br.nPart)
 #            nKmtMu = int(Kmt_br.nTrks)
 	    
 	    ##########################
@@ -568,41 +689,30 @@ def main():
             ###  Generator information for muons  ###
             #########################################
 
-	    for i in range(nGenPart):
-	
-		if (abs(Gen_br.partId[i])!=13): continue
-#		if (Gen_br.partStat[i]!=1): continue
-
-		### weighting MuGun events ###
-		
-		weight = 1.
-	
-		if (Gen_br.partParent[i]!=6000113): continue
+	    ## Muons from the LLP decay (abs(partId) == 13, partParent == LLP_PDG_ID) and their record, read by acceptance,
+	    ## matching, resolution and dimuons: pt, eta, phi, vertex, Lxy, Dxy, MuType (IsinacceptBarrel, else
+	    ## IsinacceptEndcap) and eta/phi at the station, selected and computed once per chunk
+	    gen = gen_muons.event(Gen_np)
+	    GenMus.extend(gen.idx.tolist())
 
-		GenMus.append(i)
-		vz = float(Gen_br.partVz[i])
-		Lxy = sqrt(float(Gen_br.partVx[i])**2 + float(Gen_br.partVy[i]**2))
-		GenDxy  = getDxy(float(Gen_br.partVx[i]), float(Gen_br.partVy[i]), float(Gen_br.partPhi[i]))
+	    for k in range(len(gen)):
+		i = GenMus[k]
+		vz = gen.vz[k]
+		Lxy = gen.lxy[k]
 
 		h_gen_lxy.Fill(Lxy)
-		h_gen_dxy.Fill(GenDxy)
+		h_gen_dxy.Fill(gen.dxy[k])
 
-		if IsinacceptBarrel(Gen_br, i) : MuType = 1 
-		elif IsinacceptEndcap(Gen_br, i) : MuType = 3
-#		if IsinacceptDetector(Gen_br, i) : MuType = 2 
-		else : 
+		MuType = int(gen.mu_type[k])
+		if MuType == 0 :
 
 			fail_acc_z_lxy.Fill(vz, Lxy)
 			continue 	
 		pass_acc_z_lxy.Fill(vz, Lxy)
 
 		GenMus_acc.append([i, MuType])
-
-                gen_eta, gen_phi = getGenEtaPhi(Gen_br, i, MuType)
-                z0      = float(Gen_br.partVz[i])
-		ptgen 	= float(Gen_br.partPt[i])
 		
-		GenMuPt_acc.append([Gen_br.partPt[i], i, MuType])
+		GenMuPt_acc.append([gen.pt[k], i, MuType])
 
 	    GenMuPt_acc.sort(reverse=True)
 
@@ -610,14 +720,10 @@ def main():
             ###  Emulated uGT muons  ###
             #################################
 
-            for i in range(nuGTMu):
-                BX      = int(uGT_br.muonBx[i])
-                                
-                if (BX  !=  0): continue
+            EmuMus.extend(numpy.flatnonzero(uGT_np.array('muonBx') == 0).tolist())
 #                if (qual < 11): continue
 
-		EmuMus.append(i)
-
+            for i in EmuMus:
 		h_emu_pt_all.Fill(uGT_br.muonEt[i])
 		h_emu_upt_all.Fill(uGT_br.muonEtUnconstrained[i])
 
@@ -659,13 +765,8 @@ def main():
             ###  Emulated kBMTF muons  ###
             #################################
 
-            for i in range(nEmuKMu):
-                BX      = int(EmuK_br.tfMuonBx[i])
-
-                if (BX  !=  0): continue
+            EmuKMus.extend(numpy.flatnonzero(EmuK_np.array('tfMuonBx') == 0).tolist())
 #               if (qual < 11): continue
-		
-		EmuKMus.append(i)
 
 	    Eta_phi = []
 
@@ -752,8 +853,8 @@ def main():
 		mutype = el[1]
 		
 		GenMuCorr = R.TLorentzVector()
-		temp_eta, temp_phi = getGenEtaPhi(Gen_br, i, mutype)
-		GenMuCorr.SetPtEtaPhiM(float(Gen_br.partPt[i]), temp_eta, temp_phi, 105.7e-3)
+		g = gen.pos[i]
+		GenMuCorr.SetPtEtaPhiM(gen.pt[g], gen.eta_star[g], gen.phi_star[g], 105.7e-3)
 		eta1corr = GenMuCorr.Eta()
 		phi1corr = GenMuCorr.Phi()
 
@@ -849,7 +950,7 @@ def main():
 			if i < len(EMTF_dR_list): 
 				k = True
 
-	    matched_gen_mu_count  += len(dR_list)
+	    cnt.matched_gen_mu_count  += len(dR_list)
 
 
 #### Debugging matching ####
@@ -888,12 +989,12 @@ def main():
 
 		ptVtx 	= float(uGT_br.muonEt[emuidx])
 		ptDisp 	= float(uGT_br.muonEtUnconstrained[emuidx])
-		ptGen 	= float(Gen_br.partPt[genidx])
+		ptGen 	= gen.pt[gen.pos[genidx]]
 		L1eta	= float(uGT_br.muonEta[emuidx])
 
 		L1Dxy 	= int(uGT_br.muonDxy[emuidx])
 		
-		genDxy 	= getDxy(float(Gen_br.partVx[genidx]), float(Gen_br.partVy[genidx]), float(Gen_br.partPhi[genidx]))
+		genDxy 	= gen.dxy[gen.pos[genidx]]
 
 		h_emu_pt.Fill(ptVtx)
 		h_emu_upt.Fill(ptDisp)
@@ -950,26 +1051,28 @@ def main():
 	    if len(GenMus_acc) >= 2 :
 		for i in range(len(GenMus_acc)):
 			idx1 = GenMus_acc[i][0]
-			vx1 = float(Gen_br.partVx[idx1])
-			vy1 = float(Gen_br.partVy[idx1])
-			vz1 = float(Gen_br.partVz[idx1])
-			pt1 = float(Gen_br.partPt[idx1])
+			g1 = gen.pos[idx1]
+			vx1 = gen.vx[g1]
+			vy1 = gen.vy[g1]
+			vz1 = gen.vz[g1]
+			pt1 = gen.pt[g1]
 
 			vec1 = R.TLorentzVector()
-			vec1.SetPtEtaPhiM(pt1, float(Gen_br.partEta[idx1]), float(Gen_br.partPhi[idx1]), 0.)
+			vec1.SetPtEtaPhiM(pt1, gen.eta[g1], gen.phi[g1], 0.)
 
 			for j in range(i+1, len(GenMus_acc)):
 				idx2 = GenMus_acc[j][0]
-				vx2 = float(Gen_br.partVx[idx2])
-				vy2 = float(Gen_br.partVy[idx2])
-				vz2 = float(Gen_br.partVz[idx2])
-				pt2 = float(Gen_br.partPt[idx2])
+				g2 = gen.pos[idx2]
+				vx2 = gen.vx[g2]
+				vy2 = gen.vy[g2]
+				vz2 = gen.vz[g2]
+				pt2 = gen.pt[g2]
 				vec2 = R.TLorentzVector()
-				vec2.SetPtEtaPhiM(pt2, float(Gen_br.partEta[idx2]), float(Gen_br.partPhi[idx2]), 0.)
+				vec2.SetPtEtaPhiM(pt2, gen.eta[g2], gen.phi[g2], 0.)
 
 				if vx1==vx2 and vy1==vy2 and vz1==vz2:
 
-					lxy = sqrt(vx1**2 + vy1**2)
+					lxy = gen.lxy[g1]
 
 					if scenario >= 2 :
 						if pt1 < 23. or pt2 < 23. : 
@@ -989,11 +1092,11 @@ def main():
 					ptgen1_den.Fill(pt1)
 					ptgen2_den.Fill(pt2)
 
-					ptlead = float(Gen_br.partPt[el[0]])
-					ptsublead = float(Gen_br.partPt[el[1]])
+					ptlead = gen.pt[gen.pos[el[0]]]
+					ptsublead = gen.pt[gen.pos[el[1]]]
 
-					dxy1 = getDxy(Gen_br.partVx[el[0]], Gen_br.partVy[el[0]], Gen_br.partPhi[el[0]])
-					dxy2 = getDxy(Gen_br.partVx[el[1]], Gen_br.partVy[el[1]], Gen_br.partPhi[el[1]])
+					dxy1 = gen.dxy[gen.pos[el[0]]]
+					dxy2 = gen.dxy[gen.pos[el[1]]]
 
 					h_gen_dxy_sc1.Fill(dxy1)
 					h_gen_dxy_sc1.Fill(dxy2)
@@ -1007,11 +1110,11 @@ def main():
 							h_gen_dxy_sc3.Fill(dxy2)
 							
 
-					eta1 = float(Gen_br.partEta[el[0]])
+					eta1 = gen.eta[gen.pos[el[0]]]
 
 					h_dxy_turnon_den.Fill(dxy1)
 					if ptlead >= 0 and ptsublead >= 0 : 
-						debug_count_00_den +=1
+						cnt.debug_count_00_den +=1
 
 					for ptsubleadthresh in range(25) :
 						for ptleadthresh in range(ptsubleadthresh, 25) :
@@ -1029,7 +1132,7 @@ def main():
 								h_eff_dR_vs_eta_dxy10_den.Fill(etathresh-0.05, dRthresh-0.05)	
 
 
-	    Baseline_Run_2_den +=len(Dimus_acc)
+	    cnt.Baseline_Run_2_den +=len(Dimus_acc)
 
 	    if len(Dimus_acc) :
 
@@ -1049,7 +1152,7 @@ def main():
 
 	    	matched_dimus=[]
 
-		GenDimu_Evt +=1 
+		cnt.GenDimu_Evt +=1 
 		for j in range(len(Dimus_acc)):
 			temp = []
 			for i in range(len(dR_list)):
@@ -1064,7 +1167,7 @@ def main():
 			print "Gen Dimuons in event : ", len(Dimus_acc)
 			print "Matched Dimuons in event : ", len(matched_dimus)
 
-		n_matched_dimus += len(matched_dimus)
+		cnt.n_matched_dimus += len(matched_dimus)
 			
 #			idx1 = Dimus_acc[j][0]
 #			idx2 = Dimus_acc[j][1]
@@ -1124,8 +1227,9 @@ def main():
 			v1gen = R.TLorentzVector()
 			v2gen = R.TLorentzVector()
 
-			ptgen1 = float(Gen_br.partPt[genidx1])
-			ptgen2 = float(Gen_br.partPt[genidx2])
+			g1, g2 = gen.pos[genidx1], gen.pos[genidx2]
+			ptgen1 = gen.pt[g1]
+			ptgen2 = gen.pt[g2]
 
 			ptgenlead = ptgen1		
 			ptgensublead = ptgen2	
@@ -1140,14 +1244,14 @@ def main():
 				etalead, etasublead = etasublead, etalead
 				
 
-			gendxy1 = getDxy(float(Gen_br.partVx[leadgenid]), float(Gen_br.partVy[leadgenid]), float(Gen_br.partPhi[leadgenid]))
-			gendxy2 = getDxy(float(Gen_br.partVx[subleadgenid]), float(Gen_br.partVy[subleadgenid]), float(Gen_br.partPhi[subleadgenid]))
+			gendxy1 = gen.dxy[gen.pos[leadgenid]]
+			gendxy2 = gen.dxy[gen.pos[subleadgenid]]
 
-			v1gen.SetPtEtaPhiM(float(Gen_br.partPt[genidx1]), float(Gen_br.partEta[genidx1]), float(Gen_br.partPhi[genidx1]), 0.)
-			v2gen.SetPtEtaPhiM(float(Gen_br.partPt[genidx2]), float(Gen_br.partEta[genidx2]), float(Gen_br.partPhi[genidx2]), 0.)
+			v1gen.SetPtEtaPhiM(gen.pt[g1], gen.eta[g1], gen.phi[g1], 0.)
+			v2gen.SetPtEtaPhiM(gen.pt[g2], gen.eta[g2], gen.phi[g2], 0.)
 			dR_gen = v1gen.DeltaR(v2gen)
 
-			Lxy = sqrt(float(Gen_br.partVx[genidx1])**2 + float(Gen_br.partVy[genidx1])**2)
+			Lxy = gen.lxy[g1]
 
 			if (qual1 in MU_QLTY_DBLE) and (qual2 in MU_QLTY_DBLE) :
 				if pt1 >= 15. and pt2 >= 7. : L1_DoubleMu_15_7_flag = True
@@ -1170,47 +1274,47 @@ def main():
 			BR2_flag = False
 
 			if L1_DoubleMu_15_7_flag : 
-				Baseline_Run_2_num += 1.
+				cnt.Baseline_Run_2_num += 1.
 				dR_num_BR2.Fill(dR_gen)
 				dR_num_BR2_GMT.Fill(dR)
-				ptgen1_BR2.Fill(Gen_br.partPt[genidx1])
-				ptgen2_BR2.Fill(Gen_br.partPt[genidx2])
+				ptgen1_BR2.Fill(ptgen1)
+				ptgen2_BR2.Fill(ptgen2)
 				h_BR2_lxy_dR.Fill(Lxy, dR)
 				if base_sc == 2 : BR2_flag = True
 
 			if L1_DoubleMu_15_7_flag or (L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag or L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag) : 
-				Extended_Run_2_num += 1.
+				cnt.Extended_Run_2_num += 1.
 				dR_num_ER2.Fill(dR_gen)
 				dR_num_ER2_GMT.Fill(dR)
 				h_ER2_lxy_dR.Fill(Lxy, dR)
 				if base_sc == 1 : ER2_flag = True
 
-			if L1_DoubleMu_15_7_flag or (L1_DoubleMu_15_7_UPT_BMTF_flag) : Baseline_Run_2_UPT_BMTF_num += 1.
-			if L1_DoubleMu_15_7_flag or (L1_DoubleMu_15_7_UPT_flag) : Baseline_Run_2_UPT_num += 1.
-			if L1_DoubleMu_15_7_flag or (L1_DoubleMu_6_4_UPT_DXY1_flag) : Baseline_Run_2_UPT_dxy1_num += 1.
+			if L1_DoubleMu_15_7_flag or (L1_DoubleMu_15_7_UPT_BMTF_flag) : cnt.Baseline_Run_2_UPT_BMTF_num += 1.
+			if L1_DoubleMu_15_7_flag or (L1_DoubleMu_15_7_UPT_flag) : cnt.Baseline_Run_2_UPT_num += 1.
+			if L1_DoubleMu_15_7_flag or (L1_DoubleMu_6_4_UPT_DXY1_flag) : cnt.Baseline_Run_2_UPT_dxy1_num += 1.
 			if L1_DoubleMu_15_7_flag or L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag or L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag or L1_DoubleMu_6_4_UPT_DXY1_flag :
-				Extended_Run_2_UPT_dxy1_num += 1.
+				cnt.Extended_Run_2_UPT_dxy1_num += 1.
 			if (L1_DoubleMu_15_7_flag or L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag or L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag) or (L1_DoubleMu_15_7_UPT_flag) : 
-				Extended_Run_2_UPT_num += 1.
+				cnt.Extended_Run_2_UPT_num += 1.
 
 			if L1_DoubleMu_15_7_flag or L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag or L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag or L1_DoubleMu_6_4_UPT_DXY1_flag \
-			or L1_DoubleMu_15_7_UPT_flag : UPT_IP1_num +=1.
+			or L1_DoubleMu_15_7_UPT_flag : cnt.UPT_IP1_num +=1.
 			
 			if L1_DoubleMu_15_7_flag or (L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag) : 
-				Extended_Run_2A_num += 1.
+				cnt.Extended_Run_2A_num += 1.
 				dR_num_ER2A.Fill(dR_gen)
 				dR_num_ER2A_GMT.Fill(dR)
 
 			if L1_DoubleMu_15_7_flag or (L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag) : 
-				Extended_Run_2B_num += 1.
+				cnt.Extended_Run_2B_num += 1.
 				dR_num_ER2B.Fill(dR_gen)
 				dR_num_ER2B_GMT.Fill(dR)
 
 			if ptlead >= 0 and ptsublead >= 0 : 
-				debug_count_00_num +=1
+				cnt.debug_count_00_num +=1
 				if dxy1 >=1 : 
 					h_dxy_turnon_num.Fill(gendxy1)
-					debug_count_10_num +=1
+					cnt.debug_count_10_num +=1
 
 			for ptsubleadthresh in range(25) :
 				for ptleadthresh in range(ptsubleadthresh, 25) :
@@ -1266,21 +1370,38 @@ def main():
             ###  Updating counters  ###
             ###########################
  	    
-	    if len(GenMus) : GenMuevt_count +=1
-	    GenMuCount += len(GenMus)
-	    GenMuinAcc += len(GenMus_acc)
+	    if len(GenMus) : cnt.GenMuevt_count +=1
+	    cnt.GenMuCount += len(GenMus)
+	    cnt.GenMuinAcc += len(GenMus_acc)
 
-	    if len(EmuMus) : EmuMuevt_count +=1
-	    EmuMus_count += len(EmuMus)
+	    if len(EmuMus) : cnt.EmuMuevt_count +=1
+	    cnt.EmuMus_count += len(EmuMus)
 
-	    EmuMus_unique_count +=len(EmuMus_unique)
+	    cnt.EmuMus_unique_count +=len(EmuMus_unique)
 
-	    if len(dR_list) : matched_gen_mu_evt +=1
+	    if len(dR_list) : cnt.matched_gen_mu_evt +=1
 
         ## End loop: for jEvt in range(chains['Unp'][iCh].GetEntries()):
     ## End loop: for iCh in range(len(chains['Unp'])):
 
     print '\nFinished loop over chains'
+    for iCh in range(len(chains)): chains[iCh].PrintCacheStats()
+    if chains and chains[0].stager: chains[0].stager.close()
+
+    ## Incremental mode: save the raw histograms and counters with all files read so far, then finalise on the totals
+    if opts.incremental:
+        cnt.iEvt = iEvt
+        L1Accumulators.write_checkpoint(opts.incremental, out_file, cnt, {'files' : done + new})
+        cnt.pop('iEvt')
+        print '\nSaved state of %d files: %s' % (len(done + new), opts.incremental)
+
+    ## Worker mode: save the raw histograms and counters, the parent finalises
+    if opts.partial:
+        cnt.iEvt = iEvt
+        L1Accumulators.write_partial(out_file, cnt, opts.shard)
+        out_file.Close()
+        print '\nWrote partial result: '+opts.partial
+        return
 
     out_file.cd()
 
@@ -1444,60 +1565,95 @@ def main():
 
     out_file.Close()
     del chains
+    if memo: L1Memo.record(out_path, memo, dict(cnt, iEvt=iEvt))
 
     print '\nWrote out file: plots/'+out_file_str+'.root'
+    print_summary(cnt, iEvt)
+
+def print_summary(cnt, iEvt):
+    """Counters and efficiencies of a finished run (also of a reused output, from its memo)."""
     print '\n Events run over: ', iEvt
 
     print 'Event counter'
-    print 'Total GenMus: ', GenMuCount
-    print 'GenMus in Acceptance: ', GenMuinAcc
-    print 'EmuMus passing qual: ', EmuMus_count
-    print 'EmuMus passing qual and unique: ', EmuMus_unique_count
+    print 'Total GenMus: ', cnt.GenMuCount
+    print 'GenMus in Acceptance: ', cnt.GenMuinAcc
+    print 'EmuMus passing qual: ', cnt.EmuMus_count
+    print 'EmuMus passing qual and unique: ', cnt.EmuMus_unique_count
     
-    print 'Mismatch between corr and uncorr Gen Muons matched to qual emus: ', mismatch_evt
+    print 'Mismatch between corr and uncorr Gen Muons matched to qual emus: ', cnt.mismatch_evt
 
-    print 'Matched gen mus : ', matched_gen_mu_count
-    print 'Events with matched gen Mus: ', matched_gen_mu_evt
+    print 'Matched gen mus : ', cnt.matched_gen_mu_count
+    print 'Events with matched gen Mus: ', cnt.matched_gen_mu_evt
 
-    print 'Events with Gen Dimuons: ', GenDimu_Evt
+    print 'Events with Gen Dimuons: ', cnt.GenDimu_Evt
 
-    print 'Matching Eff wrt to Acceptance : ', matched_gen_mu_count*1./GenMuinAcc
+    print 'Matching Eff wrt to Acceptance : ', cnt.matched_gen_mu_count*1./cnt.GenMuinAcc
 
     print "\n################################# Efficiencies ##################################\n"
 
-    print "Dimuons : ", Baseline_Run_2_den*1.
-    print "Matched dimuons : ", n_matched_dimus
-    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Baseline run 2 ", Baseline_Run_2_num, Baseline_Run_2_num*1./Baseline_Run_2_num, \
-	Baseline_Run_2_num*1./Extended_Run_2_num)
-    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Extended run 2 ", Extended_Run_2_num*1., Extended_Run_2_num*1./Baseline_Run_2_num, \
-	Extended_Run_2_num*1./Extended_Run_2_num)
-    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Extended run 2A ", Extended_Run_2A_num*1., Extended_Run_2A_num*1./Baseline_Run_2_num, \
-	Extended_Run_2A_num*1./Extended_Run_2_num)
-    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Extended run 2B ", Extended_Run_2B_num*1., Extended_Run_2B_num*1./Baseline_Run_2_num, \
-	Extended_Run_2B_num*1./Extended_Run_2_num)
-    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Baseline run 2 + Unconstrained BMTF ", Baseline_Run_2_UPT_BMTF_num*1., Baseline_Run_2_UPT_BMTF_num*1./Baseline_Run_2_num,\
-	Baseline_Run_2_UPT_BMTF_num*1./Extended_Run_2_num)
-    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Baseline run 2 + Unconstrained ", Baseline_Run_2_UPT_num*1., Baseline_Run_2_UPT_num*1./Baseline_Run_2_num, \
-	Baseline_Run_2_UPT_num*1./Extended_Run_2_num)
-    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Baseline run 2 + Unconstrained + DXY1", Baseline_Run_2_UPT_dxy1_num*1., Baseline_Run_2_UPT_dxy1_num*1./Baseline_Run_2_num,\
-	Baseline_Run_2_UPT_dxy1_num*1./Extended_Run_2_num)
-    print "%-50s : %.4f :\t%.4f :\t%.4f :\t%4f" %("Extended Run 2 OR UPT_15_7", Extended_Run_2_UPT_num*1., Extended_Run_2_UPT_num*1./Baseline_Run_2_num, \
-	Extended_Run_2_UPT_num*1./Extended_Run_2_num, Extended_Run_2_UPT_num*1./Baseline_Run_2_den)
-    print "%-50s : %.4f :\t%.4f :\t%.4f :\t%4f" %("Extended Run 2 OR UPT_6_4_IP1", Extended_Run_2_UPT_dxy1_num*1., Extended_Run_2_UPT_dxy1_num*1./Baseline_Run_2_num, \
-	Extended_Run_2_UPT_dxy1_num*1./Extended_Run_2_num, Extended_Run_2_UPT_dxy1_num*1./Baseline_Run_2_den)
-    print "%-50s : %.4f :\t%.4f :\t%.4f :\t%4f" %("Extended Run 2 OR UPT_15_7 OR UPT_6_4_IP1", UPT_IP1_num*1., UPT_IP1_num*1./Baseline_Run_2_num, \
-	UPT_IP1_num*1./Extended_Run_2_num, UPT_IP1_num*1./Baseline_Run_2_den)
+    print "Dimuons : ", cnt.Baseline_Run_2_den*1.
+    print "Matched dimuons : ", cnt.n_matched_dimus
+    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Baseline run 2 ", cnt.Baseline_Run_2_num, cnt.Baseline_Run_2_num*1./cnt.Baseline_Run_2_num, \
+	cnt.Baseline_Run_2_num*1./cnt.Extended_Run_2_num)
+    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Extended run 2 ", cnt.Extended_Run_2_num*1., cnt.Extended_Run_2_num*1./cnt.Baseline_Run_2_num, \
+	cnt.Extended_Run_2_num*1./cnt.Extended_Run_2_num)
+    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Extended run 2A ", cnt.Extended_Run_2A_num*1., cnt.Extended_Run_2A_num*1./cnt.Baseline_Run_2_num, \
+	cnt.Extended_Run_2A_num*1./cnt.Extended_Run_2_num)
+    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Extended run 2B ", cnt.Extended_Run_2B_num*1., cnt.Extended_Run_2B_num*1./cnt.Baseline_Run_2_num, \
+	cnt.Extended_Run_2B_num*1./cnt.Extended_Run_2_num)
+    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Baseline run 2 + Unconstrained BMTF ", cnt.Baseline_Run_2_UPT_BMTF_num*1., cnt.Baseline_Run_2_UPT_BMTF_num*1./cnt.Baseline_Run_2_num,\
+	cnt.Baseline_Run_2_UPT_BMTF_num*1./cnt.Extended_Run_2_num)
+    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Baseline run 2 + Unconstrained ", cnt.Baseline_Run_2_UPT_num*1., cnt.Baseline_Run_2_UPT_num*1./cnt.Baseline_Run_2_num, \
+	cnt.Baseline_Run_2_UPT_num*1./cnt.Extended_Run_2_num)
+    print "%-50s : %.4f :\t%.4f :\t%.4f" %("Baseline run 2 + Unconstrained + DXY1", cnt.Baseline_Run_2_UPT_dxy1_num*1., cnt.Baseline_Run_2_UPT_dxy1_num*1./cnt.Baseline_Run_2_num,\
+	cnt.Baseline_Run_2_UPT_dxy1_num*1./cnt.Extended_Run_2_num)
+    print "%-50s : %.4f :\t%.4f :\t%.4f :\t%4f" %("Extended Run 2 OR UPT_15_7", cnt.Extended_Run_2_UPT_num*1., cnt.Extended_Run_2_UPT_num*1./cnt.Baseline_Run_2_num, \
+	cnt.Extended_Run_2_UPT_num*1./cnt.Extended_Run_2_num, cnt.Extended_Run_2_UPT_num*1./cnt.Baseline_Run_2_den)
+    print "%-50s : %.4f :\t%.4f :\t%.4f :\t%4f" %("Extended Run 2 OR UPT_6_4_IP1", cnt.Extended_Run_2_UPT_dxy1_num*1., cnt.Extended_Run_2_UPT_dxy1_num*1./cnt.Baseline_Run_2_num, \
+	cnt.Extended_Run_2_UPT_dxy1_num*1./cnt.Extended_Run_2_num, cnt.Extended_Run_2_UPT_dxy1_num*1./cnt.Baseline_Run_2_den)
+    print "%-50s : %.4f :\t%.4f :\t%.4f :\t%4f" %("Extended Run 2 OR UPT_15_7 OR UPT_6_4_IP1", cnt.UPT_IP1_num*1., cnt.UPT_IP1_num*1./cnt.Baseline_Run_2_num, \
+	cnt.UPT_IP1_num*1./cnt.Extended_Run_2_num, cnt.UPT_IP1_num*1./cnt.Baseline_Run_2_den)
 
     print "\n############################################## ##################################\n"
 
-    print "Efficiency debug denom : ", debug_count_00_den
-    print "Efficiency debug 00 numerator : ", debug_count_00_num
-    print "Efficiency debug 10 numerator : ", debug_count_10_num
-    print "Efficiency debug 00 : ", debug_count_00_num*1./debug_count_00_den
-    print "Efficiency debug 10 : ", debug_count_10_num*1./debug_count_00_den
+    print "Efficiency debug denom : ", cnt.debug_count_00_den
+    print "Efficiency debug 00 numerator : ", cnt.debug_count_00_num
+    print "Efficiency debug 10 numerator : ", cnt.debug_count_10_num
+    print "Efficiency debug 00 : ", cnt.debug_count_00_num*1./cnt.debug_count_00_den
+    print "Efficiency debug 10 : ", cnt.debug_count_10_num*1./cnt.debug_count_00_den
+
+def parse_options(args=None):
+    parser = argparse.ArgumentParser(description='L1 efficiencies for displaced muons')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, each running over a group of input files')
+    parser.add_argument('--files-from', help='Text file listing the input files, one per line')
+    parser.add_argument('--max-evt', type=int, help='Number of events to process (overrides MAX_EVT)')
+    parser.add_argument('--partial', help='Write unfinalised histograms and counters to this file and stop (worker mode)')
+    parser.add_argument('--rescan', action='store_true', help='Rescan the input directories instead of loading their manifests')
+    parser.add_argument('--shard', type=L1Parallel.parse_shard, metavar='k/N',
+                        help='Run over shard k (from 0) of N equal ranges of the first MAX_EVT entries and write a partial result')
+    parser.add_argument('--checkpoint', metavar='FILE', help='Save histograms, counters and loop position to FILE every CHECKPOINT_EVT events')
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint in --checkpoint FILE, if there is one')
+    parser.add_argument('--imt', type=int, default=0, metavar='N',
+                        help='Decompress branches with ROOT implicit MT on N threads, 0 for off (see L1ReadBenchmark.py)')
+    parser.add_argument('--incremental', metavar='STATE',
+                        help='Read only input files not yet in the STATE file, in full (MAX_EVT ignored), add them to it and finalise on the totals')
+    parser.add_argument('--merge', nargs='+', metavar='PARTIAL', help='Add up partial results (e.g. of all shards) and finalise, without reading events')
+    parser.add_argument('--events', nargs='+', type=L1EventIndex.parse_event_id, metavar='RUN:LUMI:EVENT',
+                        help='Run over these events only, found through an index of the inputs, and write <output>_events')
+    parser.add_argument('--force', action='store_true', help='Rerun even if the output of the same inputs, configuration and code exists; with --merge, merge an incomplete shard set')
+    opts = parser.parse_args(args)
+    if opts.resume and not opts.checkpoint: parser.error('--resume needs --checkpoint FILE')
+    if opts.incremental and (opts.workers > 1 or opts.partial or opts.shard or opts.checkpoint or opts.merge):
+        parser.error('--incremental runs serially over whole files')
+    if opts.events and (opts.workers > 1 or opts.partial or opts.shard or opts.checkpoint or opts.merge or opts.incremental):
+        parser.error('--events runs serially over the events given')
+    if opts.incremental: opts.rescan = True	## new files only show up in a fresh manifest
+    return opts
 
 if __name__ == '__main__':
-    main()
+    opts = parse_options()
+    if opts.max_evt is not None: MAX_EVT = opts.max_evt
+    main(opts)
 
 
 
@@ -0,0 +1,167 @@
+## **************************************************************** ##
+##  Booked histograms and counters, saved and merged exactly        ##
+## **************************************************************** ##
+##
+##  A partial result is a ROOT file holding every histogram booked in
+##  the output directory, unscaled and undivided, plus the counters as
+##  JSON in a TNamed.  Adding partials bin by bin and summing counters
+##  reproduces a serial run, so normalisation and efficiencies are only
+##  computed once, after the merge.  A --shard k/N partial also records
+##  its shard, and shard partials are only merged as a complete set,
+##  each of 0 .. N-1 exactly once.
+##
+##  A checkpoint is the same content plus the event loop cursor, saved
+##  to a separate file during the loop and read back into the booked
+##  histograms by --resume.
+##
+##  An incremental state is a checkpoint whose cursor lists the input
+##  files, with size and mtime, that contributed to it: --incremental
+##  reads only the files not listed, adds them in and saves the state
+##  again before finalising.  Listed files that changed or are no longer
+##  among the inputs stop the run: their events are in the totals.
+
+import os
+import json
+
+from L1Root import R
+
+COUNTERS_KEY = 'counters'
+CURSOR_KEY   = 'cursor'
+SHARD_KEY    = 'shard'
+
+
+class Counters(dict):
+    """Event and object counters, read and written as attributes (cnt.GenMuCount += 1)."""
+
+    def __getattr__(self, name):
+        try: return self[name]
+        except KeyError: raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def add(self, other):
+        for name, value in other.items(): self[name] = self.get(name, 0) + value
+
+
+def booked_histograms(directory):
+    """Histograms attached to a directory, in booking order."""
+    return [h for h in directory.GetList() if h.InheritsFrom('TH1')]
+
+
+def write_partial(directory, counters, shard=None):
+    """Write the booked histograms and the counters into directory, and shard (k, N) of a --shard job."""
+    directory.cd()
+    for h in booked_histograms(directory): h.Write()
+    R.TNamed(COUNTERS_KEY, json.dumps(counters)).Write()
+    if shard: R.TNamed(SHARD_KEY, json.dumps(list(shard))).Write()
+
+
+def read_shard(path):
+    """(k, N) of a partial result written by a --shard job, None for other partials."""
+    f = R.TFile.Open(path)
+    if not f or f.IsZombie(): raise IOError('Cannot open partial result %s' % path)
+    named = f.Get(SHARD_KEY)
+    shard = tuple(json.loads(named.GetTitle())) if named else None
+    f.Close()
+    return shard
+
+
+def check_shards(shards):
+    """Problems of a set of partials with shards [(k, N) or None], [] if it is complete: every shard once, or none."""
+    if all(s is None for s in shards): return []
+    if any(s is None for s in shards): return ['shard and non-shard partials mixed']
+    problems = []
+    counts = set(n for k, n in shards)
+    if len(counts) > 1: return ['shards of different splits: %s' % ', '.join('%d/%d' % s for s in shards)]
+    n = counts.pop()
+    ks = [k for k, n_ in shards]
+    missing = [k for k in range(n) if k not in ks]
+    duplicated = sorted(set(k for k in ks if ks.count(k) > 1))
+    if missing: problems.append('missing shards %s of %d' % (', '.join(str(k) for k in missing), n))
+    if duplicated: problems.append('duplicated shards %s of %d' % (', '.join(str(k) for k in duplicated), n))
+    return problems
+
+
+def merge_partials(paths, directory, force=False):
+    """Add the partial results into the histograms booked in directory and return the summed counters.
+
+    Shard partials that are not a complete set raise RuntimeError, unless force.
+    """
+    problems = check_shards([read_shard(path) for path in paths])
+    if problems and not force: raise RuntimeError('Not merging the partial results: %s (--force to merge anyway)' % '; '.join(problems))
+    if problems: print('Merging anyway: %s' % '; '.join(problems))
+    hists = booked_histograms(directory)
+    total = Counters()
+    for path in paths:
+        f = R.TFile.Open(path)
+        if not f or f.IsZombie(): raise IOError('Cannot open partial result %s' % path)
+        for h in hists:
+            p = f.Get(h.GetName())
+            if not p: raise IOError('Histogram %s missing from %s' % (h.GetName(), path))
+            h.Add(p)
+        total.add(json.loads(f.Get(COUNTERS_KEY).GetTitle()))
+        f.Close()
+    directory.cd()
+    return total
+
+
+def write_checkpoint(path, directory, counters, cursor):
+    """Save the booked histograms of directory, the counters and the loop cursor to path.
+
+    The previous checkpoint is only replaced once the new one is complete.
+    """
+    tmp = path + '.tmp'
+    f = R.TFile(tmp, 'recreate')
+    for h in booked_histograms(directory): f.WriteTObject(h, h.GetName())
+    f.WriteTObject(R.TNamed(COUNTERS_KEY, json.dumps(counters)), COUNTERS_KEY)
+    f.WriteTObject(R.TNamed(CURSOR_KEY, json.dumps(cursor)), CURSOR_KEY)
+    f.Close()
+    os.rename(tmp, path)
+    directory.cd()
+
+
+def read_cursor(path):
+    """Loop cursor of a checkpoint, without touching any histogram."""
+    f = R.TFile.Open(path)
+    if not f or f.IsZombie(): raise IOError('Cannot open checkpoint %s' % path)
+    cursor = json.loads(f.Get(CURSOR_KEY).GetTitle())
+    f.Close()
+    return cursor
+
+
+def file_stamps(paths):
+    """[path, size, mtime] of each input file, size and mtime None where it cannot be stat'ed."""
+    stamps = []
+    for path in paths:
+        try: st = os.stat(path)
+        except OSError: stamps.append([path, None, None]); continue
+        stamps.append([path, st.st_size, int(st.st_mtime)])
+    return stamps
+
+
+def split_new(stamps, done):
+    """(new, changed, missing): stamps of files not in done, of files in done whose size or mtime differ
+    now, and the done stamps of files no longer in stamps."""
+    paths = set(s[0] for s in stamps)
+    missing = [s for s in done if s[0] not in paths]
+    done = dict((s[0], s) for s in done)
+    new = [s for s in stamps if s[0] not in done]
+    changed = [s for s in stamps if s[0] in done and list(done[s[0]]) != list(s)]
+    return new, changed, missing
+
+
+def read_checkpoint(path, directory):
+    """Set the histograms booked in directory to their checkpointed content; return (counters, cursor)."""
+    f = R.TFile.Open(path)
+    if not f or f.IsZombie(): raise IOError('Cannot open checkpoint %s' % path)
+    for h in booked_histograms(directory):
+        p = f.Get(h.GetName())
+        if not p: raise IOError('Histogram %s missing from %s' % (h.GetName(), path))
+        h.Reset()
+        h.Add(p)
+    counters = Counters(json.loads(f.Get(COUNTERS_KEY).GetTitle()))
+    cursor = json.loads(f.Get(CURSOR_KEY).GetTitle())
+    f.Close()
+    directory.cd()
+    return counters, cursor
@@ -0,0 +1,68 @@
+## **************************************************************** ##
+##  Leaves read by each analysis stage, and branch pruning          ##
+## **************************************************************** ##
+##
+##  Each stage declares the leaves it reads, per top-level branch.  A
+##  script lists its stages; the union is all that gets enabled with
+##  SetBranchStatus, so GetEntry no longer decompresses every leaf of
+##  the bound DataFormat objects.  Add a leaf here when a stage starts
+##  reading it, otherwise it stays disabled and keeps its default value.
+
+## stage : {branch : [leaves]}
+STAGE_LEAVES = {
+    'event'             : {'Event'              : ['run', 'lumi', 'event']},
+
+    ## Gen muons from the LLP, acceptance and extrapolation to the muon stations
+    'gen_acceptance'    : {'Generator'          : ['nPart', 'partId', 'partParent', 'partPt', 'partEta', 'partPhi',
+                                                   'partVx', 'partVy', 'partVz']},
+
+    ## BX = 0 selection and removal of duplicate (same eta, phi) L1 muons
+    'ghost_cleaning'    : {'L1UpgradeKBmtfMuon' : ['nTfMuons', 'tfMuonBx', 'tfMuonHwPt', 'tfMuonHwEta', 'tfMuonGlobalPhi'],
+                           'L1UpgradeEmtfMuon'  : ['nTfMuons', 'tfMuonBx', 'tfMuonHwPt', 'tfMuonHwPtUnconstrained',
+                                                   'tfMuonHwEta', 'tfMuonGlobalPhi', 'tfMuonHwQual'],
+                           'L1Upgrade'          : ['nMuons', 'muonBx', 'muonEt', 'muonEtUnconstrained', 'muonEta', 'muonPhi']},
+
+    ## dR matching of gen muons to uGT, kBMTF and EMTF muons
+    'matching'          : {'Generator'          : ['partPt'],
+                           'L1UpgradeKBmtfMuon' : ['tfMuonHwPtUnconstrained', 'tfMuonHwEta', 'tfMuonGlobalPhi'],
+                           'L1UpgradeEmtfMuon'  : ['tfMuonHwPtUnconstrained', 'tfMuonHwEta', 'tfMuonGlobalPhi'],
+                           'L1Upgrade'          : ['muonEtUnconstrained', 'muonEta', 'muonPhi']},
+
+    ## (U)PT resolution of matched muons
+    'resolution'        : {'Generator'          : ['partPt', 'partPhi', 'partVx', 'partVy'],
+                           'L1Upgrade'          : ['muonEt', 'muonEtUnconstrained', 'muonEta', 'muonDxy']},
+
+    ## Dimuon seed efficiencies on matched gen dimuons
+    'seed_evaluation'   : {'Generator'          : ['partPt', 'partEta', 'partPhi', 'partVx', 'partVy', 'partVz'],
+                           'L1Upgrade'          : ['muonQual', 'muonEt', 'muonEtUnconstrained', 'muonDxy', 'muonChg',
+                                                   'muonEta', 'muonPhi']},
+
+    ## Seed rates on BX = 0 uGT muons, eta/phi at the vertex
+    'rate_seeds'        : {'L1Upgrade'          : ['nMuons', 'muonBx', 'muonQual', 'muonEt', 'muonEtUnconstrained',
+                                                   'muonEtaAtVtx', 'muonPhiAtVtx', 'muonChg', 'muonDxy']},
+
+    ## uGT to EMTF matching and EMTF single muon rate vs L1 dxy
+    'emtf_rate'         : {'L1Upgrade'          : ['muonEt', 'muonEtaAtVtx', 'muonPhiAtVtx'],
+                           'L1UpgradeEmtfMuon'  : ['nTfMuons', 'tfMuonBx', 'tfMuonHwPt', 'tfMuonHwEta', 'tfMuonGlobalPhi',
+                                                   'tfMuonHwDxy', 'tfMuonHwQual']},
+}
+
+
+def active_leaves(stages):
+    """Union of the leaves read by the given stages, as {branch : sorted leaves}."""
+    active = {}
+    for stage in stages:
+        for branch, leaves in STAGE_LEAVES[stage].items():
+            active.setdefault(branch, set()).update(leaves)
+    return dict((branch, sorted(leaves)) for branch, leaves in active.items())
+
+
+def enable_only(trees, active):
+    """Disable every branch of the trees, then enable the active leaves where they live."""
+    for tree in trees:
+        tree.SetBranchStatus('*', 0)
+        branches = tree.GetListOfBranches()
+        for branch, leaves in active.items():
+            if not branches.FindObject(branch): continue
+            ## Enabling a sub-branch enables its mother branch too
+            for leaf in leaves: tree.SetBranchStatus('%s.%s' % (branch, leaf), 1)
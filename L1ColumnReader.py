@@ -0,0 +1,294 @@
+## **************************************************************** ##
+##  Chunked columnar reader for the L1Ntuple trees                  ##
+## **************************************************************** ##
+##
+##  Loads the needed leaves of the L1Ntuple collections in chunks of
+##  N events as flat NumPy arrays plus per-event offsets.  Every leaf
+##  costs one TTree::Draw per chunk instead of one PyROOT call per
+##  element per event.
+##
+##  Whole-chunk stages use reader.chunks(); the legacy per-event loop
+##  binds reader.view(name) once, in place of the L1Analysis
+##  DataFormat objects, and calls reader.GetEntry(jEvt) like a TChain.
+##  Chunks never cross a file boundary of the underlying FriendChain.
+
+import numpy
+
+## name : (tree, branch, count leaf, [(leaf, dtype), ...])
+## A count leaf of None marks a collection with one value per event.
+COLLECTIONS = {
+    'Evt'  : ('l1EventTree/L1EventTree', 'Event', None,
+              [('run', 'u4'), ('lumi', 'u4'), ('event', 'u8')]),
+    'Gen'  : ('l1GeneratorTree/L1GenTree', 'Generator', 'nPart',
+              [('partId', 'i4'), ('partParent', 'i4'), ('partPt', 'f4'), ('partEta', 'f4'),
+               ('partPhi', 'f4'), ('partVx', 'f4'), ('partVy', 'f4'), ('partVz', 'f4')]),
+    'EmuK' : ('l1UpgradeTfMuonEmuTree/L1UpgradeTfMuonTree', 'L1UpgradeKBmtfMuon', 'nTfMuons',
+              [('tfMuonBx', 'i2'), ('tfMuonHwPt', 'i2'), ('tfMuonHwPtUnconstrained', 'i2'), ('tfMuonHwDxy', 'i2'),
+               ('tfMuonHwEta', 'i2'), ('tfMuonGlobalPhi', 'i2'), ('tfMuonHwQual', 'i2')]),
+    'EmuE' : ('l1UpgradeTfMuonEmuTree/L1UpgradeTfMuonTree', 'L1UpgradeEmtfMuon', 'nTfMuons',
+              [('tfMuonBx', 'i2'), ('tfMuonHwPt', 'i2'), ('tfMuonHwPtUnconstrained', 'i2'), ('tfMuonHwDxy', 'i2'),
+               ('tfMuonHwEta', 'i2'), ('tfMuonGlobalPhi', 'i2'), ('tfMuonHwQual', 'i2')]),
+    'uGT'  : ('l1UpgradeEmuTree/L1UpgradeTree', 'L1Upgrade', 'nMuons',
+              [('muonBx', 'i2'), ('muonQual', 'u2'), ('muonChg', 'i2'), ('muonDxy', 'i2'),
+               ('muonEt', 'f4'), ('muonEtUnconstrained', 'f4'), ('muonEta', 'f4'), ('muonPhi', 'f4'),
+               ('muonEtaAtVtx', 'f4'), ('muonPhiAtVtx', 'f4')]),
+}
+
+DRAW_MAX = 4	## TTree::Draw returns at most GetV1..GetV4 per call
+
+
+def buffer_view(buf, n, dtype):
+    """NumPy array over the first n elements of a PyROOT or cppyy buffer, without copying."""
+    if n == 0: return numpy.zeros(0, dtype=dtype)
+    if hasattr(buf, 'SetSize'): buf.SetSize(n)		## PyROOT buffer
+    elif hasattr(buf, 'reshape'):			## cppyy LowLevelView
+        shaped = buf.reshape((n,))
+        if shaped is not None: buf = shaped
+    return numpy.frombuffer(buf, dtype=dtype, count=n)
+
+
+def _to_array(buf, n):
+    ## The Draw buffers are reused by the next Draw, so copy them out
+    return buffer_view(buf, n, numpy.float64).copy()
+
+
+def draw_columns(tree, exprs, first, n, rows):
+    """Evaluate expressions over entries [first, first+n) and return one float64 array each."""
+    tree.SetEstimate(rows + 1)
+    getters = [tree.GetV1, tree.GetV2, tree.GetV3, tree.GetV4]
+    out = []
+    for k in range(0, len(exprs), DRAW_MAX):
+        group = exprs[k:k+DRAW_MAX]
+        selected = tree.Draw(':'.join(group), '', 'goff', n, first)
+        if selected < 0 or selected != rows:
+            raise IOError('TTree::Draw of %s returned %d rows, expected %d' % (':'.join(group), selected, rows))
+        for g in range(len(group)):
+            out.append(_to_array(getters[g](), selected))
+    return out
+
+
+class Collection(object):
+    """Jagged columns of one collection within a chunk: flat arrays plus per-event offsets."""
+
+    def __init__(self, offsets, arrays):
+        self.offsets = offsets
+        self.arrays = arrays
+
+    @property
+    def counts(self):
+        return numpy.diff(self.offsets)
+
+    def __getitem__(self, leaf):
+        return self.arrays[leaf]
+
+    def event(self, k, leaf):
+        return self.arrays[leaf][self.offsets[k]:self.offsets[k+1]]
+
+
+class Chunk(object):
+    """Events [start, start+n) of the input, one Collection per requested name."""
+
+    def __init__(self, start, n, collections):
+        self.start = start
+        self.n = n
+        self.collections = collections
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+
+def concatenate(colls):
+    """One Collection from consecutive ones."""
+    offsets = [numpy.zeros(1, dtype=numpy.int64)]
+    for c in colls: offsets.append(c.offsets[1:] - c.offsets[0] + offsets[-1][-1])
+    arrays = dict((leaf, numpy.concatenate([c.arrays[leaf] for c in colls])) for leaf in colls[0].arrays)
+    return Collection(numpy.concatenate(offsets), arrays)
+
+
+def empty_collection(name, collections=COLLECTIONS):
+    tree_name, branch, count, leaves = collections[name]
+    return Collection(numpy.zeros(1, dtype=numpy.int64),
+                      dict((leaf, numpy.zeros(0, dtype=dtype)) for leaf, dtype in leaves))
+
+
+def trees_for(names, collections=COLLECTIONS):
+    """Tree paths holding the given collections, in first-seen order."""
+    trees = []
+    for name in names:
+        if collections[name][0] not in trees: trees.append(collections[name][0])
+    return trees
+
+
+def active_for(names, collections=COLLECTIONS):
+    """{branch : leaves} to enable for reading the given collections, count leaves included."""
+    active = {}
+    for name in names:
+        tree_name, branch, count, leaves = collections[name]
+        active.setdefault(branch, set()).update([leaf for leaf, dtype in leaves] + ([count] if count else []))
+    return dict((branch, sorted(leaves)) for branch, leaves in active.items())
+
+
+def read_chunk(tree, names, first, n, collections=COLLECTIONS, active=None):
+    """Read local entries [first, first+n) of the given collections from a tree with its friends.
+
+    With active = {branch : leaves}, only those leaves of each collection are read.
+    """
+    out = {}
+    for name in names:
+        tree_name, branch, count, leaves = collections[name]
+        if active is not None:
+            leaves = [(leaf, dtype) for leaf, dtype in leaves if leaf in active.get(branch, ())]
+        exprs = ['%s.%s' % (branch, leaf) for leaf, dtype in leaves]
+
+        if count is None:
+            counts = numpy.ones(n, dtype=numpy.int64)
+        else:
+            counts = draw_columns(tree, ['%s.%s' % (branch, count)], first, n, n)[0].astype(numpy.int64)
+
+        offsets = numpy.zeros(n+1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=offsets[1:])
+
+        values = draw_columns(tree, exprs, first, n, int(offsets[-1]))
+        arrays = {}
+        for (leaf, dtype), v in zip(leaves, values):
+            arrays[leaf] = v.astype(dtype)
+        out[name] = Collection(offsets, arrays)
+
+    return Chunk(first, n, out)
+
+
+class EventView(object):
+    """Per-event stand-in for an L1Analysis DataFormat object.
+
+    Attribute access returns the current event's values as Python lists (scalars
+    for one-value-per-event collections), so the legacy loop body runs unchanged.
+    """
+
+    def __init__(self, reader, name, count, scalar):
+        self.__dict__['_reader'] = reader
+        self.__dict__['_name'] = name
+        self.__dict__['_count'] = count
+        self.__dict__['_scalar'] = scalar
+        self.__dict__['_cache'] = {}
+
+    def _reset(self):
+        self.__dict__['_cache'] = {}
+
+    def array(self, leaf):
+        """NumPy slice of one leaf for the current event (no copy)."""
+        r = self._reader
+        return r.chunk[self._name].event(r.k, leaf)
+
+    def window(self):
+        """(Collection of the current chunk, position of the current event in it), for work done once per chunk."""
+        r = self._reader
+        return r.chunk[self._name], r.k
+
+    def __getattr__(self, leaf):
+        cache = self.__dict__['_cache']
+        if leaf in cache: return cache[leaf]
+        r = self.__dict__['_reader']
+        if r.chunk is None: raise AttributeError('%s: no entry loaded yet' % self._name)
+        coll = r.chunk[self._name]
+        if leaf == self._count:
+            value = int(coll.offsets[r.k+1] - coll.offsets[r.k])
+        elif leaf not in coll.arrays:
+            raise AttributeError('%s.%s is not read by the columnar reader' % (self._name, leaf))
+        elif self._scalar:
+            value = coll.arrays[leaf][r.k].item()
+        else:
+            value = coll.event(r.k, leaf).tolist()
+        cache[leaf] = value
+        return value
+
+
+class ColumnReader(object):
+    """Chunked reader over a FriendChain, with a TChain-like GetEntry cursor for per-event loops."""
+
+    def __init__(self, chain, names, chunk_size=10000, collections=COLLECTIONS):
+        self.chain = chain
+        self.active = chain.active	## leaves enabled on the chain, None for all
+        self.names = list(names)
+        self.chunk_size = chunk_size
+        self.collections = collections
+        self.views = {}
+        self.chunk = None
+        self.k = 0
+
+    def GetEntries(self):
+        return self.chain.GetEntries()
+
+    def read(self, first, n):
+        """Chunk of up to n global entries from first, clipped at the end of its file."""
+        ifile, local = self.chain.locate(first)
+        file_first, file_last = self.chain.file_range(ifile)
+        n = min(n, file_last - first)
+        c = read_chunk(self.chain.open(ifile), self.names, local, n, self.collections, self.active)
+        c.start = first
+        return c
+
+    def chunks(self, first=0, last=None):
+        """Yield consecutive chunks covering global entries [first, last)."""
+        if last is None: last = self.GetEntries()
+        start = first
+        while start < last:
+            c = self.read(start, min(self.chunk_size, last - start))
+            yield c
+            start += c.n
+
+    def view(self, name):
+        if name not in self.views:
+            tree_name, branch, count, leaves = self.collections[name]
+            self.views[name] = EventView(self, name, count, count is None)
+        return self.views[name]
+
+    def GetEntry(self, entry):
+        c = self.chunk
+        if c is None or entry < c.start or entry >= c.start + c.n:
+            self.chunk = c = self.read(entry, self.chunk_size)
+        self.k = entry - c.start
+        for v in self.views.values(): v._reset()
+        return 1
+
+
+class ArrayReader(ColumnReader):
+    """ColumnReader over whole-file arrays, e.g. from a local cache.
+
+    Subclasses give the entries of each input file and load(ifile), which
+    returns {name : Collection} for all entries of that file.
+    """
+
+    def __init__(self, entries, names, chunk_size=10000, collections=COLLECTIONS):
+        self.chain = None
+        self.active = None
+        self.names = list(names)
+        self.chunk_size = chunk_size
+        self.collections = collections
+        self.views = {}
+        self.chunk = None
+        self.k = 0
+        self._offsets = [0]
+        for n in entries: self._offsets.append(self._offsets[-1] + n)
+        self._ifile, self._colls = -1, None
+
+    def load(self, ifile):
+        raise NotImplementedError
+
+    def GetEntries(self):
+        return self._offsets[-1]
+
+    def read(self, first, n):
+        """Chunk of up to n global entries from first, clipped at the end of its file."""
+        ifile = 0
+        while first >= self._offsets[ifile+1]: ifile += 1
+        if ifile != self._ifile:
+            self._ifile, self._colls = ifile, self.load(ifile)
+        local = first - self._offsets[ifile]
+        n = min(n, self._offsets[ifile+1] - first)
+        out = {}
+        for name in self.names:
+            coll = self._colls[name]
+            offsets = coll.offsets[local:local+n+1]
+            arrays = dict((leaf, a[offsets[0]:offsets[-1]]) for leaf, a in coll.arrays.items())
+            out[name] = Collection(offsets - offsets[0], arrays)
+        return Chunk(first, n, out)
@@ -0,0 +1,122 @@
+## **************************************************************** ##
+##  Memory-mapped store of decoded L1Ntuple columns                 ##
+## **************************************************************** ##
+##
+##  The full columns of each input file (gen kinematics and vertices,
+##  TF muon hardware words, uGT muon fields, ...) are decoded once and
+##  saved as .npy files, one per leaf plus the per-event offsets:
+##
+##      <store>/<key>/<name>.json             entries and leaves, written last
+##      <store>/<key>/<name>.offsets.npy
+##      <store>/<key>/<name>.<leaf>.npy
+##
+##  The key hashes the decoder version with the size and the first and
+##  last MB of the input file, so a copy of the same file finds the
+##  same columns.  Columns are re-opened with numpy.load(mmap_mode='r'),
+##  without copying: concurrent studies on one node share the page
+##  cache instead of each decompressing the same ROOT baskets.
+##
+##  Unlike a skim, nothing is selected: every leaf of COLLECTIONS is kept.
+
+import os
+import hashlib, json
+
+import numpy
+
+import L1ColumnReader
+import L1FriendChain
+import L1TreeCache
+
+DECODER_VERSION = 1		## bump when the decoding or COLLECTIONS dtypes change
+SAMPLE_BYTES    = 1024*1024	## bytes hashed at each end of the input file
+
+
+def content_key(source):
+    """Hash of the decoder version, the size and both ends of source."""
+    size = os.path.getsize(source)
+    h = hashlib.sha1(('%d:%d:' % (DECODER_VERSION, size)).encode('utf-8'))
+    with open(source, 'rb') as f:
+        h.update(f.read(SAMPLE_BYTES))
+        if size > SAMPLE_BYTES:
+            f.seek(max(size - SAMPLE_BYTES, SAMPLE_BYTES))
+            h.update(f.read(SAMPLE_BYTES))
+    return h.hexdigest()[:24]
+
+
+def has_columns(path, name):
+    return os.path.exists(os.path.join(path, name + '.json'))
+
+
+def _save(path, array):
+    ## Written under another name and renamed, so readers never see a partial file
+    tmp = '%s.%d.tmp.npy' % (path[:-len('.npy')], os.getpid())
+    numpy.save(tmp, array)
+    os.rename(tmp, path)
+
+
+def write_columns(path, name, coll, entries):
+    if not os.path.exists(path):
+        try: os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path): raise
+    _save(os.path.join(path, name + '.offsets.npy'), coll.offsets.astype(numpy.int64))
+    for leaf, array in coll.arrays.items():
+        _save(os.path.join(path, '%s.%s.npy' % (name, leaf)), array)
+    meta = {'version' : DECODER_VERSION, 'entries' : entries,
+            'leaves' : dict((leaf, a.dtype.str) for leaf, a in coll.arrays.items())}
+    tmp = os.path.join(path, '%s.json.%d.tmp' % (name, os.getpid()))
+    with open(tmp, 'w') as f: json.dump(meta, f, indent=1, sort_keys=True)
+    os.rename(tmp, os.path.join(path, name + '.json'))
+
+
+def map_columns(path, name):
+    """Collection of all entries, its arrays memory-mapped read-only."""
+    with open(os.path.join(path, name + '.json')) as f: meta = json.load(f)
+    offsets = numpy.load(os.path.join(path, name + '.offsets.npy'), mmap_mode='r')
+    arrays = dict((leaf, numpy.load(os.path.join(path, '%s.%s.npy' % (name, leaf)), mmap_mode='r'))
+                  for leaf in meta['leaves'])
+    return L1ColumnReader.Collection(offsets, arrays)
+
+
+def entries_of(path, name):
+    with open(os.path.join(path, name + '.json')) as f: return json.load(f)['entries']
+
+
+def decode_file(source, path, names, chunk_size=10000):
+    """Decode all leaves of the given collections of source and save them in path."""
+    chain = L1FriendChain.FriendChain([source], L1ColumnReader.trees_for(names))
+    chain.SetActiveLeaves(L1ColumnReader.active_for(names))
+    chain.SetCache(L1TreeCache.CACHE_SIZE)
+    reader = L1ColumnReader.ColumnReader(chain, names, chunk_size)
+    parts = dict((name, []) for name in names)
+    for c in reader.chunks():
+        for name in names: parts[name].append(c[name])
+    entries = chain.GetEntries()
+    chain.Close()
+    for name in names:
+        coll = L1ColumnReader.concatenate(parts[name]) if parts[name] else L1ColumnReader.empty_collection(name)
+        write_columns(path, name, coll, entries)
+
+
+def store_files(file_names, store_dir, names, chunk_size=10000):
+    """Store paths of the input files, in order, decoding the collections not stored yet."""
+    paths = []
+    for source in file_names:
+        path = os.path.join(store_dir, content_key(source))
+        missing = [name for name in names if not has_columns(path, name)]
+        if missing:
+            print('Decoding %s of %s -> %s' % (','.join(missing), source, path))
+            decode_file(source, path, missing, chunk_size)
+        paths.append(path)
+    return paths
+
+
+class StoreReader(L1ColumnReader.ArrayReader):
+    """Chunks and per-event views over memory-mapped stored columns, one store path per input file."""
+
+    def __init__(self, paths, names, chunk_size=10000, collections=L1ColumnReader.COLLECTIONS):
+        self.paths = list(paths)
+        L1ColumnReader.ArrayReader.__init__(self, [entries_of(p, names[0]) for p in self.paths], names, chunk_size, collections)
+
+    def load(self, ifile):
+        return dict((name, map_columns(self.paths[ifile], name)) for name in self.names)
@@ -0,0 +1,156 @@
+## **************************************************************** ##
+##  (run, lumi, event) index of the input files, for single events  ##
+## **************************************************************** ##
+##
+##  Looking at one event (a mismatch_evt, an odd duplicate_GMT_mus
+##  entry) should not mean running the whole loop until it comes by.
+##  build() reads only run, lumi and event of every input file, once,
+##  and saves per event its file and entry, sorted by (run, lumi,
+##  event), as .npz next to the manifests.  locate() then finds any
+##  event by binary search, and the scripts' --events mode runs the
+##  loop over just those entries.
+##
+##      python L1EventIndex.py --files-from files.txt 1:2:3 1:2:7
+
+import os
+import argparse, hashlib, json
+
+import numpy
+
+from L1Root import R
+
+import L1Accumulators
+import L1ColumnReader
+import L1FriendChain
+import L1UprootReader
+
+INDEX_VERSION = 1
+
+
+def parse_event_id(text):
+    """'run:lumi:event' -> (run, lumi, event)."""
+    try: run, lumi, event = [int(x) for x in text.split(':')]
+    except ValueError: raise argparse.ArgumentTypeError('expected run:lumi:event, got %r' % text)
+    return run, lumi, event
+
+
+def index_path(index_dir, file_names):
+    """Index file of a list of input files: a hash of the paths, in order."""
+    key = hashlib.md5('\n'.join(os.path.abspath(p) for p in file_names).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(index_dir, 'events_%s.npz' % key)
+
+
+def read_ids(path, chunk_size=100000):
+    """{'run', 'lumi', 'event'} arrays of all entries of one file, with uproot where there is no ROOT."""
+    if not R.available():
+        coll = L1UprootReader.read_file(path, ['Evt'])['Evt']
+    else:
+        chain = L1FriendChain.FriendChain([path], [L1FriendChain.EVT_TREE])
+        chain.SetActiveLeaves(L1ColumnReader.active_for(['Evt']))
+        parts = [c['Evt'] for c in L1ColumnReader.ColumnReader(chain, ['Evt'], chunk_size).chunks()]
+        chain.Close()
+        coll = L1ColumnReader.concatenate(parts) if parts else L1ColumnReader.empty_collection('Evt')
+    return dict((leaf, coll[leaf]) for leaf in ('run', 'lumi', 'event'))
+
+
+def _run_lumi(run, lumi):
+    return (numpy.asarray(run, dtype=numpy.uint64) << numpy.uint64(32)) | numpy.asarray(lumi, dtype=numpy.uint64)
+
+
+def build(file_names):
+    """Index of the entries of file_names: {'run_lumi', 'event', 'ifile', 'entry'} sorted by (run, lumi, event), plus 'meta'."""
+    ids = [read_ids(p) for p in file_names]
+    entries = [len(i['event']) for i in ids]
+    run_lumi = numpy.concatenate([_run_lumi(i['run'], i['lumi']) for i in ids] or [numpy.zeros(0, numpy.uint64)])
+    event = numpy.concatenate([i['event'].astype(numpy.uint64) for i in ids] or [numpy.zeros(0, numpy.uint64)])
+    ifile = numpy.concatenate([numpy.full(n, k, dtype=numpy.int32) for k, n in enumerate(entries)] or [numpy.zeros(0, numpy.int32)])
+    entry = numpy.concatenate([numpy.arange(n, dtype=numpy.int64) for n in entries] or [numpy.zeros(0, numpy.int64)])
+    order = numpy.lexsort((event, run_lumi))
+    meta = {'version' : INDEX_VERSION, 'files' : list(file_names), 'entries' : entries,
+            'stamps' : L1Accumulators.file_stamps(file_names)}
+    return {'run_lumi' : run_lumi[order], 'event' : event[order], 'ifile' : ifile[order], 'entry' : entry[order], 'meta' : meta}
+
+
+def _make_dir(directory):
+    if directory and not os.path.exists(directory):
+        try: os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory): raise
+
+
+def save(index, path):
+    _make_dir(os.path.dirname(path))
+    arrays = dict((k, v) for k, v in index.items() if k != 'meta')
+    with open(path + '.tmp', 'wb') as f: numpy.savez(f, meta=numpy.array(json.dumps(index['meta'])), **arrays)
+    os.rename(path + '.tmp', path)
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        data = numpy.load(f)
+        index = dict((k, data[k]) for k in data.files if k != 'meta')
+        index['meta'] = json.loads(str(data['meta']))
+    return index
+
+
+def index_for(file_names, index_dir, rebuild=False):
+    """Saved index of file_names, built first if missing, older than this format, or any file changed since."""
+    _make_dir(index_dir)
+    path = index_path(index_dir, file_names)
+    if not rebuild and os.path.exists(path):
+        index = load(path)
+        meta = index['meta']
+        if meta['version'] == INDEX_VERSION and meta['files'] == list(file_names) \
+           and meta['stamps'] == L1Accumulators.file_stamps(file_names):
+            return index
+    print('Indexing %d files' % len(file_names))
+    index = build(file_names)
+    save(index, path)
+    return index
+
+
+def locate(index, ids):
+    """[(file number, entry)] of each (run, lumi, event) in ids; KeyError for the ones not in the index."""
+    out, missing = [], []
+    for run, lumi, event in ids:
+        rl = _run_lumi(run, lumi)
+        lo = numpy.searchsorted(index['run_lumi'], rl, 'left')
+        hi = numpy.searchsorted(index['run_lumi'], rl, 'right')
+        k = lo + numpy.searchsorted(index['event'][lo:hi], numpy.uint64(event))
+        if k < hi and index['event'][k] == numpy.uint64(event): out.append((int(index['ifile'][k]), int(index['entry'][k])))
+        else: missing.append('%d:%d:%d' % (run, lumi, event))
+    if missing: raise KeyError('Events not in the input files: %s' % ', '.join(missing))
+    return out
+
+
+def select(index, ids):
+    """(files, entries per file, global entries) of a chain over just the files holding ids.
+
+    The global entries are in chain order, each event once, as the loop reads them.
+    """
+    found = sorted(set(locate(index, ids)))
+    kept = sorted(set(k for k, entry in found))
+    meta = index['meta']
+    first, n = {}, 0
+    for k in kept: first[k], n = n, n + meta['entries'][k]
+    return ([str(meta['files'][k]) for k in kept], [meta['entries'][k] for k in kept],
+            [first[k] + entry for k, entry in found])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find events by (run, lumi, event) in L1Ntuple files')
+    parser.add_argument('events', nargs='*', type=parse_event_id, metavar='RUN:LUMI:EVENT', help='Events to locate')
+    parser.add_argument('--files-from', required=True, help='Text file listing the input files, one per line')
+    parser.add_argument('--index-dir', default='manifests/', help='Where indexes are saved (default %(default)s)')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index even if it is up to date')
+    opts = parser.parse_args()
+
+    file_names = [l.strip() for l in open(opts.files_from) if l.strip()]
+    index = index_for(file_names, opts.index_dir, opts.rebuild)
+    print('%d events in %d files' % (len(index['event']), len(file_names)))
+    for (run, lumi, event), (k, entry) in zip(opts.events, locate(index, opts.events)):
+        print('%d:%d:%d  %s  entry %d' % (run, lumi, event, file_names[k], entry))
+
+
+if __name__ == '__main__':
+    main()
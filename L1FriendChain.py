@@ -0,0 +1,148 @@
+## **************************************************************** ##
+##  One chain over the L1Ntuple trees, joined as friends per file   ##
+## **************************************************************** ##
+##
+##  Replaces the per-collection TChains (chains['Evt'], ['EmuK'], ...)
+##  that each re-open every input file.  Here each file is opened once,
+##  the first tree gets the others attached as friends, and a single
+##  GetEntry(jEvt) fills every bound collection.
+
+from L1Root import R
+
+import L1Branches
+import L1TreeCache
+
+EVT_TREE   = 'l1EventTree/L1EventTree'
+TFMU_TREE  = 'l1UpgradeTfMuonEmuTree/L1UpgradeTfMuonTree'	## L1UpgradeKBmtfMuon, L1UpgradeEmtfMuon
+UGT_TREE   = 'l1UpgradeEmuTree/L1UpgradeTree'
+GEN_TREE   = 'l1GeneratorTree/L1GenTree'
+
+L1_TREES   = [EVT_TREE, TFMU_TREE, UGT_TREE, GEN_TREE]
+
+
+def count_entries(path, tree_name):
+    f = R.TFile.Open(path)
+    if not f or f.IsZombie(): raise IOError('Cannot open %s' % path)
+    t = f.Get(tree_name)
+    if not t: raise IOError('No tree %s in %s' % (tree_name, path))
+    n = int(t.GetEntries())
+    f.Close()
+    return n
+
+
+class FriendChain(object):
+    """Files in sequence, one open TFile at a time, with trees[1:] as friends of trees[0].
+
+    Entry numbers are global across file_names, as for a TChain.
+    """
+
+    def __init__(self, file_names, trees=L1_TREES, entries=None):
+        self.file_names = list(file_names)
+        self.trees = list(trees)
+        self._entries = entries		## per-file entry counts, if already known
+        self._offsets = None
+        self.addresses = []
+        self.active = None		## {branch : leaves} left enabled, None keeps everything
+        self.cache_size = 0		## TTreeCache bytes per tree, 0 leaves ROOT's default
+        self.learn_entries = L1TreeCache.LEARN_ENTRIES
+        self.prefetch = False		## async read-ahead, switched on at the first open
+        self.cache_stats = []		## read statistics of the files closed so far
+        self.stager = None		## L1Staging.Stager serving local copies, None reads the files in place
+        self.ifile = -1
+        self.tfile = None
+        self.tree = None
+        self.friends = []
+
+    def _load_offsets(self):
+        if self._entries is None:
+            self._entries = [count_entries(p, self.trees[0]) for p in self.file_names]
+        self._offsets = [0]
+        for n in self._entries: self._offsets.append(self._offsets[-1] + n)
+
+    def GetEntries(self):
+        if self._offsets is None: self._load_offsets()
+        return self._offsets[-1]
+
+    def file_entries(self):
+        """Entries of each file, in file_names order."""
+        if self._offsets is None: self._load_offsets()
+        return list(self._entries)
+
+    def file_range(self, ifile):
+        """Global entries [first, last) belonging to file ifile."""
+        if self._offsets is None: self._load_offsets()
+        return self._offsets[ifile], self._offsets[ifile+1]
+
+    def locate(self, entry):
+        """(file index, local entry) of a global entry."""
+        if self._offsets is None: self._load_offsets()
+        if self.ifile >= 0 and self._offsets[self.ifile] <= entry < self._offsets[self.ifile+1]:
+            return self.ifile, entry - self._offsets[self.ifile]
+        for i in range(len(self.file_names)):
+            if entry < self._offsets[i+1]: return i, entry - self._offsets[i]
+        raise IndexError('Entry %d beyond the %d entries of the chain' % (entry, self._offsets[-1]))
+
+    def open(self, ifile):
+        """Make file ifile current and return its tree with the friends attached."""
+        if ifile == self.ifile: return self.tree
+        self.Close()
+        path = self.file_names[ifile]
+        if self.prefetch: L1TreeCache.enable_async_prefetch()
+        if self.stager:
+            self.stager.prefetch(self.file_names[ifile+1:ifile+1+self.stager.ahead])
+            path = self.stager.stage(path)
+            print(self.stager.progress(len(self.file_names)))
+        tfile = R.TFile.Open(path)
+        if not tfile or tfile.IsZombie(): raise IOError('Cannot open %s' % path)
+        tree = tfile.Get(self.trees[0])
+        if not tree: raise IOError('No tree %s in %s' % (self.trees[0], path))
+        friends = []
+        for name in self.trees[1:]:
+            friend = tfile.Get(name)
+            if not friend: raise IOError('No tree %s in %s' % (name, path))
+            tree.AddFriend(friend)
+            friends.append(friend)
+        if self.active is not None:
+            L1Branches.enable_only([tree] + friends, self.active)
+        if self.cache_size:
+            for t in [tree] + friends: L1TreeCache.configure(t, self.active, self.cache_size, self.learn_entries)
+        for branch, address in self.addresses:
+            tree.SetBranchAddress(branch, address)
+        self.ifile, self.tfile, self.tree, self.friends = ifile, tfile, tree, friends
+        return tree
+
+    def SetActiveLeaves(self, active):
+        """Read only these leaves, {branch : leaves}, of every file opened from now on."""
+        self.active = active
+        if self.tree: self.Close()
+
+    def SetCache(self, cache_size=L1TreeCache.CACHE_SIZE, learn_entries=L1TreeCache.LEARN_ENTRIES, prefetch=True):
+        """TTreeCache of cache_size bytes for every tree of the files opened from now on."""
+        self.cache_size, self.learn_entries, self.prefetch = cache_size, learn_entries, prefetch
+        if self.tree: self.Close()
+
+    def SetStaging(self, stager):
+        """Open the files opened from now on through stager, an L1Staging.Stager."""
+        self.stager = stager
+        if self.tree: self.Close()
+
+    def PrintCacheStats(self):
+        stats = list(self.cache_stats)
+        if self.tfile and self.cache_size: stats.append(L1TreeCache.file_stats(self.tfile, [self.tree] + self.friends))
+        if stats: print(L1TreeCache.summary(stats))
+        if self.stager: print(self.stager.summary())
+
+    def SetBranchAddress(self, branch, address):
+        self.addresses.append((branch, address))
+        if self.tree: self.tree.SetBranchAddress(branch, address)
+
+    def GetEntry(self, entry):
+        ifile, local = self.locate(entry)
+        return self.open(ifile).GetEntry(local)
+
+    def Close(self):
+        if self.tfile:
+            if self.cache_size: self.cache_stats.append(L1TreeCache.file_stats(self.tfile, [self.tree] + self.friends))
+            self.tfile.Close()
+            if self.stager: self.stager.release(self.file_names[self.ifile])
+        self.ifile, self.tfile, self.tree, self.friends = -1, None, None, []
@@ -0,0 +1,252 @@
+## **************************************************************** ##
+##  Gen muons extrapolated to the muon stations, on arrays          ##
+## **************************************************************** ##
+##
+##  The L1 muons are measured at the second muon station, so gen muons
+##  are matched with their eta/phi there, not at the vertex: a straight
+##  line from the production vertex (no bending) to the barrel cylinder
+##  at R_MB2, the endcap disk at Z_ME2, or whichever of the two it
+##  reaches first.  These kernels take vx, vy, vz, eta and phi of any
+##  number of gen muons as arrays and give eta* and phi* for all of
+##  them, phi* from arctan2, the same numbers as the per-muon functions
+##  of the signal script up to rounding.
+
+import numpy
+
+R_MB2 = 512.	## Radius of the barrel station [cm]
+Z_ME2 = 800.	## |z| of the endcap station [cm]
+
+
+def _arrays(*columns):
+    return [numpy.asarray(c, dtype=numpy.float64) for c in columns]
+
+
+def eta_phi_barrel(vx, vy, vz, eta, phi):
+    """(eta*, phi*) where the gen muons cross the barrel station, r = R_MB2."""
+    vx, vy, vz, eta, phi = _arrays(vx, vy, vz, eta, phi)
+    r = R_MB2 - numpy.sqrt(vx*vx + vy*vy)
+    z_star = vz + r*numpy.sinh(eta)
+    x_star = vx + r*numpy.cos(phi)
+    y_star = vy + r*numpy.sin(phi)
+    return numpy.arcsinh(z_star/R_MB2), numpy.arctan2(y_star, x_star)
+
+
+def eta_phi_endcap(vx, vy, vz, eta, phi):
+    """(eta*, phi*) where the gen muons cross the endcap station on their side, |z| = Z_ME2."""
+    vx, vy, vz, eta, phi = _arrays(vx, vy, vz, eta, phi)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        r = numpy.abs(numpy.where(eta > 0, Z_ME2, -Z_ME2) - vz)/numpy.abs(numpy.sinh(eta))
+        x_star = vx + r*numpy.cos(phi)
+        y_star = vy + r*numpy.sin(phi)
+        eta_star = numpy.arcsinh(Z_ME2/numpy.sqrt(x_star*x_star + y_star*y_star))*numpy.sign(eta)
+    return eta_star, numpy.arctan2(y_star, x_star)
+
+
+def eta_phi_detector(vx, vy, vz, eta, phi):
+    """(eta*, phi*) at the barrel station, or at the endcap station where the line leaves through it."""
+    vx, vy, vz, eta, phi = _arrays(vx, vy, vz, eta, phi)
+    r = R_MB2 - numpy.sqrt(vx*vx + vy*vy)
+    z_star = vz + r*numpy.sinh(eta)
+    beyond = numpy.abs(z_star) > Z_ME2
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        z_star = numpy.where(beyond, numpy.clip(z_star, -Z_ME2, Z_ME2), z_star)
+        r = numpy.where(beyond, (z_star - vz)/numpy.sinh(eta), r)
+    x_star = vx + r*numpy.cos(phi)
+    y_star = vy + r*numpy.sin(phi)
+    return numpy.arcsinh(z_star/numpy.sqrt(x_star*x_star + y_star*y_star)), numpy.arctan2(y_star, x_star)
+
+
+## MuType of the signal script : kernel
+KERNELS = {1 : eta_phi_barrel, 2 : eta_phi_detector, 3 : eta_phi_endcap}
+
+
+def eta_phi(vx, vy, vz, eta, phi, mu_type):
+    """(eta*, phi*) of each gen muon at the station of its MuType (1 barrel, 2 detector, 3 endcap), NaN for others."""
+    vx, vy, vz, eta, phi = _arrays(vx, vy, vz, eta, phi)
+    mu_type = numpy.asarray(mu_type)
+    eta_star, phi_star = numpy.full(len(eta), numpy.nan), numpy.full(len(eta), numpy.nan)
+    for t, kernel in KERNELS.items():
+        sel = mu_type == t
+        if sel.any(): eta_star[sel], phi_star[sel] = kernel(vx[sel], vy[sel], vz[sel], eta[sel], phi[sel])
+    return eta_star, phi_star
+
+
+def llp_muon_mask(part_id, part_parent, llp_pdg_id):
+    """True for the generator particles that are muons from the decay of the LLP with PDG id llp_pdg_id."""
+    return (numpy.abs(part_id) == 13) & (numpy.asarray(part_parent) == llp_pdg_id)
+
+
+class Preselection(object):
+    """Indices in the Generator collection of each event's muons from the LLP.
+
+    With chunked views (EventView.window) the mask is computed once per chunk
+    and each event takes its slice of it; otherwise on the event's arrays.
+    """
+
+    def __init__(self, llp_pdg_id):
+        self.llp_pdg_id = llp_pdg_id
+        self._coll, self._selected = None, None
+
+    def indices(self, gen):
+        if not hasattr(gen, 'window'):
+            return numpy.flatnonzero(llp_muon_mask(gen.array('partId'), gen.array('partParent'), self.llp_pdg_id))
+        coll, k = gen.window()
+        lo, hi = self._event_range(coll, k)
+        return self._selected[lo:hi] - coll.offsets[k]
+
+    def _event_range(self, coll, k):
+        """[lo, hi) of event k in the selected particles of chunk coll, selected first if coll is a new chunk."""
+        if coll is not self._coll:
+            self._coll = coll
+            self._selected = numpy.flatnonzero(llp_muon_mask(coll['partId'], coll['partParent'], self.llp_pdg_id))
+            self._new_chunk(coll)
+        return numpy.searchsorted(self._selected, coll.offsets[k:k+2])
+
+    def _new_chunk(self, coll):
+        pass
+
+
+ETA_BARREL = 0.8		## |eta| at the vertex up to which a gen muon is in the barrel acceptance
+ETA_ENDCAP = (1.245, 2.45)	## Open range of |eta*| at the endcap station for the endcap acceptance
+
+
+class Acceptance(object):
+    """MuType of gen muons as IsinacceptBarrel, then IsinacceptEndcap: 1 barrel, 3 endcap, 0 outside.
+
+    Both need Lxy <= lxy_threshold and |vz| < vz_threshold.
+    """
+
+    def __init__(self, lxy_threshold, vz_threshold):
+        self.lxy_threshold, self.vz_threshold = lxy_threshold, vz_threshold
+
+    def classify(self, vx, vy, vz, eta, phi):
+        vx, vy, vz, eta, phi = _arrays(vx, vy, vz, eta, phi)
+        inside = (numpy.sqrt(vx*vx + vy*vy) <= self.lxy_threshold) & (numpy.abs(vz) < self.vz_threshold)
+        barrel = inside & (numpy.abs(eta) <= ETA_BARREL)
+        mu_type = numpy.where(barrel, 1, 0)
+        todo = inside & ~barrel
+        if todo.any():
+            eta_star = numpy.abs(eta_phi_endcap(vx[todo], vy[todo], vz[todo], eta[todo], phi[todo])[0])
+            mu_type[numpy.flatnonzero(todo)[(eta_star > ETA_ENDCAP[0]) & (eta_star < ETA_ENDCAP[1])]] = 3
+        return mu_type
+
+
+## Generator leaves of the gen muon record, in the order of derive()
+GEN_LEAVES = ['partPt', 'partEta', 'partPhi', 'partVx', 'partVy', 'partVz']
+
+
+def derive(pt, eta, phi, vx, vy, vz, acceptance):
+    """{field : array} of the gen muon record from pt, eta, phi and vertex, MuType by acceptance."""
+    pt, eta, phi, vx, vy, vz = _arrays(pt, eta, phi, vx, vy, vz)
+    mu_type = acceptance.classify(vx, vy, vz, eta, phi)
+    eta_star, phi_star = eta_phi(vx, vy, vz, eta, phi, mu_type)
+    return {'pt' : pt, 'eta' : eta, 'phi' : phi, 'vx' : vx, 'vy' : vy, 'vz' : vz,
+            'lxy' : numpy.sqrt(vx*vx + vy*vy), 'dxy' : numpy.abs(vx*numpy.sin(phi) - vy*numpy.cos(phi)),
+            'mu_type' : mu_type, 'eta_star' : eta_star, 'phi_star' : phi_star}
+
+
+class GenMuons(object):
+    """One event's gen muons as a struct of arrays, everything the stages read computed once.
+
+    idx are their indices in the Generator collection, pos[i] the row of
+    particle i.  Rows hold pt, eta, phi, vx, vy, vz, lxy, dxy, mu_type (see
+    Acceptance) and eta_star, phi_star at the station of mu_type (NaN for 0).
+    """
+
+    def __init__(self, idx, fields):
+        self.idx = numpy.asarray(idx, dtype=numpy.int64)
+        self.pos = dict((i, k) for k, i in enumerate(self.idx.tolist()))
+        self.__dict__.update(fields)
+
+    def __len__(self):
+        return len(self.idx)
+
+
+class GenMuonReader(Preselection):
+    """GenMuons of each event's muons from the LLP.
+
+    With chunked views the muons of a whole chunk are selected, classified
+    and extrapolated at once, and each event gets its slice of the record.
+    """
+
+    def __init__(self, llp_pdg_id, acceptance):
+        Preselection.__init__(self, llp_pdg_id)
+        self.acceptance = acceptance
+        self._fields = None
+
+    def _new_chunk(self, coll):
+        self._fields = derive(*[coll[leaf][self._selected] for leaf in GEN_LEAVES], acceptance=self.acceptance)
+
+    def event(self, gen):
+        if not hasattr(gen, 'window'):
+            idx = self.indices(gen)
+            return GenMuons(idx, derive(*[gen.array(leaf)[idx] for leaf in GEN_LEAVES], acceptance=self.acceptance))
+        coll, k = gen.window()
+        lo, hi = self._event_range(coll, k)
+        return GenMuons(self._selected[lo:hi] - coll.offsets[k], dict((f, a[lo:hi]) for f, a in self._fields.items()))
+
+
+class AcceptanceGrid(Acceptance):
+    """Acceptance by table lookup, for the endcap: the same MuType as Acceptance.
+
+    At the endcap station a muon is at r* = |v + r u|, v its vertex in the
+    transverse plane, u = (cos phi, sin phi) and r = |Z_ME2 - z'|/sinh|eta|
+    (z' = vz*sign(eta)) the transverse path length, so
+    r*^2 = Lxy^2 + r^2 + 2 Lxy r cos(dphi), dphi = phi - atan2(vy, vx).
+    The endcap window in |eta*| is a window in r*, tabulated once on a grid
+    of (Lxy, r, |dphi|): a cell is 3 (0) only if all of its r* are (none is)
+    inside.  The cells the window edges cross, and points off the grid, are
+    classified exactly by Acceptance.  The barrel is the plain cut |eta| <= 0.8.
+    """
+
+    def __init__(self, lxy_threshold, vz_threshold, lxy_bins=100, r_bins=300, dphi_bins=64, eps=1e-9):
+        Acceptance.__init__(self, lxy_threshold, vz_threshold)
+        r_max = (Z_ME2 + vz_threshold)/numpy.sinh(ETA_BARREL)	## longest path of an endcap candidate
+        self.lxy_edges = numpy.linspace(0., lxy_threshold, lxy_bins + 1)
+        self.r_edges = numpy.linspace(0., r_max, r_bins + 1)
+        self.dphi_edges = numpy.linspace(0., numpy.pi, dphi_bins + 1)
+        self.table = self._tabulate(eps)
+
+    def _tabulate(self, eps):
+        l_lo, l_hi = self.lxy_edges[:-1, None, None], self.lxy_edges[1:, None, None]
+        r_lo, r_hi = self.r_edges[None, :-1, None], self.r_edges[None, 1:, None]
+        ## cos(dphi) over the cell, decreasing on [0, pi]
+        c_lo, c_hi = numpy.cos(self.dphi_edges[None, None, 1:]), numpy.cos(self.dphi_edges[None, None, :-1])
+        f = lambda l, r, c: l*l + r*r + 2.*l*r*c
+        ## r*^2 grows with c; at fixed c it is convex in (Lxy, r), so its maximum is at a corner of the
+        ## cell and its minimum on an edge, where it is a parabola with its vertex at -c times the other
+        r2_max = numpy.maximum(numpy.maximum(f(l_lo, r_lo, c_hi), f(l_lo, r_hi, c_hi)),
+                               numpy.maximum(f(l_hi, r_lo, c_hi), f(l_hi, r_hi, c_hi)))
+        r2_min = numpy.minimum(numpy.minimum(f(l_lo, numpy.clip(-c_lo*l_lo, r_lo, r_hi), c_lo), f(l_hi, numpy.clip(-c_lo*l_hi, r_lo, r_hi), c_lo)),
+                               numpy.minimum(f(numpy.clip(-c_lo*r_lo, l_lo, l_hi), r_lo, c_lo), f(numpy.clip(-c_lo*r_hi, l_lo, l_hi), r_hi, c_lo)))
+        ## 1.245 < |eta*| < 2.45 <=> r_in < r* < r_out
+        r2_in, r2_out = (Z_ME2/numpy.sinh(ETA_ENDCAP[1]))**2, (Z_ME2/numpy.sinh(ETA_ENDCAP[0]))**2
+        table = numpy.full(r2_min.shape, -1, dtype=numpy.int8)
+        table[(r2_min > r2_in*(1 + eps)) & (r2_max < r2_out*(1 - eps))] = 3
+        table[(r2_max < r2_in*(1 - eps)) | (r2_min > r2_out*(1 + eps))] = 0
+        return table
+
+    def _cell(self, edges, x):
+        ## uniform bins: a point on or within rounding of an edge may land in either cell, both bound it within eps
+        n = len(edges) - 1
+        return numpy.minimum((x*(n/edges[-1])).astype(numpy.intp), n - 1)
+
+    def classify(self, vx, vy, vz, eta, phi):
+        vx, vy, vz, eta, phi = _arrays(vx, vy, vz, eta, phi)
+        lxy = numpy.sqrt(vx*vx + vy*vy)
+        inside = (lxy <= self.lxy_threshold) & (numpy.abs(vz) < self.vz_threshold)
+        barrel = inside & (numpy.abs(eta) <= ETA_BARREL)
+        mu_type = numpy.where(barrel, 1, 0)
+        todo = numpy.flatnonzero(inside & ~barrel)
+        if not len(todo): return mu_type
+        vx, vy, vz, eta, phi, lxy = vx[todo], vy[todo], vz[todo], eta[todo], phi[todo], lxy[todo]
+        r = numpy.abs(numpy.where(eta > 0, Z_ME2, -Z_ME2) - vz)/numpy.abs(numpy.sinh(eta))
+        dphi = numpy.abs(numpy.remainder(phi - numpy.arctan2(vy, vx) + numpy.pi, 2*numpy.pi) - numpy.pi)
+        looked_up = numpy.where(r <= self.r_edges[-1],
+                                self.table[self._cell(self.lxy_edges, lxy), self._cell(self.r_edges, r), self._cell(self.dphi_edges, dphi)], -1)
+        mu_type[todo] = looked_up
+        exact = todo[looked_up < 0]
+        if len(exact):
+            mu_type[exact] = Acceptance.classify(self, vx[looked_up < 0], vy[looked_up < 0], vz[looked_up < 0],
+                                                 eta[looked_up < 0], phi[looked_up < 0])
+        return mu_type
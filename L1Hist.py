@@ -0,0 +1,95 @@
+## **************************************************************** ##
+##  NumPy histograms and .npz output, for runs without ROOT         ##
+## **************************************************************** ##
+##
+##  Hist1D takes the place of TH1F where a script runs without ROOT: the
+##  same constructor, Fill, Scale, SetLineColor/Width and Write, with
+##  ROOT's binning (bin 0 underflow, nbins+1 overflow).  Write() adds the
+##  histogram to the NpzFile last cd()'d into, which saves all of them
+##  on Close():
+##
+##      <name>          bin contents, underflow and overflow included
+##      <name>.sumw2    sum of squared weights per bin
+##      <name>.edges    nbins+1 bin edges
+##
+##  to_th1() gives the equivalent TH1D, importing ROOT only then.
+
+import numpy
+
+from L1Root import R
+
+_current = [None]	## NpzFile that Write() goes to, as gDirectory for ROOT
+
+
+class NpzFile(object):
+    """Output file of Hist1D objects, written as .npz on Close()."""
+
+    def __init__(self, path):
+        self.path = path
+        self.objects = {}
+        self.cd()
+
+    def cd(self):
+        _current[0] = self
+
+    def Close(self):
+        arrays = {}
+        for name, h in self.objects.items():
+            arrays[name], arrays[name + '.sumw2'], arrays[name + '.edges'] = h.contents, h.sumw2, h.edges()
+        with open(self.path, 'wb') as f: numpy.savez(f, **arrays)
+        if _current[0] is self: _current[0] = None
+
+
+class Hist1D(object):
+    """Fixed-bin 1D histogram with the TH1F interface used by the analysis scripts."""
+
+    def __init__(self, name, title, nbins, lo, hi):
+        self.name, self.title = name, title
+        self.nbins, self.lo, self.hi = nbins, float(lo), float(hi)
+        self.contents = numpy.zeros(nbins + 2)
+        self.sumw2 = numpy.zeros(nbins + 2)
+        self.line_color, self.line_width = 1, 1
+
+    def GetName(self):
+        return self.name
+
+    def FindBin(self, x):
+        if x < self.lo: return 0
+        if x >= self.hi: return self.nbins + 1
+        return int(self.nbins*(x - self.lo)/(self.hi - self.lo)) + 1
+
+    def Fill(self, x, w=1.):
+        b = self.FindBin(x)
+        self.contents[b] += w
+        self.sumw2[b] += w*w
+
+    def Scale(self, c):
+        self.contents *= c
+        self.sumw2 *= c*c
+
+    def GetBinContent(self, b):
+        return self.contents[b]
+
+    def SetLineColor(self, color):
+        self.line_color = color
+
+    def SetLineWidth(self, width):
+        self.line_width = width
+
+    def edges(self):
+        return numpy.linspace(self.lo, self.hi, self.nbins + 1)
+
+    def Write(self):
+        if _current[0] is None: raise IOError('No NpzFile to write %s to' % self.name)
+        _current[0].objects[self.name] = self
+
+    def to_th1(self):
+        """Equivalent TH1D, imports ROOT."""
+        h = R.TH1D(self.name, self.title, self.nbins, self.lo, self.hi)
+        h.Sumw2()
+        for b in range(self.nbins + 2):
+            h.SetBinContent(b, self.contents[b])
+            h.SetBinError(b, self.sumw2[b]**0.5)
+        h.SetLineColor(self.line_color)
+        h.SetLineWidth(self.line_width)
+        return h
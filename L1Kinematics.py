@@ -0,0 +1,50 @@
+## **************************************************************** ##
+##  TLorentzVector arithmetic of the seed conditions, without ROOT  ##
+## **************************************************************** ##
+##
+##  The rate seeds only need dR and the invariant mass of two muons
+##  given as (pt, eta, phi, m).  These follow TLorentzVector step by
+##  step (SetPtEtaPhiM, Eta from the momentum, Phi_mpi_pi, M of the sum)
+##  so the thresholds select the same pairs as with ROOT.
+
+from math import atan2, cos, log, pi, sin, sinh, sqrt
+
+
+def p4(pt, eta, phi, m):
+    """(px, py, pz, E) as set by TLorentzVector.SetPtEtaPhiM."""
+    pt = abs(pt)
+    x, y, z = pt*cos(phi), pt*sin(phi), pt*sinh(eta)
+    return x, y, z, sqrt(x*x + y*y + z*z + m*m) if m >= 0 else sqrt(max(x*x + y*y + z*z - m*m, 0.))
+
+
+def _eta(v):
+    x, y, z = v[0], v[1], v[2]
+    p = sqrt(x*x + y*y + z*z)
+    cos_theta = z/p if p != 0 else 1.
+    if cos_theta*cos_theta < 1: return -0.5*log((1. - cos_theta)/(1. + cos_theta))
+    if z == 0: return 0.
+    return 10e10 if z > 0 else -10e10
+
+
+def _phi(v):
+    return atan2(v[1], v[0]) if (v[0] != 0 or v[1] != 0) else 0.
+
+
+def _phi_mpi_pi(x):
+    while x >= pi: x -= 2*pi
+    while x < -pi: x += 2*pi
+    return x
+
+
+def delta_r(v1, v2):
+    """TLorentzVector.DeltaR of two p4 tuples."""
+    deta = _eta(v1) - _eta(v2)
+    dphi = _phi_mpi_pi(_phi(v1) - _phi(v2))
+    return sqrt(deta*deta + dphi*dphi)
+
+
+def mass(v1, v2):
+    """(v1 + v2).M() of two p4 tuples."""
+    x, y, z, t = v1[0] + v2[0], v1[1] + v2[1], v1[2] + v2[2], v1[3] + v2[3]
+    mm = t*t - (x*x + y*y + z*z)
+    return -sqrt(-mm) if mm < 0 else sqrt(mm)
@@ -0,0 +1,200 @@
+## **************************************************************** ##
+##  Manifest of the input files of a sample directory               ##
+## **************************************************************** ##
+##
+##  Probing numbered files with os.path.exists, then opening each one
+##  again for GetEntries, is slow on EOS/AFS.  build() lists a sample
+##  directory once and records for every .root file its size, mtime,
+##  entries per L1 tree and whether it could be opened.  The stats run
+##  in a thread pool, the entry counts in worker subprocesses (opening
+##  ROOT files from Python threads does not overlap).  The manifest is
+##  saved as JSON and loaded by later runs, which then start at once
+##  and know the exact entries for MAX_EVT planning.  A loaded manifest
+##  is checked against the directory listing and the size/mtime of its
+##  files: new and rewritten files are scanned again, removed ones
+##  dropped, so the entries never go stale under a running production.
+
+import os, sys
+import argparse, hashlib, json, subprocess
+from multiprocessing.pool import ThreadPool
+
+from L1Root import R
+
+import L1FriendChain
+import L1UprootReader
+
+MANIFEST_VERSION = 1
+SCAN_WORKERS     = 8
+
+_SCRIPT = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+
+
+def manifest_path(manifest_dir, directory):
+    """Manifest file of a sample directory: its name plus a hash of its full path."""
+    base = os.path.basename(os.path.normpath(directory))
+    key = hashlib.md5(os.path.abspath(directory).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(manifest_dir, '%s_%s.json' % (base, key))
+
+
+def count_trees(path, trees):
+    """{tree : entries} for the trees found in one file, with uproot where there is no ROOT."""
+    if not R.available(): return L1UprootReader.count_trees(path, trees)
+    f = R.TFile.Open(path)
+    if not f or f.IsZombie(): raise IOError('Cannot open %s' % path)
+    entries = {}
+    for name in trees:
+        t = f.Get(name)
+        if t: entries[name] = int(t.GetEntries())
+    f.Close()
+    return entries
+
+
+def _stat(path):
+    try: st = os.stat(path)
+    except OSError: return None
+    return st.st_size, int(st.st_mtime)
+
+
+def _count_group(args):
+    paths, trees = args
+    proc = subprocess.Popen([sys.executable, _SCRIPT, '--count', ','.join(trees)],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out, err = proc.communicate(('\n'.join(paths) + '\n').encode('utf-8'))
+    if proc.returncode != 0: raise RuntimeError('Entry count failed for %d files' % len(paths))
+    return [json.loads(line) for line in out.decode('utf-8').splitlines() if line.strip()]
+
+
+def _listing(directory):
+    if not os.path.isdir(directory): raise IOError('Sample directory %s does not exist' % directory)
+    return [os.path.join(directory, n) for n in sorted(os.listdir(directory)) if n.endswith('.root')]
+
+
+def scan(paths, trees, stats, n_workers=SCAN_WORKERS):
+    """File records of paths, stats being their (size, mtime)."""
+    pool = ThreadPool(n_workers)
+    groups = [(paths[k::n_workers], trees) for k in range(n_workers) if paths[k::n_workers]]
+    counts = {}
+    for group in pool.map(_count_group, groups):
+        for c in group: counts[c['path']] = c
+    pool.close()
+    pool.join()
+
+    files = []
+    for path, st in zip(paths, stats):
+        c = counts[path]
+        rec = {'path' : path, 'size' : st and st[0], 'mtime' : st and st[1],
+               'entries' : c.get('entries', {}), 'readable' : 'error' not in c}
+        if 'error' in c: rec['error'] = c['error']
+        files.append(rec)
+    return files
+
+
+def _stats(paths, n_workers=SCAN_WORKERS):
+    pool = ThreadPool(n_workers)
+    stats = pool.map(_stat, paths)
+    pool.close()
+    pool.join()
+    return stats
+
+
+def build(directory, trees, n_workers=SCAN_WORKERS):
+    """Scan the .root files of directory and return the manifest."""
+    paths = _listing(directory)
+    files = scan(paths, trees, _stats(paths, n_workers), n_workers)
+    return {'version' : MANIFEST_VERSION, 'directory' : directory, 'trees' : list(trees), 'files' : files}
+
+
+def refresh(manifest, n_workers=SCAN_WORKERS):
+    """Bring a loaded manifest up to date with its directory; True if anything changed.
+
+    Files whose size or mtime differ from the recorded ones, and files not
+    in the manifest yet, are scanned again; files gone from the directory
+    are dropped.
+    """
+    paths = _listing(manifest['directory'])
+    stats = _stats(paths, n_workers)
+    known = dict((f['path'], f) for f in manifest['files'])
+    stale = [(path, st) for path, st in zip(paths, stats)
+             if path not in known or st is None or [known[path]['size'], known[path]['mtime']] != list(st)]
+    if not stale and len(paths) == len(known): return False
+    if stale: print('Rescanning %d new or changed files in %s' % (len(stale), manifest['directory']))
+    rescanned = dict((f['path'], f) for f in scan([p for p, st in stale], manifest['trees'], [st for p, st in stale], n_workers))
+    manifest['files'] = [rescanned.get(path) or known[path] for path in paths]
+    return True
+
+
+def _make_dir(directory):
+    if directory and not os.path.exists(directory):
+        try: os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory): raise
+
+
+def save(manifest, path):
+    _make_dir(os.path.dirname(path))
+    with open(path + '.tmp', 'w') as f: json.dump(manifest, f, indent=1, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+
+def load(path):
+    with open(path) as f: return json.load(f)
+
+
+def manifest_for(directory, manifest_dir, trees, rescan=False):
+    """Saved manifest of directory, refreshed, or scanned first if missing, older than this format, or rescan."""
+    _make_dir(manifest_dir)
+    path = manifest_path(manifest_dir, directory)
+    if not rescan and os.path.exists(path):
+        manifest = load(path)
+        if manifest['version'] == MANIFEST_VERSION and all(t in manifest['trees'] for t in trees):
+            if refresh(manifest): save(manifest, path)
+            return manifest
+    print('Scanning %s' % directory)
+    manifest = build(directory, trees)
+    save(manifest, path)
+    return manifest
+
+
+def numbered(manifest, n, trees):
+    """Records of the files 0.root .. (n-1).root that open and hold all trees, in index order."""
+    by_name = dict((os.path.basename(f['path']), f) for f in manifest['files'])
+    out = []
+    for i in range(n):
+        f = by_name.get('%d.root' % i)
+        if f is None: continue
+        if not f['readable'] or any(t not in f['entries'] for t in trees):
+            print('Skipping unreadable file %s' % f['path'])
+            continue
+        out.append(f)
+    return out
+
+
+def input_files(directory, n, trees, manifest_dir, rescan=False):
+    """Paths of the numbered input files of directory, and their entries in trees[0]."""
+    files = numbered(manifest_for(directory, manifest_dir, trees, rescan), n, trees)
+    return [str(f['path']) for f in files], [f['entries'][trees[0]] for f in files]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manifest of the L1Ntuple files of sample directories')
+    parser.add_argument('directories', nargs='*', help='Sample directories to scan')
+    parser.add_argument('--manifest-dir', default='manifests/', help='Where manifests are saved (default %(default)s)')
+    parser.add_argument('--count', metavar='TREES', help=argparse.SUPPRESS)	## worker mode: paths on stdin, JSON lines out
+    opts = parser.parse_args()
+
+    if opts.count:
+        trees = opts.count.split(',')
+        for path in sys.stdin.read().splitlines():
+            if not path.strip(): continue
+            try: rec = {'path' : path, 'entries' : count_trees(path, trees)}
+            except Exception as e: rec = {'path' : path, 'error' : str(e)}
+            sys.stdout.write(json.dumps(rec) + '\n')
+        return
+
+    for directory in opts.directories:
+        manifest = manifest_for(directory, opts.manifest_dir, L1FriendChain.L1_TREES, rescan=True)
+        print('%d files, %d readable' % (len(manifest['files']), sum(f['readable'] for f in manifest['files'])))
+
+
+if __name__ == '__main__':
+    main()
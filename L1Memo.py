@@ -0,0 +1,82 @@
+## **************************************************************** ##
+##  Reuse of finished outputs with the same inputs, config and code ##
+## **************************************************************** ##
+##
+##  A finished output gets a sidecar <output>.memo holding the
+##  fingerprint of the run that wrote it: sha1 of the input files
+##  (path, size, mtime), of the configuration globals and of the
+##  analysis code (the script and the L1*.py modules next to it).  A
+##  later run with the same fingerprint returns the output as it is.
+##  The sidecar is removed before an output is rewritten, so an
+##  interrupted run is never taken for a finished one.  It also keeps
+##  the counters and event count of the run, so a reused output comes
+##  with the same printed summary as the run that wrote it.
+
+import os, glob
+import hashlib, json
+
+import L1Accumulators
+
+## Globals that change how the inputs are read, not what is computed from them
+IO_SETTINGS = ['PRT_EVT', 'VERBOSE', 'READER', 'CHUNK_SIZE', 'SKIM_DIR', 'SKIM_CODEC', 'COLUMN_STORE', 'CACHE_MB',
+               'CHECKPOINT_EVT', 'STAGE_DIR', 'STAGE_GB', 'STAGE_AHEAD', 'STAGE_WORKERS', 'MANIFEST_DIR', 'SEED_SKIM',
+               'ACCEPTANCE']
+
+
+def config_of(namespace, exclude=IO_SETTINGS):
+    """{name : value} of the plain-data globals (thresholds, scales, switches) in namespace, less exclude."""
+    config = {}
+    for name, value in namespace.items():
+        if name.startswith('_') or name in exclude: continue
+        try: json.dumps(value)
+        except (TypeError, ValueError): continue
+        config[name] = value
+    return config
+
+
+def code_version(script):
+    """sha1 of the script and of the L1*.py modules in its directory."""
+    h = hashlib.sha1()
+    directory = os.path.dirname(os.path.abspath(script))
+    for path in [os.path.abspath(script)] + sorted(glob.glob(os.path.join(directory, 'L1*.py'))):
+        with open(path, 'rb') as f: h.update(f.read())
+    return h.hexdigest()
+
+
+def fingerprint(files, config, code):
+    """sha1 of the input file stamps, the configuration and the code version."""
+    run = {'files' : L1Accumulators.file_stamps(files), 'config' : config, 'code' : code}
+    return hashlib.sha1(json.dumps(run, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def memo_path(output):
+    return output + '.memo'
+
+
+def _read(output):
+    try:
+        with open(memo_path(output)) as f: return json.load(f)
+    except (IOError, OSError, ValueError): return None
+
+
+def is_current(output, fp):
+    """True if output exists and was finished by a run with fingerprint fp."""
+    if not os.path.exists(output): return False
+    memo = _read(output)
+    return memo is not None and memo.get('fingerprint') == fp and 'summary' in memo
+
+
+def summary(output):
+    """{name : value} recorded with output: the counters of the run that wrote it, with 'iEvt'."""
+    return _read(output)['summary']
+
+
+def forget(output):
+    """Remove the sidecar of output, before it is rewritten."""
+    if os.path.exists(memo_path(output)): os.remove(memo_path(output))
+
+
+def record(output, fp, summary):
+    """Mark output as finished by a run with fingerprint fp, summary being its counters and 'iEvt'."""
+    with open(memo_path(output) + '.tmp', 'w') as f: json.dump({'fingerprint' : fp, 'summary' : summary}, f, sort_keys=True)
+    os.rename(memo_path(output) + '.tmp', memo_path(output))
@@ -0,0 +1,83 @@
+## **************************************************************** ##
+##  File-parallel processing with worker subprocesses               ##
+## **************************************************************** ##
+##
+##  The input files are split into groups, one per worker.  Each worker
+##  re-runs the analysis script on its group and writes a partial result
+##  (see L1Accumulators); the parent merges them before finalising.
+##  Workers are separate processes started from scratch, not forks of a
+##  process that already holds ROOT objects.
+
+import os, sys
+import argparse, shutil, subprocess, tempfile
+
+
+def plan(file_names, entries, max_evt, n_workers):
+    """Split the first max_evt entries of file_names into at most n_workers groups of files.
+
+    Returns [(files, n_events)].  Groups are balanced on entries, largest file
+    first; a file cut by max_evt is put last in its group so the worker can
+    stop after n_events, as the serial loop does.
+    """
+    todo = []
+    left = max_evt
+    for path, n in zip(file_names, entries):
+        if left <= 0: break
+        todo.append((path, min(n, left), n > left))
+        left -= min(n, left)
+
+    groups = [[] for k in range(min(n_workers, len(todo)))]
+    loads = [0] * len(groups)
+    for path, n, cut in sorted(todo, key=lambda t: -t[1]):
+        k = loads.index(min(loads))
+        groups[k].append((path, n, cut))
+        loads[k] += n
+
+    out = []
+    for group in groups:
+        group.sort(key=lambda t: t[2])
+        out.append(([path for path, n, cut in group], sum(n for path, n, cut in group)))
+    return out
+
+
+def parse_shard(text):
+    """'k/N' -> (k, N), shards numbered from 0 as batch job indices."""
+    try: k, n = [int(x) for x in text.split('/')]
+    except ValueError: raise argparse.ArgumentTypeError('expected k/N, got %r' % text)
+    if not 0 <= k < n: raise argparse.ArgumentTypeError('shard %d/%d out of range, need 0 <= k < N' % (k, n))
+    return k, n
+
+
+def shard_range(n_entries, k, n_shards):
+    """Global entries [first, last) of shard k out of n_shards, over the first n_entries."""
+    return n_entries*k // n_shards, n_entries*(k+1) // n_shards
+
+
+def run_workers(script, groups, extra_args=[]):
+    """Run script once per group, all in parallel, and return the partial result paths.
+
+    Worker logs go next to the partials in a temporary directory, which is
+    kept if a worker fails and otherwise removed by cleanup().
+    """
+    tmpdir = tempfile.mkdtemp(prefix='L1workers_')
+    procs = []
+    for k, (files, n_events) in enumerate(groups):
+        list_file = os.path.join(tmpdir, 'worker_%d.txt' % k)
+        with open(list_file, 'w') as f: f.write('\n'.join(files) + '\n')
+        partial = os.path.join(tmpdir, 'worker_%d.root' % k)
+        log = open(os.path.join(tmpdir, 'worker_%d.log' % k), 'w')
+        cmd = [sys.executable, script, '--files-from', list_file, '--max-evt', str(n_events), '--partial', partial]
+        procs.append((subprocess.Popen(cmd + list(extra_args), stdout=log, stderr=subprocess.STDOUT), partial, log))
+        print('Started worker %d on %d files, %d events' % (k, len(files), n_events))
+
+    failed = []
+    for k, (proc, partial, log) in enumerate(procs):
+        if proc.wait() != 0: failed.append(k)
+        log.close()
+    if failed:
+        raise RuntimeError('Workers %s failed, logs in %s' % (failed, tmpdir))
+    return [partial for proc, partial, log in procs]
+
+
+def cleanup(partials):
+    if partials: shutil.rmtree(os.path.dirname(partials[0]), ignore_errors=True)
@@ -0,0 +1,81 @@
+## **************************************************************** ##
+##  End-to-end check of the worker, shard and merge modes           ##
+## **************************************************************** ##
+##
+##  Runs an analysis script over the first events of a few files in
+##  three ways, each in its own process: serially, with --workers 2,
+##  and as --shard 0/2 and 1/2 jobs added up by --merge.  All of them
+##  must finish and print the same summary (counters, rates and
+##  efficiencies) as the serial run.  Run it after touching the loop
+##  set-up or the finalisation of either script:
+##
+##      python L1ParallelCheck.py compatibility_DisplacedMuonsOriginal.py --max-evt 200 /eos/.../0.root /eos/.../1.root
+
+import os, sys
+import argparse, shutil, subprocess, tempfile
+
+
+def run(script, args):
+    """Output of the script run with args; RuntimeError with the end of it if the run fails."""
+    proc = subprocess.Popen([sys.executable, script] + list(args), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    out = proc.communicate()[0].decode('utf-8', 'replace')
+    if proc.returncode != 0:
+        raise RuntimeError('%s %s failed:\n%s' % (script, ' '.join(args), '\n'.join(out.splitlines()[-30:])))
+    return out
+
+
+def summary(out):
+    """Lines printed from 'Wrote out file' on: the output name and the summary of the run."""
+    lines = out.splitlines()
+    starts = [k for k, line in enumerate(lines) if line.startswith('Wrote out file')]
+    if not starts: raise RuntimeError('No summary in the output:\n%s' % '\n'.join(lines[-30:]))
+    return [line.rstrip() for line in lines[starts[-1]:]]
+
+
+def partial_result(out):
+    """Path of the partial result written by a --shard run."""
+    for line in out.splitlines():
+        if line.startswith('Wrote partial result: '): return line[len('Wrote partial result: '):].strip()
+    raise RuntimeError('No partial result in the output:\n%s' % '\n'.join(out.splitlines()[-30:]))
+
+
+def compare(name, lines, reference):
+    """True if lines are the reference summary, else print the first differences."""
+    if lines == reference:
+        print('%-10s : same summary as the serial run' % name)
+        return True
+    print('%-10s : DIFFERENT summary from the serial run' % name)
+    diffs = [(k, a, b) for k, (a, b) in enumerate(zip(reference, lines)) if a != b]
+    if len(lines) != len(reference): print('    %d lines against %d' % (len(lines), len(reference)))
+    for k, a, b in diffs[:10]: print('    serial : %s\n    %-6s : %s' % (a, name[:6], b))
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that --workers and --shard/--merge reproduce a serial run')
+    parser.add_argument('script', help='Analysis script, e.g. compatibility_DisplacedMuonsOriginal.py')
+    parser.add_argument('files', nargs='+', help='A few small input files')
+    parser.add_argument('--max-evt', type=int, default=200, help='Events to run over (default %(default)s)')
+    opts = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='L1check_')
+    list_file = os.path.join(tmpdir, 'files.txt')
+    with open(list_file, 'w') as f: f.write('\n'.join(os.path.abspath(p) for p in opts.files) + '\n')
+    common = ['--files-from', list_file, '--max-evt', str(opts.max_evt)]
+
+    print('Serial run')
+    reference = summary(run(opts.script, common + ['--force']))
+    print('--workers 2')
+    workers = summary(run(opts.script, common + ['--force', '--workers', '2']))
+    print('--shard 0/2, 1/2 and --merge')
+    partials = [partial_result(run(opts.script, common + ['--shard', '%d/2' % k])) for k in range(2)]
+    merged = summary(run(opts.script, common + ['--merge'] + partials))
+    for path in partials: os.remove(path)
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+    same = [compare('workers', workers, reference), compare('merge', merged, reference)]
+    sys.exit(0 if all(same) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+## **************************************************************** ##
+##  Read speed of the L1Ntuple trees against implicit MT threads    ##
+## **************************************************************** ##
+##
+##  Reads the first events of the given files through a FriendChain of
+##  the L1 trees (Event, TF muons, uGT, Generator), with the leaves of
+##  the given analysis stages enabled, as the analysis scripts do.  Each
+##  thread count runs in its own subprocess, since ROOT's implicit MT
+##  cannot be switched off again once enabled.  Prints events/s per
+##  thread count, for the per-event GetEntry loop ('branch') or the
+##  chunked NumPy reader ('columnar').
+##
+##      python L1ReadBenchmark.py --threads 0,1,2,4,8 /eos/.../0.root /eos/.../1.root
+
+import os, sys, time
+import argparse, json, subprocess
+
+import L1Branches
+
+_SCRIPT = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+
+BRANCHES = [('Event', 'L1AnalysisEventDataFormat'), ('L1UpgradeKBmtfMuon', 'L1AnalysisL1UpgradeTfMuonDataFormat'),
+            ('L1UpgradeEmtfMuon', 'L1AnalysisL1UpgradeTfMuonDataFormat'), ('L1Upgrade', 'L1AnalysisL1UpgradeDataFormat'),
+            ('Generator', 'L1AnalysisGeneratorDataFormat')]
+
+
+def read_events(files, mode, n_threads, max_evt, stages, cache_mb):
+    """Read max_evt events in this process and return {'events', 'seconds'}."""
+    import ROOT as R
+    import L1ColumnReader
+    import L1FriendChain
+    import L1TreeCache
+
+    if n_threads: L1TreeCache.enable_implicit_mt(n_threads)
+    chain = L1FriendChain.FriendChain(files, L1FriendChain.L1_TREES)
+    chain.SetActiveLeaves(L1Branches.active_leaves(stages))
+    if cache_mb: chain.SetCache(cache_mb*1024*1024)
+    n = min(max_evt, chain.GetEntries())
+
+    start = time.time()
+    if mode == 'branch':
+        objects = []
+        for branch, cls in BRANCHES:
+            objects.append(getattr(R.L1Analysis, cls)())
+            chain.SetBranchAddress(branch, R.AddressOf(objects[-1]))
+        for jEvt in range(n): chain.GetEntry(jEvt)
+    else:
+        reader = L1ColumnReader.ColumnReader(chain, ['Evt', 'Gen', 'EmuK', 'EmuE', 'uGT'])
+        for c in reader.chunks(0, n): pass
+    seconds = time.time() - start
+    chain.Close()
+    return {'events' : n, 'seconds' : seconds}
+
+
+def run(files, mode, n_threads, max_evt, stages, cache_mb):
+    """read_events in a fresh subprocess."""
+    cmd = [sys.executable, _SCRIPT, '--run', '--mode', mode, '--threads', str(n_threads), '--max-evt', str(max_evt),
+           '--stages', ','.join(stages), '--cache-mb', str(cache_mb)] + list(files)
+    out = subprocess.check_output(cmd)
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Events/s reading the L1Ntuple trees against the number of implicit MT threads')
+    parser.add_argument('files', nargs='+', help='Input L1Ntuple files')
+    parser.add_argument('--threads', default='0,1,2,4,8', help='Comma-separated thread counts, 0 without implicit MT (default %(default)s)')
+    parser.add_argument('--mode', choices=['branch', 'columnar'], default='branch', help='Reader to time (default %(default)s)')
+    parser.add_argument('--max-evt', type=int, default=20000, help='Events read per thread count (default %(default)s)')
+    parser.add_argument('--stages', default=','.join(sorted(L1Branches.STAGE_LEAVES)), help='Analysis stages whose leaves are enabled (default all)')
+    parser.add_argument('--cache-mb', type=int, default=64, help='TTreeCache per tree [MB], 0 for ROOT\'s default (default %(default)s)')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)	## subprocess mode: one thread count, JSON out
+    opts = parser.parse_args()
+    stages = opts.stages.split(',')
+
+    if opts.run:
+        result = read_events(opts.files, opts.mode, int(opts.threads), opts.max_evt, stages, opts.cache_mb)
+        sys.stdout.write(json.dumps(result) + '\n')
+        return
+
+    print('%8s %10s %10s %10s' % ('threads', 'events', 'seconds', 'events/s'))
+    for n_threads in [int(t) for t in opts.threads.split(',')]:
+        r = run(opts.files, opts.mode, n_threads, opts.max_evt, stages, opts.cache_mb)
+        print('%8d %10d %10.2f %10.0f' % (n_threads, r['events'], r['seconds'], r['events']/max(r['seconds'], 1e-9)))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+## **************************************************************** ##
+##  ROOT, imported on first use                                     ##
+## **************************************************************** ##
+##
+##  'import ROOT' loads the interpreter and the L1Analysis dictionaries,
+##  which takes seconds and needs a CMSSW environment.  The helper
+##  modules use 'from L1Root import R' instead: R behaves like the ROOT
+##  module but imports it only when an attribute is first looked up, so
+##  runs over skims with NumPy output never load ROOT at all.
+
+class _LazyROOT(object):
+
+    def __getattr__(self, name):
+        import ROOT
+        value = getattr(ROOT, name)
+        setattr(self, name, value)	## later lookups skip __getattr__
+        return value
+
+    def available(self):
+        """True if ROOT can be imported."""
+        try: import ROOT
+        except ImportError: return False
+        return True
+
+
+R = _LazyROOT()
@@ -0,0 +1,86 @@
+## **************************************************************** ##
+##  Skim of the events that fire selected L1 seeds                  ##
+## **************************************************************** ##
+##
+##  Overlap studies of e.g. L1_DoubleMu15_7_UPT_DXY1 and L1_DoubleMu0_IP1
+##  only need the few NuGun events that fire them.  SeedSkim is filled
+##  in the rate loop with the seed decisions of each event and keeps
+##  the events passing any of the chosen seeds: run/lumi/event, the
+##  BX = 0 L1 muons the seeds are computed from, and one 'Seeds' column
+##  per chosen seed.  It is written in the L1Skim format, meta.json
+##  adding the seeds and the source event counts for rates:
+##
+##      'events_read'      events the loop went over
+##      'events_passed'    {seed : events firing it}
+##
+##  so rate = events_passed[seed] * scale / events_read.  Read it back
+##  with L1Skim.read_skim(path, ['Evt', 'EmuE', 'uGT', 'Seeds']), or
+##  loop over it with L1Skim.SkimReader([path], ['Evt', 'EmuE', 'uGT']).
+
+import numpy
+
+import L1ColumnReader
+import L1Skim
+
+## Collection : leaf holding the BX of its objects
+BX_LEAVES = {'EmuK' : 'tfMuonBx', 'EmuE' : 'tfMuonBx', 'uGT' : 'muonBx'}
+
+
+class SeedSkim(object):
+    """Events passing any of seeds, with their BX = 0 L1 muons, collected event by event."""
+
+    def __init__(self, seeds, names, active=None, collections=L1ColumnReader.COLLECTIONS):
+        self.seeds = list(seeds)
+        self.collections = collections
+        self.leaves = {}
+        for name in names:
+            tree_name, branch, count, leaves = collections[name]
+            if active is not None:
+                leaves = [(leaf, dtype) for leaf, dtype in leaves if leaf in active.get(branch, ())]
+            self.leaves[name] = leaves
+        self.columns = dict((name, dict((leaf, []) for leaf, dtype in leaves)) for name, leaves in self.leaves.items())
+        self.counts = dict((name, []) for name in names)
+        self.flags = dict((seed, []) for seed in self.seeds)
+        self.events_read = 0
+
+    def fill(self, views, fired):
+        """Keep the current event if it fires any of the seeds.
+
+        views is {name : DataFormat object, VectorViews or EventView}, fired {seed : decision}.
+        """
+        self.events_read += 1
+        flags = [bool(fired[seed]) for seed in self.seeds]
+        if not any(flags): return False
+        for name, leaves in self.leaves.items():
+            view = views[name]
+            if self.collections[name][2] is None:
+                for leaf, dtype in leaves: self.columns[name][leaf].append(numpy.array([getattr(view, leaf)], dtype=dtype))
+                self.counts[name].append(1)
+                continue
+            bx0 = view.array(BX_LEAVES[name]) == 0
+            for leaf, dtype in leaves: self.columns[name][leaf].append(view.array(leaf)[bx0].astype(dtype))
+            self.counts[name].append(int(bx0.sum()))
+        for seed, flag in zip(self.seeds, flags): self.flags[seed].append(flag)
+        return True
+
+    def collections_kept(self):
+        """{name : Collection} of the kept events, 'Seeds' included."""
+        colls = {}
+        for name, leaves in self.leaves.items():
+            offsets = numpy.zeros(len(self.counts[name]) + 1, dtype=numpy.int64)
+            numpy.cumsum(self.counts[name], out=offsets[1:])
+            arrays = dict((leaf, numpy.concatenate(self.columns[name][leaf]) if self.columns[name][leaf] else numpy.zeros(0, dtype=dtype))
+                          for leaf, dtype in leaves)
+            colls[name] = L1ColumnReader.Collection(offsets, arrays)
+        n = len(self.flags[self.seeds[0]]) if self.seeds else 0
+        colls['Seeds'] = L1ColumnReader.Collection(numpy.arange(n + 1, dtype=numpy.int64),
+                                                   dict((seed, numpy.array(self.flags[seed], dtype='u1')) for seed in self.seeds))
+        return colls
+
+    def write(self, path, sources, codec=L1Skim.SKIM_CODEC):
+        """Write the kept events as a skim in path, sources being the input files read."""
+        extra = {'sources' : list(sources), 'seeds' : self.seeds, 'events_read' : self.events_read,
+                 'events_passed' : dict((seed, int(sum(self.flags[seed]))) for seed in self.seeds)}
+        colls = self.collections_kept()
+        L1Skim.write_skim(path, None, len(colls['Seeds'].offsets) - 1, colls, codec, extra)
+        return extra
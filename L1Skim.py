@@ -0,0 +1,214 @@
+## **************************************************************** ##
+##  Slim local cache of the objects the analysis keeps              ##
+## **************************************************************** ##
+##
+##  The analysis only uses gen muons from the LLP decay, L1 muons in
+##  BX = 0 and run/lumi/event, so each input file is skimmed once to a
+##  local directory of compressed columns:
+##
+##      <skim>/meta.json          source file, entries, columns
+##      <skim>/<name>.offsets     per-event offsets into the columns
+##      <skim>/<name>.<leaf>      one column per leaf
+##
+##  Every event is kept, even with no selected object, so event counts
+##  and rate normalisations are unchanged.  Kept objects stay in their
+##  original order.  SkimReader serves the skims with the chunk and
+##  view interface of L1ColumnReader, so the loops run unchanged.
+##
+##  Columns are compressed with the codec given as 'name' or 'name:level'
+##  ('none', 'zlib', 'lz4', 'zstd'), recorded in meta.json; lz4 and zstd
+##  need the lz4 and zstandard packages.  L1SkimBenchmark.py compares
+##  codecs on existing skims.
+
+import os
+import argparse, hashlib, json, shutil, zlib
+
+import numpy
+
+try: import lz4.frame
+except ImportError: lz4 = None
+try: import zstandard
+except ImportError: zstandard = None
+
+import L1ColumnReader
+import L1FriendChain
+import L1GenMuons
+import L1TreeCache
+
+SKIM_VERSION = 1
+LLP_PDG_ID   = 6000113
+SKIM_CODEC   = 'zlib'
+
+## name : (compress(data, level), decompress(data), default level, module needed)
+CODECS = {
+    'none' : (lambda d, l: d, lambda d: d, 0, True),
+    'zlib' : (lambda d, l: zlib.compress(d, l), zlib.decompress, 6, True),
+    'lz4'  : (lambda d, l: lz4.frame.compress(d, compression_level=l), lambda d: lz4.frame.decompress(d), 0, lz4),
+    'zstd' : (lambda d, l: zstandard.ZstdCompressor(level=l).compress(d),
+              lambda d: zstandard.ZstdDecompressor().decompress(d), 3, zstandard),
+}
+
+## name : function of a Collection giving the objects kept, None keeps them all.
+## EMTF muons are kept in every BX: the EMTF ghost cleaning of the signal
+## script compares each BX = 0 muon with all the later ones, whatever their BX.
+SELECTIONS = {
+    'Gen'  : lambda c: L1GenMuons.llp_muon_mask(c['partId'], c['partParent'], LLP_PDG_ID),
+    'EmuK' : lambda c: c['tfMuonBx'] == 0,
+    'EmuE' : None,
+    'uGT'  : lambda c: c['muonBx'] == 0,
+}
+
+
+def parse_codec(text):
+    """(name, level) of a codec given as 'name' or 'name:level'."""
+    name, _, level = text.partition(':')
+    if name not in CODECS: raise ValueError('Unknown codec %s, not one of %s' % (name, ', '.join(sorted(CODECS))))
+    if not CODECS[name][3]: raise ImportError('Codec %s needs the %s package' % (name, 'zstandard' if name == 'zstd' else name))
+    return name, int(level) if level else CODECS[name][2]
+
+
+def select(coll, mask):
+    """Collection with only the objects where mask is True, event structure kept."""
+    if mask is None: return coll
+    kept = numpy.zeros(len(mask)+1, dtype=numpy.int64)
+    numpy.cumsum(mask, out=kept[1:])
+    arrays = dict((leaf, a[mask]) for leaf, a in coll.arrays.items())
+    return L1ColumnReader.Collection(kept[coll.offsets], arrays)
+
+
+def skim_path(skim_dir, source):
+    """Skim directory of one input file: its base name plus a hash of its full path."""
+    base = os.path.splitext(os.path.basename(source))[0]
+    key = hashlib.md5(os.path.abspath(source).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(skim_dir, '%s_%s' % (base, key))
+
+
+def source_stamp(source):
+    """(size, mtime) of an input file, None if it cannot be stat'ed (e.g. a remote URL)."""
+    try: st = os.stat(source)
+    except OSError: return None
+    return [st.st_size, int(st.st_mtime)]
+
+
+def read_meta(path):
+    with open(os.path.join(path, 'meta.json')) as f: return json.load(f)
+
+
+def is_valid(path, source, names, codec=None):
+    """True if path holds an up to date skim of source with all the given collections, in codec if given."""
+    try: meta = read_meta(path)
+    except (IOError, OSError, ValueError): return False
+    if meta['version'] != SKIM_VERSION or meta['source'] != source: return False
+    if codec is not None and [meta.get('codec', 'zlib'), meta.get('level', 6)] != list(parse_codec(codec)): return False
+    if any(name not in meta['columns'] for name in names): return False
+    if 'Gen' in names and meta.get('llp_pdg_id', LLP_PDG_ID) != LLP_PDG_ID: return False
+    stamp = source_stamp(source)
+    return stamp is None or stamp == meta['stamp']
+
+
+def _write_column(path, array, codec='zlib', level=6):
+    with open(path, 'wb') as f: f.write(CODECS[codec][0](numpy.ascontiguousarray(array).tobytes(), level))
+
+
+def _read_column(path, dtype, codec='zlib'):
+    with open(path, 'rb') as f: return numpy.frombuffer(CODECS[codec][1](f.read()), dtype=dtype)
+
+
+def write_skim(path, source, entries, colls, codec=SKIM_CODEC, extra=None):
+    """Write {name : Collection} covering all entries of source as the skim in path.
+
+    extra adds its keys to meta.json; a source of None marks a skim of many files.
+    """
+    codec = parse_codec(codec)
+    tmp = path + '.tmp'
+    if os.path.exists(tmp): shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    columns = {}
+    for name, coll in colls.items():
+        _write_column(os.path.join(tmp, name + '.offsets'), coll.offsets.astype(numpy.int64), *codec)
+        columns[name] = {}
+        for leaf, array in coll.arrays.items():
+            _write_column(os.path.join(tmp, '%s.%s' % (name, leaf)), array, *codec)
+            columns[name][leaf] = array.dtype.str
+    meta = {'version' : SKIM_VERSION, 'source' : source, 'stamp' : source_stamp(source) if source else None,
+            'entries' : entries, 'llp_pdg_id' : LLP_PDG_ID, 'columns' : columns,
+            'codec' : codec[0], 'level' : codec[1]}
+    if extra: meta.update(extra)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f: json.dump(meta, f, indent=1, sort_keys=True)
+    ## Swap in complete skims only, an interrupted one is redone next time
+    if os.path.exists(path): shutil.rmtree(path)
+    os.rename(tmp, path)
+
+
+def read_skim(path, names):
+    """{name : Collection} of a whole skim."""
+    meta = read_meta(path)
+    codec = meta.get('codec', 'zlib')
+    colls = {}
+    for name in names:
+        offsets = _read_column(os.path.join(path, name + '.offsets'), numpy.int64, codec)
+        arrays = dict((leaf, _read_column(os.path.join(path, '%s.%s' % (name, leaf)), dtype, codec))
+                      for leaf, dtype in meta['columns'][name].items())
+        colls[name] = L1ColumnReader.Collection(offsets, arrays)
+    return colls
+
+
+def skim_file(source, path, names, chunk_size=10000, codec=SKIM_CODEC):
+    """Read the given collections of source chunk by chunk and write the selected objects to path."""
+    chain = L1FriendChain.FriendChain([source], L1ColumnReader.trees_for(names))
+    chain.SetActiveLeaves(L1ColumnReader.active_for(names))
+    chain.SetCache(L1TreeCache.CACHE_SIZE)
+    reader = L1ColumnReader.ColumnReader(chain, names, chunk_size)
+    parts = dict((name, []) for name in names)
+    for c in reader.chunks():
+        for name in names:
+            selection = SELECTIONS.get(name)
+            parts[name].append(select(c[name], selection(c[name]) if selection else None))
+    entries = chain.GetEntries()
+    chain.Close()
+    colls = dict((name, L1ColumnReader.concatenate(parts[name]) if parts[name] else L1ColumnReader.empty_collection(name)) for name in names)
+    write_skim(path, source, entries, colls, codec)
+
+
+def skim_files(file_names, skim_dir, names, chunk_size=10000, codec=SKIM_CODEC):
+    """Skim paths of the input files, in order, skimming those not skimmed yet, changed since or in another codec."""
+    paths = []
+    for source in file_names:
+        path = skim_path(skim_dir, source)
+        if not is_valid(path, source, names, codec):
+            print('Skimming %s -> %s' % (source, path))
+            skim_file(source, path, names, chunk_size, codec)
+        paths.append(path)
+    return paths
+
+
+class SkimReader(L1ColumnReader.ArrayReader):
+    """Chunks and per-event views over skims, one per input file, with global entry numbers."""
+
+    def __init__(self, paths, names, chunk_size=10000, collections=L1ColumnReader.COLLECTIONS):
+        self.paths = list(paths)
+        L1ColumnReader.ArrayReader.__init__(self, [read_meta(p)['entries'] for p in self.paths], names, chunk_size, collections)
+
+    def load(self, ifile):
+        return read_skim(self.paths[ifile], self.names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Skim L1Ntuples to a local cache of the objects the analysis keeps')
+    parser.add_argument('skim_dir', help='Directory holding one skim per input file')
+    parser.add_argument('files', nargs='*', help='Input L1Ntuple files')
+    parser.add_argument('--files-from', help='Text file listing the input files, one per line')
+    parser.add_argument('--names', default='Evt,Gen,EmuK,EmuE,uGT', help='Collections to skim (default %(default)s)')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Events read at a time')
+    parser.add_argument('--codec', default=SKIM_CODEC, help='Column compression, name[:level] of %s (default %%(default)s)' % ', '.join(sorted(CODECS)))
+    opts = parser.parse_args()
+
+    file_names = list(opts.files)
+    if opts.files_from:
+        file_names += [l.strip() for l in open(opts.files_from) if l.strip()]
+    if not file_names: parser.error('no input files')
+    skim_files(file_names, opts.skim_dir, opts.names.split(','), opts.chunk_size, opts.codec)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+## **************************************************************** ##
+##  Write time, size and read speed of the skim codecs              ##
+## **************************************************************** ##
+##
+##  Loads existing skims (any codec) and rewrites all their columns with
+##  each codec to a scratch directory: the mix of small hardware-word
+##  integers and float32 kinematics the analysis reads.  Reports write
+##  time, size on disk and full-scan read throughput of the uncompressed
+##  data.  The files are just written, so the read is served from the
+##  page cache and measures decoding; on shared storage the size column
+##  is what limits a cold read.
+##
+##      python L1SkimBenchmark.py skims/0_ab12cd34ef56 skims/1_... --codecs none,lz4,zstd:1,zstd:3,zlib:6
+
+import os, sys, time
+import argparse, shutil, tempfile
+
+import L1Skim
+
+
+def _size(path):
+    return sum(os.path.getsize(os.path.join(path, n)) for n in os.listdir(path))
+
+
+def bench(skims, codec, scratch):
+    """{'write', 'read', 'bytes', 'raw'} of rewriting and re-reading the skims with codec."""
+    names = dict((p, sorted(L1Skim.read_meta(p)['columns'])) for p in skims)
+    colls = dict((p, L1Skim.read_skim(p, names[p])) for p in skims)
+    raw = sum(c.offsets.nbytes + sum(a.nbytes for a in c.arrays.values()) for p in skims for c in colls[p].values())
+
+    paths = [os.path.join(scratch, '%s_%d' % (codec.replace(':', '_'), i)) for i in range(len(skims))]
+    start = time.time()
+    for p, out in zip(skims, paths):
+        meta = L1Skim.read_meta(p)
+        L1Skim.write_skim(out, meta['source'], meta['entries'], colls[p], codec)
+    write = time.time() - start
+    size = sum(_size(out) for out in paths)
+
+    start = time.time()
+    for p, out in zip(skims, paths): L1Skim.read_skim(out, names[p])
+    read = time.time() - start
+    return {'write' : write, 'read' : read, 'bytes' : size, 'raw' : raw}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the skim compression codecs on existing skims')
+    parser.add_argument('skims', nargs='+', help='Skim directories, as made by L1Skim.py')
+    parser.add_argument('--codecs', default='none,zlib:1,zlib:6,lz4,lz4:9,zstd:1,zstd:3,zstd:9',
+                        help='Comma-separated name[:level] codecs (default %(default)s)')
+    parser.add_argument('--scratch', help='Where the rewritten skims go (default a temporary directory, removed after)')
+    opts = parser.parse_args()
+
+    scratch = opts.scratch or tempfile.mkdtemp(prefix='skimbench_')
+    if not os.path.exists(scratch): os.makedirs(scratch)
+    print('%-10s %10s %10s %8s %12s %12s' % ('codec', 'write [s]', 'size [MB]', 'ratio', 'read [MB/s]', 'write [MB/s]'))
+    try:
+        for codec in opts.codecs.split(','):
+            try: L1Skim.parse_codec(codec)
+            except ImportError as e:
+                print('%-10s skipped: %s' % (codec, e))
+                continue
+            r = bench(opts.skims, codec, scratch)
+            print('%-10s %10.2f %10.1f %8.2f %12.0f %12.0f' % (codec, r['write'], r['bytes']/1e6, r['raw']/float(max(r['bytes'], 1)),
+                                                             r['raw']/1e6/max(r['read'], 1e-9), r['raw']/1e6/max(r['write'], 1e-9)))
+            sys.stdout.flush()
+    finally:
+        if not opts.scratch: shutil.rmtree(scratch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+## **************************************************************** ##
+##  Local staging cache of input files on /eos and /afs             ##
+## **************************************************************** ##
+##
+##  The same signal samples are read from EOS many times a day.  A
+##  Stager copies each input file to a local scratch directory the first
+##  time it is opened and serves later opens from the copy:
+##
+##      <stage>/<name>_<hash of the source path>.root
+##
+##  The copy gets the source's mtime, so it is used only while its size
+##  and mtime still match the source, and copied again otherwise.  Its
+##  atime is set at every use, and the least recently used copies are
+##  removed to keep the directory under max_bytes.  Copies are written
+##  under a temporary name and renamed, so several jobs can share one
+##  stage directory.  Files that cannot be stat'ed (e.g. root:// URLs)
+##  or that are larger than the whole cache are read in place.
+##
+##  With ahead > 0 the next files are copied by a pool of background
+##  threads while the current one is processed: prefetch() schedules
+##  them, stage() waits only for a file whose copy is still running.
+##  Files staged ahead or open are never evicted.  A copy that fails
+##  (full disk, EOS read error) is removed and the source read in
+##  place.  Temporary copies are named after the host and process that
+##  write them, and at start-up the ones of this host's dead processes
+##  are removed; those of other hosts sharing the directory are left.
+
+import os, errno, time
+import hashlib, shutil, socket, threading
+from multiprocessing.pool import ThreadPool
+
+STAGE_SUFFIX = '.root'
+TMP_SUFFIX   = '.tmp'
+HOST         = socket.gethostname().replace('.', '_')	## tag of this host in the temporary copy names
+
+
+def staged_path(stage_dir, source):
+    """Local copy of one input file: its base name plus a hash of its full path."""
+    base = os.path.splitext(os.path.basename(source))[0]
+    key = hashlib.md5(os.path.abspath(source).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(stage_dir, '%s_%s%s' % (base, key, STAGE_SUFFIX))
+
+
+def _stat(path):
+    try: return os.stat(path)
+    except OSError: return None
+
+
+def _running(pid):
+    try: os.kill(pid, 0)
+    except OSError as e: return e.errno == errno.EPERM
+    return True
+
+
+def is_current(path, src):
+    """True if the copy in path has the size and mtime of the source stat src."""
+    st = _stat(path)
+    return st is not None and st.st_size == src.st_size and int(st.st_mtime) == int(src.st_mtime)
+
+
+class Stager(object):
+    """Copies of the input files in stage_dir, at most max_bytes in total, least recently used removed first."""
+
+    def __init__(self, stage_dir, max_bytes, ahead=0, workers=1):
+        self.stage_dir = stage_dir
+        self.max_bytes = max_bytes
+        self.ahead = ahead		## files staged in the background ahead of the current one
+        self.hits, self.copies, self.bytes_copied = 0, 0, 0
+        self.n_done = 0
+        self._pool = ThreadPool(workers) if ahead > 0 else None
+        self._pending = {}		## source : AsyncResult of its background copy
+        self._open = set()		## sources staged ahead or being processed
+        self._keep = set()		## their local paths, not evicted
+        self._lock = threading.Lock()
+        if not os.path.exists(stage_dir):
+            try: os.makedirs(stage_dir)
+            except OSError:
+                if not os.path.isdir(stage_dir): raise
+        self.sweep()
+
+    def staged(self, suffix=STAGE_SUFFIX):
+        """[(atime, size, path)] of the copies (temporary copies with suffix=TMP_SUFFIX) in the stage directory."""
+        out = []
+        for name in os.listdir(self.stage_dir):
+            if not name.endswith(suffix): continue
+            path = os.path.join(self.stage_dir, name)
+            st = _stat(path)
+            if st is not None: out.append((st.st_atime, st.st_size, path))
+        return out
+
+    def sweep(self):
+        """Remove the temporary copies left by killed processes of this host; other hosts' copies are not touched."""
+        for atime, size, path in self.staged(TMP_SUFFIX):
+            try:
+                host, pid = path[:-len(TMP_SUFFIX)].split('.')[-3:-1]
+                pid = int(pid)
+            except ValueError: continue
+            if host != HOST or _running(pid): continue
+            try: os.remove(path)
+            except OSError: pass
+
+    def evict(self, needed, keep=None):
+        """Remove the least recently used copies until needed more bytes fit, copies under way counted."""
+        staged = sorted(self.staged())
+        total = sum(size for atime, size, path in staged) + sum(size for atime, size, path in self.staged(TMP_SUFFIX))
+        for atime, size, path in staged:
+            if total + needed <= self.max_bytes: break
+            if path == keep or path in self._keep: continue
+            try: os.remove(path)	## a job still reading it keeps its open file
+            except OSError: pass
+            total -= size
+
+    def _touch(self, path, src):
+        os.utime(path, (time.time(), src.st_mtime))
+
+    def _stage(self, source):
+        src = _stat(source)
+        if src is None or src.st_size > self.max_bytes: return source
+        path = staged_path(self.stage_dir, source)
+        with self._lock: self._keep.add(path)
+        if is_current(path, src):
+            with self._lock: self.hits += 1
+        else:
+            with self._lock: self.evict(src.st_size, keep=path)
+            tmp = '%s.%s.%d.%s%s' % (path, HOST, os.getpid(), threading.current_thread().ident, TMP_SUFFIX)
+            try:
+                shutil.copyfile(source, tmp)
+                os.utime(tmp, (time.time(), src.st_mtime))
+                os.rename(tmp, path)
+            except (IOError, OSError) as e:
+                print('Staging %s failed (%s), reading it in place' % (source, e))
+                return source
+            finally:
+                if os.path.exists(tmp): os.remove(tmp)
+            with self._lock:
+                self.copies += 1
+                self.bytes_copied += src.st_size
+        self._touch(path, src)
+        return path
+
+    def prefetch(self, sources):
+        """Start copying these sources in the background, unless already staged or under way."""
+        if self._pool is None: return
+        for source in sources:
+            if source in self._open: continue
+            self._open.add(source)
+            self._pending[source] = self._pool.apply_async(self._stage, (source,))
+
+    def stage(self, source):
+        """Path to open for source: the local copy, made or refreshed if needed, else source itself."""
+        self._open.add(source)
+        pending = self._pending.pop(source, None)
+        return pending.get() if pending else self._stage(source)
+
+    def release(self, source):
+        """Done with source: its copy may be evicted again."""
+        if source not in self._open: return
+        self._open.discard(source)
+        with self._lock: self._keep.discard(staged_path(self.stage_dir, source))
+        self.n_done += 1
+
+    def progress(self, total):
+        ready = sum(1 for p in self._pending.values() if p.ready())
+        return 'Staging: %d staged ahead, %d copying, %d processing, %d done of %d files' % (
+            ready, len(self._pending) - ready, len(self._open) - len(self._pending), self.n_done, total)
+
+    def close(self):
+        """Wait for the background copies still running and stop their threads."""
+        if self._pool is None: return
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+        self._pending = {}
+
+    def summary(self):
+        return 'Staging: %d files from %s, %d copied (%.1f MB)' % (
+            self.hits + self.copies, self.stage_dir, self.copies, self.bytes_copied/1e6)
@@ -0,0 +1,63 @@
+## **************************************************************** ##
+##  TTreeCache set-up and read statistics for the L1Ntuple trees    ##
+## **************************************************************** ##
+##
+##  Every tree of a FriendChain file gets its own TTreeCache.  With the
+##  active leaves known, only those branches are registered and the
+##  learning phase is skipped; otherwise the cache learns which
+##  branches are read over the first learn_entries entries.  With async
+##  prefetching on, the next cluster is read by a ROOT thread while
+##  Python works on the current one.  Must be enabled before the files
+##  are opened.  Implicit MT additionally lets GetEntry (and Draw, used
+##  by the columnar reader) decompress the branches in parallel.
+
+from L1Root import R
+
+CACHE_SIZE    = 64*1024*1024	## bytes per tree
+LEARN_ENTRIES = 100		## entries in the learning phase when the active branches are not known
+
+
+def enable_async_prefetch():
+    """Read ahead the next cluster in a background thread, for files opened from now on."""
+    R.gEnv.SetValue('TFile.AsyncPrefetching', 1)
+
+
+def enable_implicit_mt(n_threads):
+    """Decompress the branches read by each GetEntry with a pool of n_threads ROOT threads."""
+    R.ROOT.EnableImplicitMT(n_threads)
+    print('ROOT implicit MT with %d threads' % R.ROOT.GetThreadPoolSize())
+
+
+def configure(tree, active=None, cache_size=CACHE_SIZE, learn_entries=LEARN_ENTRIES):
+    """Give tree a cache_size TTreeCache filled with the active leaves, or learnt over learn_entries."""
+    tree.SetCacheSize(cache_size)
+    if active is None:
+        tree.SetCacheLearnEntries(learn_entries)
+        return
+    branches = tree.GetListOfBranches()
+    for branch, leaves in active.items():
+        if not branches.FindObject(branch): continue
+        for leaf in leaves: tree.AddBranchToCache('%s.%s' % (branch, leaf), False)
+    tree.StopCacheLearningPhase()
+
+
+def file_stats(tfile, trees):
+    """Bytes and read calls of an open file, with (hit ratio, prefetch usage) of each tree's cache."""
+    caches = {}
+    for tree in trees:
+        cache = tfile.GetCacheRead(tree)
+        if cache: caches[tree.GetName()] = (cache.GetEfficiencyRel(), cache.GetEfficiency())
+    return {'bytes' : tfile.GetBytesRead(), 'calls' : tfile.GetReadCalls(), 'caches' : caches}
+
+
+def summary(stats):
+    """Totals over files, and per tree the hit ratio and prefetch usage weighted by bytes read."""
+    total = sum(s['bytes'] for s in stats)
+    lines = ['Read %.1f MB in %d calls from %d files' % (total/1e6, sum(s['calls'] for s in stats), len(stats))]
+    names = sorted(set(name for s in stats for name in s['caches']))
+    for name in names:
+        w = [(s['bytes'], s['caches'][name]) for s in stats if name in s['caches']]
+        norm = sum(b for b, c in w) or 1
+        lines.append('  %-24s cache hit ratio %.3f, prefetched baskets used %.3f' %
+                     (name, sum(b*c[0] for b, c in w)/norm, sum(b*c[1] for b, c in w)/norm))
+    return '\n'.join(lines)
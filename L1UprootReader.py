@@ -0,0 +1,81 @@
+## **************************************************************** ##
+##  L1Ntuple reader without ROOT or the L1Analysis dictionaries     ##
+## **************************************************************** ##
+##
+##  The L1Ntuple trees are split, so every leaf of L1Upgrade, of the TF
+##  muon collections and of Generator is its own branch of plain numbers
+##  or std::vector<number>.  uproot decodes those straight into arrays,
+##  with no CMSSW build and no ROOT install: UprootReader loads the
+##  leaves of COLLECTIONS for one whole file at a time and serves them
+##  with the chunk and view interface of L1ColumnReader.
+##
+##  Needs the uproot and awkward packages (pip install uproot).
+
+import numpy
+
+try:
+    import uproot
+    import awkward
+except ImportError:
+    uproot = awkward = None
+
+import L1ColumnReader
+
+
+def _require():
+    if uproot is None: raise ImportError('The uproot reader needs the uproot and awkward packages')
+
+
+def count_trees(path, trees):
+    """{tree : entries} for the trees found in one file."""
+    _require()
+    entries = {}
+    with uproot.open(path) as f:
+        for name in trees:
+            if name in f: entries[name] = int(f[name].num_entries)
+    return entries
+
+
+def read_file(path, names, collections=L1ColumnReader.COLLECTIONS, active=None):
+    """{name : Collection} of all entries of one file.
+
+    With active = {branch : leaves}, only those leaves of each collection are read.
+    """
+    _require()
+    out = {}
+    with uproot.open(path) as f:
+        for name in names:
+            tree_name, branch, count, leaves = collections[name]
+            if active is not None:
+                leaves = [(leaf, dtype) for leaf, dtype in leaves if leaf in active.get(branch, ())]
+            tree = f[tree_name]
+            arrays = {}
+            if count is None:
+                offsets = numpy.arange(tree.num_entries + 1, dtype=numpy.int64)
+                for leaf, dtype in leaves:
+                    arrays[leaf] = numpy.asarray(tree['%s/%s' % (branch, leaf)].array(library='np')).astype(dtype)
+            else:
+                counts = numpy.asarray(tree['%s/%s' % (branch, count)].array(library='np')).astype(numpy.int64)
+                offsets = numpy.zeros(len(counts)+1, dtype=numpy.int64)
+                numpy.cumsum(counts, out=offsets[1:])
+                for leaf, dtype in leaves:
+                    jagged = tree['%s/%s' % (branch, leaf)].array(library='ak')
+                    arrays[leaf] = awkward.to_numpy(awkward.flatten(jagged)).astype(dtype)
+            out[name] = L1ColumnReader.Collection(offsets, arrays)
+    return out
+
+
+class UprootReader(L1ColumnReader.ArrayReader):
+    """Chunks and per-event views over L1Ntuple files decoded by uproot, one file at a time."""
+
+    def __init__(self, file_names, names, chunk_size=10000, collections=L1ColumnReader.COLLECTIONS,
+                 entries=None, active=None):
+        self.file_names = list(file_names)
+        if entries is None:
+            tree_name = collections[names[0]][0]
+            entries = [count_trees(p, [tree_name])[tree_name] for p in self.file_names]
+        L1ColumnReader.ArrayReader.__init__(self, entries, names, chunk_size, collections)
+        self.active = active
+
+    def load(self, ifile):
+        return read_file(self.file_names[ifile], self.names, self.collections, self.active)
@@ -0,0 +1,56 @@
+## **************************************************************** ##
+##  NumPy views over the std::vector members of L1Analysis formats  ##
+## **************************************************************** ##
+##
+##  Gen_br.partVx[i], uGT_br.muonBx[i], ... cost one PyROOT call per
+##  element per use.  as_array(Gen_br.partVx) wraps the vector's own
+##  buffer in a NumPy array instead, without copying, so per-event work
+##  can be vectorised.  A view is only valid until the next GetEntry,
+##  which may reallocate the vector: VectorViews keeps the views of one
+##  event and is reset after each GetEntry, like the columnar EventView,
+##  whose array(leaf) has the same meaning.
+
+import numpy
+
+import L1ColumnReader
+
+## C++ element type : NumPy dtype
+DTYPES = {
+    'float' : 'f4', 'double' : 'f8',
+    'char' : 'i1', 'short' : 'i2', 'int' : 'i4', 'long' : 'i8', 'long long' : 'i8',
+    'unsigned char' : 'u1', 'unsigned short' : 'u2', 'unsigned int' : 'u4',
+    'unsigned long' : 'u8', 'unsigned long long' : 'u8',
+    'short int' : 'i2', 'long int' : 'i8', 'short unsigned int' : 'u2', 'long unsigned int' : 'u8',
+}
+
+
+def vector_dtype(vec):
+    """NumPy dtype of the elements of a std::vector proxy, from its C++ type name."""
+    cls = type(vec)
+    name = getattr(cls, '__cpp_name__', cls.__name__)	## cppyy, or PyROOT before ROOT 6.22
+    inner = name[name.index('<')+1:name.rindex('>')].split(',')[0].strip()
+    if inner.startswith('std::'): inner = inner[len('std::'):]
+    if inner not in DTYPES: raise TypeError('No NumPy view for %s' % name)
+    return numpy.dtype(DTYPES[inner])
+
+
+def as_array(vec):
+    """NumPy array over the buffer of a std::vector, no copy; valid until the vector changes."""
+    return L1ColumnReader.buffer_view(vec.data(), int(vec.size()), vector_dtype(vec))
+
+
+class VectorViews(object):
+    """NumPy views of the current event's vector members of an L1Analysis data format object."""
+
+    def __init__(self, obj):
+        self._obj = obj
+        self._cache = {}
+
+    def reset(self):
+        """Forget the views, to be called after each GetEntry."""
+        self._cache = {}
+
+    def array(self, leaf):
+        a = self._cache.get(leaf)
+        if a is None: a = self._cache[leaf] = as_array(getattr(self._obj, leaf))
+        return a
@@ -4,21 +4,57 @@
 ##  Look at properties of displaced muons from Kalman algo in BMTF  ##
 ## **************************************************************** ##
 
-import os
-
-import ROOT as R
+import os, sys
+import argparse, json
+
+from L1Root import R
+import numpy
+import L1ColumnReader
+import L1ColumnStore
+import L1FriendChain
+import L1Manifest
+import L1Branches
+import L1Skim
+import L1UprootReader
+import L1Accumulators
+import L1Parallel
+import L1Staging
+import L1TreeCache
+import L1VectorViews
+import L1Hist
+import L1Kinematics
+import L1Memo
+import L1EventIndex
+import L1SeedSkim
 from math import * 
-R.gROOT.SetBatch(False)  ## Don't print histograms to screen while processing
 
 PRT_EVT  = 10000   ## Print every Nth event
 MAX_EVT  = 1000000 ## Number of events to process
 VERBOSE  = False  ## Verbose print-out
-
-style1 = R.TStyle("style1", "For Histograms")
-style1.SetLineWidth(2)
-style1.SetOptStat(0)
-
-R.gROOT.SetStyle("style1")
+READER   = 'branch'  ## 'branch' : SetBranchAddress + GetEntry per event, 'columnar' : chunked NumPy arrays, 'uproot' : NumPy arrays without ROOT, 'skim' : local skim cache
+CHUNK_SIZE = 10000   ## Events per chunk in columnar and skim mode
+SKIM_DIR = 'skims/'  ## Skim cache, one skim per input file, made on first use
+SKIM_CODEC = 'zlib'  ## Skim compression, 'none', 'zlib', 'lz4' or 'zstd', optionally ':level' (see L1SkimBenchmark.py)
+COLUMN_STORE = ''    ## Memory-mapped decoded columns for columnar mode, made on first use; '' decodes every run
+CACHE_MB = 64        ## TTreeCache per tree [MB], with async read-ahead; 0 keeps ROOT's default
+CHECKPOINT_EVT = 50000  ## Events between checkpoints with --checkpoint
+STAGE_DIR = ''  ## Local scratch directory for copies of the input files, made on first use; '' reads them in place
+STAGE_GB = 100    ## Size cap of STAGE_DIR [GB], least recently used copies removed first
+STAGE_AHEAD = 2   ## Input files copied in the background ahead of the one being processed
+STAGE_WORKERS = 2 ## Concurrent background copies
+MANIFEST_DIR = 'manifests/'  ## Saved scans of the input directories (files, entries), made on first use
+STAGES   = ['event', 'rate_seeds', 'emtf_rate']  ## Only the leaves these read are enabled
+SEED_SKIM = ['L1_DoubleMu15_7_UPT_DXY1', 'L1_DoubleMu0_IP1']  ## Seeds whose events --seed-skim DIR keeps, any of them firing
+
+## ROOT output only: with --npz, ROOT is never imported
+def set_style():
+    R.gROOT.SetBatch(False)  ## Don't print histograms to screen while processing
+    style1 = R.TStyle("style1", "For Histograms")
+    style1.SetLineWidth(2)
+    style1.SetOptStat(0)
+
+    R.gROOT.SetStyle("style1")
+    return style1
 
 def getPhi(globalPhiHw) :
     phi = globalPhiHw/287.5*pi if globalPhiHw<287.5 else \
@@ -26,7 +62,9 @@ def getPhi(globalPhiHw) :
 
     return phi 
 
-def main():
+def main(opts=None):
+
+    if opts is None: opts = parse_options([])
 
     print '\nInside DisplacedMuons\n'
     evtclass = ["NuGun_rate", "OldNuGun_rate", "signal_3000_rate"]
@@ -35,34 +73,77 @@ def main():
     inputdir = ['/eos/cms/store/group/dpg_trigger/comm_trigger/L1Trigger/bundocka/condor/reHcalTP_Nu_11_2_105p20p1_1623921599/', '/eos/cms/store/group/dpg_trigger/comm_trigger/L1Trigger/stempl/condor/menu_Nu_11_0_X_1614189426/','/eos/user/s/sonawane/temp/L1Ntuples/signal_tuples/ntuples_01_07_21/HTo2LongLivedTo4mu_MH-125_MFF-50_CTau-3000mm_11_2_X_1623847924/']
 # /eos/cms/store/group/dpg_trigger/comm_trigger/L1Trigger/elfontan/condor/reMu_reHcalTP_PFA1p_v15_LUTGenTrue_kBMTFghostbusting_uptScales_newNuGun_tagv16/
     workdir = '/afs/cern.ch/user/s/sonawane/L1T/L1studies/L1_scripts_Alberto/L1RunIII/macros/'
-    in_file_names = []
-    for i in range(nevt[evtclassid]):
-        path = inputdir[evtclassid]+str(i)+".root"
-        if not os.path.exists(path): continue
-	in_file_names.append(path)
+    trees = [L1FriendChain.UGT_TREE, L1FriendChain.TFMU_TREE, L1FriendChain.EVT_TREE]
+    in_file_names, in_file_entries = L1Manifest.input_files(inputdir[evtclassid], nevt[evtclassid], trees, MANIFEST_DIR, opts.rescan)
+
+    ## Input list given on the command line (e.g. by the parallel mode for each worker)
+    if opts.files_from:
+        in_file_names = [l.strip() for l in open(opts.files_from) if l.strip()]
+        in_file_entries = None
+
+    ## Incremental mode: files already in the state, unchanged since, are not read again
+    if opts.incremental:
+        stamps = L1Accumulators.file_stamps(in_file_names)
+        done = L1Accumulators.read_cursor(opts.incremental)['files'] if os.path.exists(opts.incremental) else []
+        new, changed, missing = L1Accumulators.split_new(stamps, done)
+        if changed:
+            raise RuntimeError('Files changed since %s was saved, remove it to start over: %s' % (opts.incremental, ', '.join(s[0] for s in changed)))
+        if missing:
+            raise RuntimeError('Files in %s are no longer inputs, remove it to start over: %s' % (opts.incremental, ', '.join(s[0] for s in missing)))
+        print '\n%d files already in %s, %d new' % (len(stamps) - len(new), opts.incremental, len(new))
+        if in_file_entries is not None:
+            in_file_entries = [n for n, s in zip(in_file_entries, stamps) if s in new]
+        in_file_names = [s[0] for s in new]
+
+    ## Debug mode: only the events asked for, found through the (run, lumi, event) index of the inputs
+    picked = None
+    if opts.events:
+        index = L1EventIndex.index_for(in_file_names, MANIFEST_DIR)
+        in_file_names, in_file_entries, picked = L1EventIndex.select(index, opts.events)
+        print '\n%d events in %d files' % (len(picked), len(in_file_names))
     
     scale = [2544*11246., 2544*11246., 1.]
 
     if not os.path.exists(workdir+'plots'): os.makedirs(workdir+'plots')
 
     out_file_str = 'DisplacedMuons_'+evtclass[evtclassid]
-    out_file_str += ('_%dk' % (MAX_EVT / 1000))
-    out_file = R.TFile(workdir+'plots/'+out_file_str+'.root','recreate')
-
-    chains = {}
-    chains['Evt'] = []  ## Event info
-   # chains['Emu'] = []  ## Emulated Kalman BMTF
-    chains['EmuE'] = []  ## Emulated EMTF
-    chains['uGT'] = []  ## Global Trigger
-    chains['Evt'].append( R.TChain('l1EventTree/L1EventTree') )
-    chains['EmuE'].append( R.TChain('l1UpgradeTfMuonEmuTree/L1UpgradeTfMuonTree') )
-    chains['uGT'].append( R.TChain('l1UpgradeEmuTree/L1UpgradeTree') )
+    out_file_str += '_incremental' if opts.incremental else ('_%dk' % (MAX_EVT / 1000))	## incremental runs read all events
+    if opts.events: out_file_str += '_events'
+    if opts.shard and not opts.partial: opts.partial = workdir+'plots/'+out_file_str+'_shard%d_of_%d.root' % opts.shard
+    out_ext = '.npz' if opts.npz else '.root'
+
+    ## Output reuse: an output finished by a run over the same inputs, configuration
+    ## and code is returned as it is (partial, merged, incremental, --events and --seed-skim runs excluded)
+    out_path = workdir+'plots/'+out_file_str+out_ext
+    memo = None
+    if not (opts.partial or opts.merge or opts.incremental or opts.events or opts.seed_skim):
+        config = L1Memo.config_of(globals())
+        config.update(evtclassid=evtclassid, nevt=nevt, scale=scale)
+        memo = L1Memo.fingerprint(in_file_names, config, L1Memo.code_version(__file__))
+        if not opts.force and L1Memo.is_current(out_path, memo):
+            print '\nInputs, configuration and code unchanged, reusing plots/'+out_file_str+out_ext+' (--force to rerun)'
+            saved = L1Accumulators.Counters(L1Memo.summary(out_path))
+            print_summary(saved, saved.pop('iEvt'), scale[evtclassid])
+            return out_path
+        L1Memo.forget(out_path)
+
+    if opts.npz:     out_file = L1Hist.NpzFile(out_path)
+    elif opts.partial: out_file = R.TFile(opts.partial, 'recreate')
+    else:            out_file = R.TFile(out_path,'recreate')
+    if not opts.npz: style = set_style()
+
+    ## One chain, each file opened once: Global Trigger, emulated EMTF and Event info trees joined as friends
+    chains = []
+    chains.append( L1FriendChain.FriendChain(in_file_names, trees, in_file_entries) )
+    chains[0].SetActiveLeaves( L1Branches.active_leaves(STAGES) )
+    if CACHE_MB: chains[0].SetCache( CACHE_MB*1024*1024 )
+    if opts.imt: L1TreeCache.enable_implicit_mt(opts.imt)
+    stager = L1Staging.Stager(STAGE_DIR, STAGE_GB*1024**3, STAGE_AHEAD, STAGE_WORKERS) if STAGE_DIR else None
+    if stager: chains[0].SetStaging( stager )
+    seed_skim = L1SeedSkim.SeedSkim(SEED_SKIM, ['Evt', 'EmuE', 'uGT'], chains[0].active) if opts.seed_skim else None
 
     for i in range(len(in_file_names)):
         print 'Adding file %s' % in_file_names[i]
-        chains['Evt'][0].Add( in_file_names[i] )
-        chains['EmuE'][0].Add( in_file_names[i] )
-        chains['uGT'][0].Add( in_file_names[i] )
 
 
 # Rate histograms
@@ -79,59 +160,62 @@ def main():
 #    h_kBMTF_singlemu_rate_ptOr		= 	R.TH1F('h_kBMTF_singlemu_rate_ptOr',	'Dimuon Pt rate ; L1 Mu Pt; Rate [Hz]',	150, 0, 150)
 #    h_kBMTF_singlemu_rate_ptDisp_Lxy2	= 	R.TH1F('h_kBMTF_singlemu_rate_ptDisp_Lxy2',	'Dimuon Pt rate ; L1 Mu Pt; Rate [Hz]',	150, 0, 150)
 
-    h_EMTF_rate_vs_ptthreshold_L1dxy0 	= R.TH1F('h_EMTF_rate_vs_ptthreshold_L1dxy0', 'Rate vs L1 Pt Threshold ; L1 pT threshold [GeV]; Rate [kHz]', 150, 0, 150)
-    h_EMTF_rate_vs_ptthreshold_L1dxy1 	= R.TH1F('h_EMTF_rate_vs_ptthreshold_L1dxy1', 'Rate vs L1 Pt Threshold ; L1 pT threshold [GeV]; Rate [kHz]', 150, 0, 150)
-    h_EMTF_rate_vs_ptthreshold_L1dxy2 	= R.TH1F('h_EMTF_rate_vs_ptthreshold_L1dxy2', 'Rate vs L1 Pt Threshold ; L1 pT threshold [GeV]; Rate [kHz]', 150, 0, 150)
-    h_EMTF_rate_vs_ptthreshold_L1dxy3	= R.TH1F('h_EMTF_rate_vs_ptthreshold_L1dxy3', 'Rate vs L1 Pt Threshold ; L1 pT threshold [GeV]; Rate [kHz]', 150, 0, 150)
+    TH1F = L1Hist.Hist1D if opts.npz else R.TH1F	## NumPy histograms for .npz output
+    h_EMTF_rate_vs_ptthreshold_L1dxy0 	= TH1F('h_EMTF_rate_vs_ptthreshold_L1dxy0', 'Rate vs L1 Pt Threshold ; L1 pT threshold [GeV]; Rate [kHz]', 150, 0, 150)
+    h_EMTF_rate_vs_ptthreshold_L1dxy1 	= TH1F('h_EMTF_rate_vs_ptthreshold_L1dxy1', 'Rate vs L1 Pt Threshold ; L1 pT threshold [GeV]; Rate [kHz]', 150, 0, 150)
+    h_EMTF_rate_vs_ptthreshold_L1dxy2 	= TH1F('h_EMTF_rate_vs_ptthreshold_L1dxy2', 'Rate vs L1 Pt Threshold ; L1 pT threshold [GeV]; Rate [kHz]', 150, 0, 150)
+    h_EMTF_rate_vs_ptthreshold_L1dxy3	= TH1F('h_EMTF_rate_vs_ptthreshold_L1dxy3', 'Rate vs L1 Pt Threshold ; L1 pT threshold [GeV]; Rate [kHz]', 150, 0, 150)
 
 
     ########################
     ### Seed event counter
     ########################
 
-    L1_SingleMu7 	= 0
-    L1_SingleMu22 	= 0
-    L1_SingleMu25 	= 0
-    L1_DoubleMu15_7	= 0
-    L1_DoubleMu18_er2p1	= 0
-
-    L1_SingleMu18er1p5			= 0
-    L1_DoubleMu0_SQ			= 0
-    L1_DoubleMu_15_5_SQ			= 0
-    L1_DoubleMu0er1p5_SQ		= 0
-    L1_DoubleMu0er1p5_SQ_OS		= 0
-    L1_DoubleMu0er1p5_SQ_dR_Max1p4	= 0
-    L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4	= 0
-    L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7 = 0
-    L1_DoubleMu4p5er2p0_SQ_OS		= 0
-    L1_DoubleMu4p5_SQ_OS_dR_Max1p2 	= 0
-    L1_DoubleMu4_SQ_OS			= 0
-    L1_DoubleMu0_SQ_OS			= 0
-
-    L1_SingleMu22	= 0
-    L1_SingleMu22_BMTF	= 0
-    L1_SingleMu22_OMTF	= 0
-    L1_SingleMu22_EMTF	= 0
-
-    L1_DoubleMu15_7_BMTF	= 0
-    L1_DoubleMu15_7_BMTF_UPT	= 0
-    L1_DoubleMu15_7_UPT		= 0
-    L1_DoubleMu15_7_UPT_IP1 	= 0
-
-    L1_DoubleMu_15_7_SQ		= 0
-    L1_DoubleMu_15_7_UPT_SQ	= 0
-    L1_DoubleMu15_7_UPT_DXY1	= 0 
-    L1_DoubleMu0_IP1	= 0 
-
-    Baseline_Run_2			= 0
-    Extended_Run_2			= 0
-    Extended_Run_2A			= 0
-    Extended_Run_2B			= 0
-    Baseline_Run_2_BMTF_UPT		= 0
-    Baseline_Run_2_UPT			= 0
-    Baseline_Run_2_UPT_DXY1		= 0
-    Extended_Run_2_UPT_DXY1		= 0
-    Extended_Run_2_UPT			= 0
+    cnt = L1Accumulators.Counters()
+
+    cnt.L1_SingleMu7 	= 0
+    cnt.L1_SingleMu22 	= 0
+    cnt.L1_SingleMu25 	= 0
+    cnt.L1_DoubleMu15_7	= 0
+    cnt.L1_DoubleMu18_er2p1	= 0
+
+    cnt.L1_SingleMu18er1p5			= 0
+    cnt.L1_DoubleMu0_SQ			= 0
+    cnt.L1_DoubleMu_15_5_SQ			= 0
+    cnt.L1_DoubleMu0er1p5_SQ		= 0
+    cnt.L1_DoubleMu0er1p5_SQ_OS		= 0
+    cnt.L1_DoubleMu0er1p5_SQ_dR_Max1p4	= 0
+    cnt.L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4	= 0
+    cnt.L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7 = 0
+    cnt.L1_DoubleMu4p5er2p0_SQ_OS		= 0
+    cnt.L1_DoubleMu4p5_SQ_OS_dR_Max1p2 	= 0
+    cnt.L1_DoubleMu4_SQ_OS			= 0
+    cnt.L1_DoubleMu0_SQ_OS			= 0
+
+    cnt.L1_SingleMu22	= 0
+    cnt.L1_SingleMu22_BMTF	= 0
+    cnt.L1_SingleMu22_OMTF	= 0
+    cnt.L1_SingleMu22_EMTF	= 0
+
+    cnt.L1_DoubleMu15_7_BMTF	= 0
+    cnt.L1_DoubleMu15_7_BMTF_UPT	= 0
+    cnt.L1_DoubleMu15_7_UPT		= 0
+    cnt.L1_DoubleMu15_7_UPT_IP1 	= 0
+
+    cnt.L1_DoubleMu_15_7_SQ		= 0
+    cnt.L1_DoubleMu_15_7_UPT_SQ	= 0
+    cnt.L1_DoubleMu15_7_UPT_DXY1	= 0 
+    cnt.L1_DoubleMu0_IP1	= 0 
+
+    cnt.Baseline_Run_2			= 0
+    cnt.Extended_Run_2			= 0
+    cnt.Extended_Run_2A			= 0
+    cnt.Extended_Run_2B			= 0
+    cnt.Baseline_Run_2_BMTF_UPT		= 0
+    cnt.Baseline_Run_2_UPT			= 0
+    cnt.Baseline_Run_2_UPT_DXY1		= 0
+    cnt.Extended_Run_2_UPT_DXY1		= 0
+    cnt.Extended_Run_2_UPT			= 0
 
 ######### new seeds ##########
 
@@ -148,43 +232,106 @@ def main():
 
     ###################
 
+    ## Parallel and merge mode: partial results, from workers run here over groups of files
+    ## or from earlier --shard jobs, are added into the booked histograms; the loop is skipped
+    if opts.workers > 1 or opts.merge:
+        if opts.merge:
+            partials = opts.merge
+        else:
+            groups = L1Parallel.plan(in_file_names, chains[0].file_entries(), MAX_EVT, opts.workers)
+            partials = L1Parallel.run_workers(sys.argv[0], groups, ['--imt', str(opts.imt)] if opts.imt else [])
+        cnt.add(L1Accumulators.merge_partials(partials, out_file, opts.force))
+        if not opts.merge: L1Parallel.cleanup(partials)
+        iEvt = cnt.pop('iEvt')
+        if stager: stager.close()
+        chains = []
+
+    ## Checkpoints hold the accumulators and the cursor of the next event to process;
+    ## --resume reloads them, so the loop carries on as if never interrupted
+    run = {'files' : in_file_names, 'max_evt' : MAX_EVT, 'shard' : opts.shard}
+    resume = None
+    if opts.resume and os.path.exists(opts.checkpoint):
+        counters, resume = L1Accumulators.read_checkpoint(opts.checkpoint, out_file)
+        if resume['run'] != json.loads(json.dumps(run)):
+            raise RuntimeError('Checkpoint %s is from a run over other inputs or events' % opts.checkpoint)
+        cnt.update(counters)
+        iEvt = resume['iEvt']
+        print '\nResuming from %s at event %d (entry %d of chain %d)' % (opts.checkpoint, iEvt, resume['jEvt'], resume['iCh'])
+    if opts.incremental and done:
+        cnt.update(L1Accumulators.read_checkpoint(opts.incremental, out_file)[0])
+        iEvt = cnt.pop('iEvt')
+
     print '\nEntering loop over chains'
-    for iCh in range(len(chains['uGT'])):
+    for iCh in range(len(chains)):
 
-        if iEvt >= MAX_EVT: break
+        if iEvt >= MAX_EVT and not opts.incremental: break	## incremental runs read the new files in full
+        if resume and iCh < resume['iCh']: continue
 
         ## Faster tecnhique, inspired by https://github.com/thomreis/l1tMuonTools/blob/master/L1Analysis.py
-        Evt_br = R.L1Analysis.L1AnalysisEventDataFormat()
-        Unp_br = R.L1Analysis.L1AnalysisL1UpgradeTfMuonDataFormat()
-        EmuE_br = R.L1Analysis.L1AnalysisL1UpgradeTfMuonDataFormat()
-        uGT_br = R.L1Analysis.L1AnalysisL1UpgradeDataFormat()
-#        Kmt_br = R.L1Analysis.L1AnalysisBMTFOutputDataFormat()
-
-        chains['Evt'][iCh].SetBranchAddress('Event',               R.AddressOf(Evt_br))
-        chains['EmuE'][iCh].SetBranchAddress('L1UpgradeEmtfMuon',   R.AddressOf(EmuE_br))
-        chains['uGT'][iCh].SetBranchAddress('L1Upgrade',   	   R.AddressOf(uGT_br))
-#        chains['Emu'][iCh].SetBranchAddress('L1UpgradeBmtfOutput', R.AddressOf(Kmt_br))
-
+        ## (branch mode only, the other readers need no L1Analysis dictionaries)
+        if READER == 'branch':
+            Evt_br = R.L1Analysis.L1AnalysisEventDataFormat()
+            EmuE_br = R.L1Analysis.L1AnalysisL1UpgradeTfMuonDataFormat()
+            uGT_br = R.L1Analysis.L1AnalysisL1UpgradeDataFormat()
+#            Kmt_br = R.L1Analysis.L1AnalysisBMTFOutputDataFormat()
+
+            chains[iCh].SetBranchAddress('Event',               R.AddressOf(Evt_br))
+            chains[iCh].SetBranchAddress('L1UpgradeEmtfMuon',   R.AddressOf(EmuE_br))
+            chains[iCh].SetBranchAddress('L1Upgrade',           R.AddressOf(uGT_br))
+#            chains['Emu'][iCh].SetBranchAddress('L1UpgradeBmtfOutput', R.AddressOf(Kmt_br))
+
+        ## Columnar, uproot and skim mode: the views stand in for the DataFormat objects and are refilled chunk-wise
+        if READER == 'columnar' and COLUMN_STORE:
+            stores = L1ColumnStore.store_files(chains[iCh].file_names, COLUMN_STORE, ['Evt', 'EmuE', 'uGT'], CHUNK_SIZE)
+            reader = L1ColumnStore.StoreReader(stores, ['Evt', 'EmuE', 'uGT'], CHUNK_SIZE)
+        elif READER == 'columnar':
+            reader = L1ColumnReader.ColumnReader(chains[iCh], ['Evt', 'EmuE', 'uGT'], CHUNK_SIZE)
+        elif READER == 'uproot':
+            reader = L1UprootReader.UprootReader(chains[iCh].file_names, ['Evt', 'EmuE', 'uGT'], CHUNK_SIZE,
+                                                 entries=in_file_entries, active=chains[iCh].active)
+        elif READER == 'skim':
+            skims = L1Skim.skim_files(chains[iCh].file_names, SKIM_DIR, ['Evt', 'EmuE', 'uGT'], CHUNK_SIZE, SKIM_CODEC)
+            reader = L1Skim.SkimReader(skims, ['Evt', 'EmuE', 'uGT'], CHUNK_SIZE)
+        if READER != 'branch':
+            Evt_br  = reader.view('Evt')
+            EmuE_br = reader.view('EmuE')
+            uGT_br  = reader.view('uGT')
+
+        ## NumPy arrays of the vector members of the current event: zero-copy views over the std::vectors, or the chunk slices
+        if READER == 'branch':
+            EmuE_np, uGT_np = L1VectorViews.VectorViews(EmuE_br), L1VectorViews.VectorViews(uGT_br)
+            vector_views = [EmuE_np, uGT_np]
+        else:
+            EmuE_np, uGT_np = EmuE_br, uGT_br
 
         print '\nEntering loop over events for chain %d' % iCh
-        for jEvt in range(chains['uGT'][iCh].GetEntries()):
+        entries = chains[iCh].GetEntries() if READER == 'branch' else reader.GetEntries()
+        first_evt, last_evt = 0, entries
+        if opts.shard: first_evt, last_evt = L1Parallel.shard_range(min(entries, MAX_EVT), *opts.shard)
+        if resume and iCh == resume['iCh']: first_evt = resume['jEvt']
+        for jEvt in (range(first_evt, last_evt) if picked is None else picked):
 	    
-            if iEvt >= MAX_EVT: break
+            if iEvt >= MAX_EVT and not opts.incremental: break
+
+            if opts.checkpoint and jEvt > first_evt and iEvt % CHECKPOINT_EVT == 0:
+                L1Accumulators.write_checkpoint(opts.checkpoint, out_file, cnt, {'iCh' : iCh, 'jEvt' : jEvt, 'iEvt' : iEvt, 'run' : run})
 	    
             iEvt +=1
 
             if iEvt % PRT_EVT is 0: print '\nEvent # %d (%dth in chain)' % (iEvt, jEvt+1)
 
-            chains['Evt'][iCh].GetEntry(jEvt)
-            chains['EmuE'][iCh].GetEntry(jEvt)
-            chains['uGT'][iCh].GetEntry(jEvt)
+            if READER != 'branch':
+                reader.GetEntry(jEvt)
+            else:
+                chains[iCh].GetEntry(jEvt)
+                for views in vector_views: views.reset()
 
             # ## Use these lines if you don't explicitly define the DataFormat and then do SetBranchAddress above
             # Evt_br = chains['Evt'][iCh].Event
             # Unp_br = chains['Unp'][iCh].L1UpgradeBmtfMuon
             # Emu_br = chains['Emu'][iCh].L1UpgradeBmtfMuon
 
-            if iEvt % PRT_EVT is 0: print '  * Run %d, LS %d, event %d' % (int(Evt_br.run), int(Evt_br.lumi), int(Evt_br.event))
+            if iEvt % PRT_EVT is 0 or picked: print '  * Run %d, LS %d, event %d' % (int(Evt_br.run), int(Evt_br.lumi), int(Evt_br.event))
 
             nEMTFMu = int(EmuE_br.nTfMuons)
             nuGTMu = int(uGT_br.nMuons)
@@ -238,12 +385,7 @@ def main():
             ###  Emulated (EMTF) muons  ###
             #################################
 
-            for i in range(nEMTFMu):
-                BX      = int(EmuE_br.tfMuonBx[i])
-                
-                if (BX  !=  0): continue
-
-		EMTF_premus.append(i)
+            EMTF_premus.extend(numpy.flatnonzero(EmuE_np.array('tfMuonBx') == 0).tolist())
 
 #	    if len(EMTF_premus) :	    print "Before cleaning EMTF : ", EMTF_premus
 
@@ -286,13 +428,7 @@ def main():
             #################################
             ###  Emulated (Global) muons  ###
             #################################
-            for i in range(nuGTMu):
-                BX      = int(uGT_br.muonBx[i])
-#                if VERBOSE: print 'Emulated Global muon %d BX = %d, qual = %d, ptVtx = %.1f, ptDispl = %.1f, eta = %.2f' % (i, BX, qual, ptVtx, ptDispl, eta)
-                
-                if (BX  !=  0): continue
-
-		uGT_mus.append(i)
+            uGT_mus.extend(numpy.flatnonzero(uGT_np.array('muonBx') == 0).tolist())
 
 	    ## uGT EMTF matching
 	
@@ -303,17 +439,15 @@ def main():
 		eta1 = float(uGT_br.muonEtaAtVtx[i])
 		phi1 = float(uGT_br.muonPhiAtVtx[i])
 
-		v1 = R.TLorentzVector()
-		v1.SetPtEtaPhiM(pt1, eta1, phi1, 0.)
+		v1 = L1Kinematics.p4(pt1, eta1, phi1, 0.)
 
 		for j in EMTF_mus :
 			pt2  = float(EmuE_br.tfMuonHwPt[j]-1.)*0.5
 			eta2 = float(EmuE_br.tfMuonHwEta[j])*0.010875
 			phi2 = getPhi(float(EmuE_br.tfMuonGlobalPhi[j]))
-			v2 = R.TLorentzVector()
-			v2.SetPtEtaPhiM(pt2, eta2, phi2, 0.)
+			v2 = L1Kinematics.p4(pt2, eta2, phi2, 0.)
 
-			dR = v1.DeltaR(v2)
+			dR = L1Kinematics.delta_r(v1, v2)
 
 			if dR < 0.4 : EMTF_dR_list.append([dR, i, j])
 
@@ -346,8 +480,7 @@ def main():
 		ptDisp	= float(uGT_br.muonEtUnconstrained[i])
 		dxy 	= float(uGT_br.muonDxy[i])
 
-		vec1 = R.TLorentzVector()
-		vec1.SetPtEtaPhiM(ptVtx, eta, phi1, 1.05e-3)
+		vec1 = L1Kinematics.p4(ptVtx, eta, phi1, 1.05e-3)
 
 		if ptVtx>=7. and qual in MU_QLTY_SNGL	: _12_L1_SingleMu7_flag = True
 		if ptVtx>=22. and qual in MU_QLTY_SNGL	: _19_L1_SingleMu22_flag = True
@@ -369,8 +502,7 @@ def main():
 			eta2	 	= float(uGT_br.muonEtaAtVtx[j])
 			phi2 		= float(uGT_br.muonPhiAtVtx[j]) 
 
-			vec2 = R.TLorentzVector()
-			vec2.SetPtEtaPhiM(ptVtx2, eta2, phi2, 1.05e-3)
+			vec2 = L1Kinematics.p4(ptVtx2, eta2, phi2, 1.05e-3)
 
 			pt1 = max(ptVtx, ptVtx2)
 			pt2 = min(ptVtx, ptVtx2)
@@ -384,11 +516,11 @@ def main():
 			dxy1 = int(uGT_br.muonDxy[i])
 			dxy2 = int(uGT_br.muonDxy[j])
 
-			dR = vec1.DeltaR(vec2)
+			dR = L1Kinematics.delta_r(vec1, vec2)
 #			dPhi = abs(phi1-phi2)
 #			if dPhi >= 3.14 : dPhi = 2*3.14 - dPhi
 #			dR = sqrt((eta-eta2)**2 + dPhi**2)
-			M0 = (vec1+vec2).M()
+			M0 = L1Kinematics.mass(vec1, vec2)
 
 			if (qual in MU_QLTY_DBLE) and (qual2 in MU_QLTY_DBLE):
 				if pt1 >= 15. and pt2 >= 7.	: _48_L1_DoubleMu15_7_flag = True
@@ -469,49 +601,69 @@ def main():
 	    ########Finish loop over chains/Events
 			
 
-	    if (_12_L1_SingleMu7_flag)					: L1_SingleMu7 				+=1
-	    if (_19_L1_SingleMu22_flag)					: L1_SingleMu22 			+=1
-	    if (_20_L1_SingleMu22_BMTF_flag)				: L1_SingleMu22_BMTF 			+=1
-	    if (_21_L1_SingleMu22_OMTF_flag)				: L1_SingleMu22_OMTF 			+=1
-	    if (_22_L1_SingleMu22_EMTF_flag)				: L1_SingleMu22_EMTF 			+=1
-	    if (_23_L1_SingleMu25_flag)					: L1_SingleMu25 			+=1
-	    if (_33_L1_SingleMu18er1p5_flag)				: L1_SingleMu18er1p5 			+=1
-	    if (_41_L1_DoubleMu0_SQ_flag)				: L1_DoubleMu0_SQ 			+=1
-	    if (_42_L1_DoubleMu0_SQ_OS_flag)				: L1_DoubleMu0_SQ_OS 			+=1
-	    if (_47_L1_DoubleMu_15_5_SQ_flag)				: L1_DoubleMu_15_5_SQ 			+=1
-	    if (_48_L1_DoubleMu15_7_flag)				: L1_DoubleMu15_7 			+=1
-	    if (_49_L1_DoubleMu_15_7_SQ_flag)				: L1_DoubleMu_15_7_SQ			+=1
-	    if (_51_L1_DoubleMu18_er2p1_flag)				: L1_DoubleMu18_er2p1 			+=1
-	    if (_55_L1_DoubleMu0er1p5_SQ_flag)				: L1_DoubleMu0er1p5_SQ 			+=1
-	    if (_56_L1_DoubleMu0er1p5_SQ_OS_flag)			: L1_DoubleMu0er1p5_SQ_OS 		+=1
-	    if (_57_L1_DoubleMu0er1p5_SQ_dR_Max1p4_flag)		: L1_DoubleMu0er1p5_SQ_dR_Max1p4 	+=1
-	    if (_58_L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag)		: L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4 	+=1
-	    if (_60_L1_DoubleMu4_SQ_OS_flag)				: L1_DoubleMu4_SQ_OS 			+=1
-	    if (_63_L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag)		: L1_DoubleMu4p5_SQ_OS_dR_Max1p2 	+=1
-	    if (_64_L1_DoubleMu4p5er2p0_SQ_OS_flag)			: L1_DoubleMu4p5er2p0_SQ_OS 		+=1
-	    if (_65_L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7_flag)		: L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7 	+=1
-
-	    if (L1_DoubleMu15_7_BMTF_flag)				: L1_DoubleMu15_7_BMTF 			+=1
-	    if (L1_DoubleMu15_7_BMTF_UPT_flag)				: L1_DoubleMu15_7_BMTF_UPT 		+=1
-	    if (L1_DoubleMu15_7_UPT_flag)				: L1_DoubleMu15_7_UPT	 		+=1
-	    if (L1_DoubleMu15_7_UPT_DXY1_flag)				: L1_DoubleMu15_7_UPT_IP1		+=1
-	    if (L1_DoubleMu_15_7_UPT_SQ_flag)				: L1_DoubleMu_15_7_UPT_SQ		+=1
-	    if (L1_DoubleMu15_7_UPT_DXY1_flag)				: L1_DoubleMu15_7_UPT_DXY1		+=1 
-	    if (L1_DoubleMu0_IP1_flag)					: L1_DoubleMu0_IP1			+=1
+	    if (_12_L1_SingleMu7_flag)					: cnt.L1_SingleMu7 				+=1
+	    if (_19_L1_SingleMu22_flag)					: cnt.L1_SingleMu22 			+=1
+	    if (_20_L1_SingleMu22_BMTF_flag)				: cnt.L1_SingleMu22_BMTF 			+=1
+	    if (_21_L1_SingleMu22_OMTF_flag)				: cnt.L1_SingleMu22_OMTF 			+=1
+	    if (_22_L1_SingleMu22_EMTF_flag)				: cnt.L1_SingleMu22_EMTF 			+=1
+	    if (_23_L1_SingleMu25_flag)					: cnt.L1_SingleMu25 			+=1
+	    if (_33_L1_SingleMu18er1p5_flag)				: cnt.L1_SingleMu18er1p5 			+=1
+	    if (_41_L1_DoubleMu0_SQ_flag)				: cnt.L1_DoubleMu0_SQ 			+=1
+	    if (_42_L1_DoubleMu0_SQ_OS_flag)				: cnt.L1_DoubleMu0_SQ_OS 			+=1
+	    if (_47_L1_DoubleMu_15_5_SQ_flag)				: cnt.L1_DoubleMu_15_5_SQ 			+=1
+	    if (_48_L1_DoubleMu15_7_flag)				: cnt.L1_DoubleMu15_7 			+=1
+	    if (_49_L1_DoubleMu_15_7_SQ_flag)				: cnt.L1_DoubleMu_15_7_SQ			+=1
+	    if (_51_L1_DoubleMu18_er2p1_flag)				: cnt.L1_DoubleMu18_er2p1 			+=1
+	    if (_55_L1_DoubleMu0er1p5_SQ_flag)				: cnt.L1_DoubleMu0er1p5_SQ 			+=1
+	    if (_56_L1_DoubleMu0er1p5_SQ_OS_flag)			: cnt.L1_DoubleMu0er1p5_SQ_OS 		+=1
+	    if (_57_L1_DoubleMu0er1p5_SQ_dR_Max1p4_flag)		: cnt.L1_DoubleMu0er1p5_SQ_dR_Max1p4 	+=1
+	    if (_58_L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag)		: cnt.L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4 	+=1
+	    if (_60_L1_DoubleMu4_SQ_OS_flag)				: cnt.L1_DoubleMu4_SQ_OS 			+=1
+	    if (_63_L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag)		: cnt.L1_DoubleMu4p5_SQ_OS_dR_Max1p2 	+=1
+	    if (_64_L1_DoubleMu4p5er2p0_SQ_OS_flag)			: cnt.L1_DoubleMu4p5er2p0_SQ_OS 		+=1
+	    if (_65_L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7_flag)		: cnt.L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7 	+=1
+
+	    if (L1_DoubleMu15_7_BMTF_flag)				: cnt.L1_DoubleMu15_7_BMTF 			+=1
+	    if (L1_DoubleMu15_7_BMTF_UPT_flag)				: cnt.L1_DoubleMu15_7_BMTF_UPT 		+=1
+	    if (L1_DoubleMu15_7_UPT_flag)				: cnt.L1_DoubleMu15_7_UPT	 		+=1
+	    if (L1_DoubleMu15_7_UPT_DXY1_flag)				: cnt.L1_DoubleMu15_7_UPT_IP1		+=1
+	    if (L1_DoubleMu_15_7_UPT_SQ_flag)				: cnt.L1_DoubleMu_15_7_UPT_SQ		+=1
+	    if (L1_DoubleMu15_7_UPT_DXY1_flag)				: cnt.L1_DoubleMu15_7_UPT_DXY1		+=1 
+	    if (L1_DoubleMu0_IP1_flag)					: cnt.L1_DoubleMu0_IP1			+=1
 
 ##############################
 
-	    if (_48_L1_DoubleMu15_7_flag)												: Baseline_Run_2	+=1
-	    if (_48_L1_DoubleMu15_7_flag or _58_L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag or _63_L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag) 	: Extended_Run_2	+=1
-	    if (_48_L1_DoubleMu15_7_flag or _58_L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag) 						: Extended_Run_2A	+=1
-	    if (_48_L1_DoubleMu15_7_flag or _63_L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag) 							: Extended_Run_2B	+=1
-	    if (_48_L1_DoubleMu15_7_flag or L1_DoubleMu15_7_BMTF_UPT_flag )								: Baseline_Run_2_BMTF_UPT +=1
-	    if (_48_L1_DoubleMu15_7_flag or L1_DoubleMu15_7_UPT_flag)									: Baseline_Run_2_UPT 	+=1
-	    if (_48_L1_DoubleMu15_7_flag or L1_DoubleMu15_7_UPT_DXY1_flag)								: Baseline_Run_2_UPT_DXY1 +=1
+	    if (_48_L1_DoubleMu15_7_flag)												: cnt.Baseline_Run_2	+=1
+	    if (_48_L1_DoubleMu15_7_flag or _58_L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag or _63_L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag) 	: cnt.Extended_Run_2	+=1
+	    if (_48_L1_DoubleMu15_7_flag or _58_L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag) 						: cnt.Extended_Run_2A	+=1
+	    if (_48_L1_DoubleMu15_7_flag or _63_L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag) 							: cnt.Extended_Run_2B	+=1
+	    if (_48_L1_DoubleMu15_7_flag or L1_DoubleMu15_7_BMTF_UPT_flag )								: cnt.Baseline_Run_2_BMTF_UPT +=1
+	    if (_48_L1_DoubleMu15_7_flag or L1_DoubleMu15_7_UPT_flag)									: cnt.Baseline_Run_2_UPT 	+=1
+	    if (_48_L1_DoubleMu15_7_flag or L1_DoubleMu15_7_UPT_DXY1_flag)								: cnt.Baseline_Run_2_UPT_DXY1 +=1
 	    if (_48_L1_DoubleMu15_7_flag or _58_L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag or _63_L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag or L1_DoubleMu15_7_UPT_DXY1_flag): 
-		Extended_Run_2_UPT_DXY1 	+=1
+		cnt.Extended_Run_2_UPT_DXY1 	+=1
 	    if (_48_L1_DoubleMu15_7_flag or _58_L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag or _63_L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag or L1_DoubleMu15_7_UPT_flag): 
-		Extended_Run_2_UPT 		+=1
+		cnt.Extended_Run_2_UPT 		+=1
+
+	    ## Seed skim: the event and its BX = 0 muons, if any seed of SEED_SKIM fired
+	    if seed_skim:
+		seed_skim.fill({'Evt' : Evt_br, 'EmuE' : EmuE_np, 'uGT' : uGT_np},
+			{'L1_SingleMu7' : _12_L1_SingleMu7_flag, 'L1_SingleMu22' : _19_L1_SingleMu22_flag,
+			 'L1_SingleMu22_BMTF' : _20_L1_SingleMu22_BMTF_flag, 'L1_SingleMu22_OMTF' : _21_L1_SingleMu22_OMTF_flag,
+			 'L1_SingleMu22_EMTF' : _22_L1_SingleMu22_EMTF_flag, 'L1_SingleMu25' : _23_L1_SingleMu25_flag,
+			 'L1_SingleMu18er1p5' : _33_L1_SingleMu18er1p5_flag, 'L1_DoubleMu0_SQ' : _41_L1_DoubleMu0_SQ_flag,
+			 'L1_DoubleMu0_SQ_OS' : _42_L1_DoubleMu0_SQ_OS_flag, 'L1_DoubleMu_15_5_SQ' : _47_L1_DoubleMu_15_5_SQ_flag,
+			 'L1_DoubleMu15_7' : _48_L1_DoubleMu15_7_flag, 'L1_DoubleMu_15_7_SQ' : _49_L1_DoubleMu_15_7_SQ_flag,
+			 'L1_DoubleMu18_er2p1' : _51_L1_DoubleMu18_er2p1_flag, 'L1_DoubleMu0er1p5_SQ' : _55_L1_DoubleMu0er1p5_SQ_flag,
+			 'L1_DoubleMu0er1p5_SQ_OS' : _56_L1_DoubleMu0er1p5_SQ_OS_flag,
+			 'L1_DoubleMu0er1p5_SQ_dR_Max1p4' : _57_L1_DoubleMu0er1p5_SQ_dR_Max1p4_flag,
+			 'L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4' : _58_L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4_flag,
+			 'L1_DoubleMu4_SQ_OS' : _60_L1_DoubleMu4_SQ_OS_flag, 'L1_DoubleMu4p5_SQ_OS_dR_Max1p2' : _63_L1_DoubleMu4p5_SQ_OS_dR_Max1p2_flag,
+			 'L1_DoubleMu4p5er2p0_SQ_OS' : _64_L1_DoubleMu4p5er2p0_SQ_OS_flag,
+			 'L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7' : _65_L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7_flag,
+			 'L1_DoubleMu15_7_BMTF' : L1_DoubleMu15_7_BMTF_flag, 'L1_DoubleMu15_7_BMTF_UPT' : L1_DoubleMu15_7_BMTF_UPT_flag,
+			 'L1_DoubleMu15_7_UPT' : L1_DoubleMu15_7_UPT_flag, 'L1_DoubleMu15_7_UPT_DXY1' : L1_DoubleMu15_7_UPT_DXY1_flag,
+			 'L1_DoubleMu_15_7_UPT_SQ' : L1_DoubleMu_15_7_UPT_SQ_flag, 'L1_DoubleMu0_IP1' : L1_DoubleMu0_IP1_flag})
 
             ######################################
             ###  Extra info from Kalman muons  ###
@@ -536,6 +688,28 @@ def main():
     ## End loop: for iCh in range(len(chains['Unp'])):
 
     print '\nFinished loop over chains'
+    for iCh in range(len(chains)): chains[iCh].PrintCacheStats()
+    if chains and chains[0].stager: chains[0].stager.close()
+
+    if seed_skim:
+        passed = seed_skim.write(opts.seed_skim, in_file_names, SKIM_CODEC)['events_passed']
+        print '\nSeed skim %s: %d of %d events (%s)' % (opts.seed_skim, len(seed_skim.counts['Evt']), seed_skim.events_read,
+                                                     ', '.join('%s %d' % (s, passed[s]) for s in SEED_SKIM))
+
+    ## Incremental mode: save the raw histograms and counters with all files read so far, then finalise on the totals
+    if opts.incremental:
+        cnt.iEvt = iEvt
+        L1Accumulators.write_checkpoint(opts.incremental, out_file, cnt, {'files' : done + new})
+        cnt.pop('iEvt')
+        print '\nSaved state of %d files: %s' % (len(done + new), opts.incremental)
+
+    ## Worker mode: save the raw histograms and counters, the parent finalises
+    if opts.partial:
+        cnt.iEvt = iEvt
+        L1Accumulators.write_partial(out_file, cnt, opts.shard)
+        out_file.Close()
+        print '\nWrote partial result: '+opts.partial
+        return
 
     out_file.cd()
 
@@ -569,49 +743,8 @@ def main():
 #    L1_SingleMu22_BMTF = h_kBMTF_singlemu_rate_ptVtx.GetBinContent(23)
 #    L1_SingleMu22_BMTF_UPT = h_kBMTF_singlemu_rate_ptDisp.GetBinContent(23)
 
-    print '\nWrote out file: plots/'+out_file_str+'.root'
-    print "Events run over: ", iEvt
-
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(12, "L1_SingleMu7", L1_SingleMu7, L1_SingleMu7*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(19, "L1_SingleMu22", L1_SingleMu22, L1_SingleMu22*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(20, "L1_SingleMu22_BMTF", L1_SingleMu22_BMTF, L1_SingleMu22_BMTF*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(21, "L1_SingleMu22_OMTF", L1_SingleMu22_OMTF, L1_SingleMu22_OMTF*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(22, "L1_SingleMu22_EMTF", L1_SingleMu22_EMTF, L1_SingleMu22_EMTF*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(23, "L1_SingleMu25", L1_SingleMu25, L1_SingleMu25*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(33, "L1_SingleMu18er1p5", L1_SingleMu18er1p5, L1_SingleMu18er1p5*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(41, "L1_DoubleMu0_SQ", L1_DoubleMu0_SQ, L1_DoubleMu0_SQ*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(42, "L1_DoubleMu0_SQ_OS", L1_DoubleMu0_SQ_OS, L1_DoubleMu0_SQ_OS*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(47, "L1_DoubleMu_15_5_SQ", L1_DoubleMu_15_5_SQ, L1_DoubleMu_15_5_SQ*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(48, "L1_DoubleMu15_7", L1_DoubleMu15_7, L1_DoubleMu15_7*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(49, "L1_DoubleMu15_7_SQ", L1_DoubleMu_15_7_SQ, L1_DoubleMu_15_7_SQ*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(51, "L1_DoubleMu18_er2p1", L1_DoubleMu18_er2p1, L1_DoubleMu18_er2p1*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(55, "L1_DoubleMu0er1p5_SQ", L1_DoubleMu0er1p5_SQ, L1_DoubleMu0er1p5_SQ*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(56, "L1_DoubleMu0er1p5_SQ_OS", L1_DoubleMu0er1p5_SQ_OS, L1_DoubleMu0er1p5_SQ_OS*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(57, "L1_DoubleMu0er1p5_SQ_dR_Max1p4", L1_DoubleMu0er1p5_SQ_dR_Max1p4, L1_DoubleMu0er1p5_SQ_dR_Max1p4*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(58, "L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4", L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4, L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(60, "L1_DoubleMu4_SQ_OS", L1_DoubleMu4_SQ_OS, L1_DoubleMu4_SQ_OS*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(63, "L1_DoubleMu4p5_SQ_OS_dR_Max1p2", L1_DoubleMu4p5_SQ_OS_dR_Max1p2, L1_DoubleMu4p5_SQ_OS_dR_Max1p2*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(64, "L1_DoubleMu4p5er2p0_SQ_OS", L1_DoubleMu4p5er2p0_SQ_OS, L1_DoubleMu4p5er2p0_SQ_OS*scale[evtclassid]/iEvt)
-    print "%3d. %-50s : %-7d \t rate : %.3f"%(65, "L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7", L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7, L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7*scale[evtclassid]/iEvt)
-#    print "%3d. %-50s : %-7d \t rate : %.3f"%(, , , *scale[evtclassid]/iEvt)
-
-    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu15_7_BMTF ", L1_DoubleMu15_7_BMTF, L1_DoubleMu15_7_BMTF*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu15_7_BMTF_UPT ", L1_DoubleMu15_7_BMTF_UPT, L1_DoubleMu15_7_BMTF_UPT*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu15_7_UPT ", L1_DoubleMu15_7_UPT, L1_DoubleMu15_7_UPT*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu15_7_UPT_SQ ", L1_DoubleMu_15_7_UPT_SQ, L1_DoubleMu_15_7_UPT_SQ*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu15_7_UPT_IP1 ", L1_DoubleMu15_7_UPT_DXY1, L1_DoubleMu15_7_UPT_DXY1*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu0_IP1 ", L1_DoubleMu0_IP1, L1_DoubleMu0_IP1*scale[evtclassid]/iEvt)
-
-    print " ######################################### Efficiencies ############################################"
-    print "%-50s : %-7d \t rate : %.3f"%("Baseline Run 2 ", Baseline_Run_2, Baseline_Run_2*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("Extended Run 2 ", Extended_Run_2, Extended_Run_2*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("Extended Run 2A ", Extended_Run_2A, Extended_Run_2A*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("Extended Run 2B ", Extended_Run_2B, Extended_Run_2B*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("Baseline Run 2 + Unconstrained BMTF ", Baseline_Run_2_BMTF_UPT, Baseline_Run_2_BMTF_UPT*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("Baseline Run 2 + Unconstrained ", Baseline_Run_2_UPT, Baseline_Run_2_UPT*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("Baseline Run 2 + Unconstrained + DXY1 ", Baseline_Run_2_UPT_DXY1, Baseline_Run_2_UPT_DXY1*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("Extended Run 2 + Unconstrained + DXY1 ", Extended_Run_2_UPT_DXY1, Extended_Run_2_UPT_DXY1*scale[evtclassid]/iEvt)
-    print "%-50s : %-7d \t rate : %.3f"%("Extended Run 2 + Unconstrained ", Extended_Run_2_UPT, Extended_Run_2_UPT*scale[evtclassid]/iEvt)
+    print '\nWrote out file: plots/'+out_file_str+out_ext
+    print_summary(cnt, iEvt, scale[evtclassid])
 
 
 ############################### Single Muon #############################
@@ -658,6 +791,7 @@ def main():
 
     out_file.Close()
     del chains
+    if memo: L1Memo.record(out_path, memo, dict(cnt, iEvt=iEvt))
 
 #def BaselineRun(uGT_br, i, j):
 #	ptVtx1 	= float(uGT_br.muonEt[i])
@@ -666,5 +800,89 @@ def main():
 #	pt1 = max(ptVtx1, ptVtx2)
 #	pt2 = min(ptVtx1, ptVtx2)
 
+def print_summary(cnt, iEvt, rate_scale):
+    """Seed rates and efficiencies of a finished run (also of a reused output, from its memo)."""
+    print "Events run over: ", iEvt
+
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(12, "L1_SingleMu7", cnt.L1_SingleMu7, cnt.L1_SingleMu7*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(19, "L1_SingleMu22", cnt.L1_SingleMu22, cnt.L1_SingleMu22*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(20, "L1_SingleMu22_BMTF", cnt.L1_SingleMu22_BMTF, cnt.L1_SingleMu22_BMTF*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(21, "L1_SingleMu22_OMTF", cnt.L1_SingleMu22_OMTF, cnt.L1_SingleMu22_OMTF*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(22, "L1_SingleMu22_EMTF", cnt.L1_SingleMu22_EMTF, cnt.L1_SingleMu22_EMTF*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(23, "L1_SingleMu25", cnt.L1_SingleMu25, cnt.L1_SingleMu25*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(33, "L1_SingleMu18er1p5", cnt.L1_SingleMu18er1p5, cnt.L1_SingleMu18er1p5*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(41, "L1_DoubleMu0_SQ", cnt.L1_DoubleMu0_SQ, cnt.L1_DoubleMu0_SQ*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(42, "L1_DoubleMu0_SQ_OS", cnt.L1_DoubleMu0_SQ_OS, cnt.L1_DoubleMu0_SQ_OS*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(47, "L1_DoubleMu_15_5_SQ", cnt.L1_DoubleMu_15_5_SQ, cnt.L1_DoubleMu_15_5_SQ*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(48, "L1_DoubleMu15_7", cnt.L1_DoubleMu15_7, cnt.L1_DoubleMu15_7*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(49, "L1_DoubleMu15_7_SQ", cnt.L1_DoubleMu_15_7_SQ, cnt.L1_DoubleMu_15_7_SQ*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(51, "L1_DoubleMu18_er2p1", cnt.L1_DoubleMu18_er2p1, cnt.L1_DoubleMu18_er2p1*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(55, "L1_DoubleMu0er1p5_SQ", cnt.L1_DoubleMu0er1p5_SQ, cnt.L1_DoubleMu0er1p5_SQ*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(56, "L1_DoubleMu0er1p5_SQ_OS", cnt.L1_DoubleMu0er1p5_SQ_OS, cnt.L1_DoubleMu0er1p5_SQ_OS*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(57, "L1_DoubleMu0er1p5_SQ_dR_Max1p4", cnt.L1_DoubleMu0er1p5_SQ_dR_Max1p4, cnt.L1_DoubleMu0er1p5_SQ_dR_Max1p4*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(58, "L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4", cnt.L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4, cnt.L1_DoubleMu0er1p5_SQ_OS_dR_Max1p4*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(60, "L1_DoubleMu4_SQ_OS", cnt.L1_DoubleMu4_SQ_OS, cnt.L1_DoubleMu4_SQ_OS*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(63, "L1_DoubleMu4p5_SQ_OS_dR_Max1p2", cnt.L1_DoubleMu4p5_SQ_OS_dR_Max1p2, cnt.L1_DoubleMu4p5_SQ_OS_dR_Max1p2*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(64, "L1_DoubleMu4p5er2p0_SQ_OS", cnt.L1_DoubleMu4p5er2p0_SQ_OS, cnt.L1_DoubleMu4p5er2p0_SQ_OS*rate_scale/iEvt)
+    print "%3d. %-50s : %-7d \t rate : %.3f"%(65, "L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7", cnt.L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7, cnt.L1_DoubleMu4p5er2p0_SQ_OS_Mass_Min7*rate_scale/iEvt)
+#    print "%3d. %-50s : %-7d \t rate : %.3f"%(, , , *rate_scale/iEvt)
+
+    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu15_7_BMTF ", cnt.L1_DoubleMu15_7_BMTF, cnt.L1_DoubleMu15_7_BMTF*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu15_7_BMTF_UPT ", cnt.L1_DoubleMu15_7_BMTF_UPT, cnt.L1_DoubleMu15_7_BMTF_UPT*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu15_7_UPT ", cnt.L1_DoubleMu15_7_UPT, cnt.L1_DoubleMu15_7_UPT*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu15_7_UPT_SQ ", cnt.L1_DoubleMu_15_7_UPT_SQ, cnt.L1_DoubleMu_15_7_UPT_SQ*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu15_7_UPT_IP1 ", cnt.L1_DoubleMu15_7_UPT_DXY1, cnt.L1_DoubleMu15_7_UPT_DXY1*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("L1_DoubleMu0_IP1 ", cnt.L1_DoubleMu0_IP1, cnt.L1_DoubleMu0_IP1*rate_scale/iEvt)
+
+    print " ######################################### Efficiencies ############################################"
+    print "%-50s : %-7d \t rate : %.3f"%("Baseline Run 2 ", cnt.Baseline_Run_2, cnt.Baseline_Run_2*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("Extended Run 2 ", cnt.Extended_Run_2, cnt.Extended_Run_2*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("Extended Run 2A ", cnt.Extended_Run_2A, cnt.Extended_Run_2A*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("Extended Run 2B ", cnt.Extended_Run_2B, cnt.Extended_Run_2B*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("Baseline Run 2 + Unconstrained BMTF ", cnt.Baseline_Run_2_BMTF_UPT, cnt.Baseline_Run_2_BMTF_UPT*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("Baseline Run 2 + Unconstrained ", cnt.Baseline_Run_2_UPT, cnt.Baseline_Run_2_UPT*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("Baseline Run 2 + Unconstrained + DXY1 ", cnt.Baseline_Run_2_UPT_DXY1, cnt.Baseline_Run_2_UPT_DXY1*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("Extended Run 2 + Unconstrained + DXY1 ", cnt.Extended_Run_2_UPT_DXY1, cnt.Extended_Run_2_UPT_DXY1*rate_scale/iEvt)
+    print "%-50s : %-7d \t rate : %.3f"%("Extended Run 2 + Unconstrained ", cnt.Extended_Run_2_UPT, cnt.Extended_Run_2_UPT*rate_scale/iEvt)
+
+def parse_options(args=None):
+    parser = argparse.ArgumentParser(description='L1 seed rates on NuGun')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, each running over a group of input files')
+    parser.add_argument('--files-from', help='Text file listing the input files, one per line')
+    parser.add_argument('--max-evt', type=int, help='Number of events to process (overrides MAX_EVT)')
+    parser.add_argument('--partial', help='Write unfinalised histograms and counters to this file and stop (worker mode)')
+    parser.add_argument('--rescan', action='store_true', help='Rescan the input directories instead of loading their manifests')
+    parser.add_argument('--shard', type=L1Parallel.parse_shard, metavar='k/N',
+                        help='Run over shard k (from 0) of N equal ranges of the first MAX_EVT entries and write a partial result')
+    parser.add_argument('--checkpoint', metavar='FILE', help='Save histograms, counters and loop position to FILE every CHECKPOINT_EVT events')
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint in --checkpoint FILE, if there is one')
+    parser.add_argument('--imt', type=int, default=0, metavar='N',
+                        help='Decompress branches with ROOT implicit MT on N threads, 0 for off (see L1ReadBenchmark.py)')
+    parser.add_argument('--incremental', metavar='STATE',
+                        help='Read only input files not yet in the STATE file, in full (MAX_EVT ignored), add them to it and finalise on the totals')
+    parser.add_argument('--merge', nargs='+', metavar='PARTIAL', help='Add up partial results (e.g. of all shards) and finalise, without reading events')
+    parser.add_argument('--events', nargs='+', type=L1EventIndex.parse_event_id, metavar='RUN:LUMI:EVENT',
+                        help='Run over these events only, found through an index of the inputs, and write <output>_events')
+    parser.add_argument('--seed-skim', metavar='DIR',
+                        help='Also write the events firing any seed of SEED_SKIM, with their BX = 0 L1 muons, as a skim in DIR')
+    parser.add_argument('--force', action='store_true', help='Rerun even if the output of the same inputs, configuration and code exists; with --merge, merge an incomplete shard set')
+    parser.add_argument('--npz', action='store_true',
+                        help='Write the histograms as NumPy .npz instead of ROOT; with READER = \'skim\' or \'uproot\' ROOT is then never imported '
+                             '(this script only, the signal script DisplacedMuonsOriginal_23_08_21.py always needs ROOT)')
+    opts = parser.parse_args(args)
+    if opts.resume and not opts.checkpoint: parser.error('--resume needs --checkpoint FILE')
+    if opts.incremental and (opts.workers > 1 or opts.partial or opts.shard or opts.checkpoint or opts.merge):
+        parser.error('--incremental runs serially over whole files')
+    if opts.events and (opts.workers > 1 or opts.partial or opts.shard or opts.checkpoint or opts.merge or opts.incremental):
+        parser.error('--events runs serially over the events given')
+    if opts.seed_skim and (opts.workers > 1 or opts.partial or opts.shard or opts.checkpoint or opts.merge or opts.incremental):
+        parser.error('--seed-skim is for serial runs, from start to end')
+    if opts.incremental: opts.rescan = True	## new files only show up in a fresh manifest
+    if opts.npz and (opts.workers > 1 or opts.partial or opts.shard or opts.checkpoint or opts.merge or opts.incremental):
+        parser.error('--npz is for single runs, partial results, checkpoints and states are ROOT files')
+    return opts
+
 if __name__ == '__main__':
-    main()
+    opts = parse_options()
+    if opts.max_evt is not None: MAX_EVT = opts.max_evt
+    main(opts)